@@ -6,12 +6,20 @@ CREATE TABLE IF NOT EXISTS network_staging_errors (
     INETWORKID text,
     error_type text,
     error_message text,
-    created_at timestamp default now()
+    created_at timestamp default now(),
+    staging_table text  -- per-import staging table the error belongs to
 );
+-- Existing databases: add the column used to scope errors per import.
+ALTER TABLE network_staging_errors ADD COLUMN IF NOT EXISTS staging_table text;
+CREATE INDEX IF NOT EXISTS idx_network_staging_errors_table ON network_staging_errors (staging_table);
 -------------------------------------------------------------
 
 ---------------- Validation Procedure (Production Version)-----------------
-CREATE OR REPLACE FUNCTION validate_network_staging()
+-- Each import loads into its own staging table (network_staging_<job id>), so the
+-- table name is a parameter and errors are written/cleared per staging table only.
+-- Drop the old zero-argument version so validate_network_staging() is not ambiguous.
+DROP FUNCTION IF EXISTS validate_network_staging();
+CREATE OR REPLACE FUNCTION validate_network_staging(p_staging_table text DEFAULT 'network_staging')
 RETURNS json
 LANGUAGE plpgsql
 AS $$
@@ -19,75 +27,92 @@ DECLARE
     error_count int;
 BEGIN
 
-    -- Clean previous errors
-    DELETE FROM network_staging_errors;
+    -- Clean previous errors of this staging table
+    DELETE FROM network_staging_errors WHERE staging_table = p_staging_table;
 
     ----------------------------------------------------------------
     -- 1. Geometry NULL
     ----------------------------------------------------------------
-    INSERT INTO network_staging_errors (INETWORKID, error_type, error_message)
-    SELECT INETWORKID, 'GEOMETRY_NULL', 'Geometry is NULL'
-    FROM network_staging
-    WHERE shape IS NULL;
+    EXECUTE format($q$
+        INSERT INTO network_staging_errors (INETWORKID, error_type, error_message, staging_table)
+        SELECT INETWORKID, 'GEOMETRY_NULL', 'Geometry is NULL', %L
+        FROM %I
+        WHERE shape IS NULL
+    $q$, p_staging_table, p_staging_table);
 
     ----------------------------------------------------------------
     -- 2. Invalid geometry
     ----------------------------------------------------------------
-    INSERT INTO network_staging_errors (INETWORKID, error_type, error_message)
-    SELECT INETWORKID, 'INVALID_GEOMETRY', ST_IsValidReason(shape)
-    FROM network_staging
-    WHERE NOT ST_IsValid(shape);
+    EXECUTE format($q$
+        INSERT INTO network_staging_errors (INETWORKID, error_type, error_message, staging_table)
+        SELECT INETWORKID, 'INVALID_GEOMETRY', ST_IsValidReason(shape), %L
+        FROM %I
+        WHERE NOT ST_IsValid(shape)
+    $q$, p_staging_table, p_staging_table);
 
     ----------------------------------------------------------------
     -- 3. Wrong SRID
     ----------------------------------------------------------------
-    INSERT INTO network_staging_errors (INETWORKID, error_type, error_message)
-    SELECT INETWORKID, 'WRONG_SRID', 'SRID must be 2326'
-    FROM network_staging
-    WHERE ST_SRID(shape) != 2326;
+    EXECUTE format($q$
+        INSERT INTO network_staging_errors (INETWORKID, error_type, error_message, staging_table)
+        SELECT INETWORKID, 'WRONG_SRID', 'SRID must be 2326', %L
+        FROM %I
+        WHERE ST_SRID(shape) != 2326
+    $q$, p_staging_table, p_staging_table);
 
     ----------------------------------------------------------------
     -- 4. Not 3D
     ----------------------------------------------------------------
-    INSERT INTO network_staging_errors (INETWORKID, error_type, error_message)
-    SELECT INETWORKID, 'NOT_3D', 'Geometry must be 3D'
-    FROM network_staging
-    WHERE ST_NDims(shape) != 3;
+    EXECUTE format($q$
+        INSERT INTO network_staging_errors (INETWORKID, error_type, error_message, staging_table)
+        SELECT INETWORKID, 'NOT_3D', 'Geometry must be 3D', %L
+        FROM %I
+        WHERE ST_NDims(shape) != 3
+    $q$, p_staging_table, p_staging_table);
 
     ----------------------------------------------------------------
     -- 5. Wrong type
     ----------------------------------------------------------------
-    INSERT INTO network_staging_errors (INETWORKID, error_type, error_message)
-    SELECT INETWORKID,
-    'WRONG_DIMENSION',
-    'Geometry must be 3D (XYZ)'
-    FROM network_staging
-    WHERE ST_NDims(shape) != 3;
+    EXECUTE format($q$
+        INSERT INTO network_staging_errors (INETWORKID, error_type, error_message, staging_table)
+        SELECT INETWORKID,
+        'WRONG_DIMENSION',
+        'Geometry must be 3D (XYZ)',
+        %L
+        FROM %I
+        WHERE ST_NDims(shape) != 3
+    $q$, p_staging_table, p_staging_table);
 
     ----------------------------------------------------------------
     -- 6. pedrouteid NULL
     ----------------------------------------------------------------
-    INSERT INTO network_staging_errors (INETWORKID, error_type, error_message)
-    SELECT NULL, 'INETWORKID_NULL', 'INETWORKID is NULL'
-    FROM network_staging
-    WHERE INETWORKID IS NULL;
+    EXECUTE format($q$
+        INSERT INTO network_staging_errors (INETWORKID, error_type, error_message, staging_table)
+        SELECT NULL, 'INETWORKID_NULL', 'INETWORKID is NULL', %L
+        FROM %I
+        WHERE INETWORKID IS NULL
+    $q$, p_staging_table, p_staging_table);
 
     ----------------------------------------------------------------
     -- 7. Duplicate pedrouteid
     ----------------------------------------------------------------
-    INSERT INTO network_staging_errors (INETWORKID, error_type, error_message)
-    SELECT INETWORKID, 'DUPLICATE_INETWORKID', 'Duplicate in staging'
-    FROM (
-        SELECT INETWORKID
-        FROM network_staging
-        GROUP BY INETWORKID
-        HAVING COUNT(*) > 1
-    ) t;
+    EXECUTE format($q$
+        INSERT INTO network_staging_errors (INETWORKID, error_type, error_message, staging_table)
+        SELECT INETWORKID, 'DUPLICATE_INETWORKID', 'Duplicate in staging', %L
+        FROM (
+            SELECT INETWORKID
+            FROM %I
+            GROUP BY INETWORKID
+            HAVING COUNT(*) > 1
+        ) t
+    $q$, p_staging_table, p_staging_table);
 
     ----------------------------------------------------------------
     -- Count errors
     ----------------------------------------------------------------
-    SELECT COUNT(*) INTO error_count FROM network_staging_errors;
+    SELECT COUNT(*) INTO error_count
+    FROM network_staging_errors
+    WHERE staging_table = p_staging_table;
 
     RETURN json_build_object(
         'valid', error_count = 0,
@@ -275,6 +300,11 @@ CREATE TABLE IF NOT EXISTS indoor_network_history (
 
 CREATE INDEX IF NOT EXISTS idx_history_inetworkid ON indoor_network_history(inetworkid);
 CREATE INDEX IF NOT EXISTS idx_indoor_network_shape_3d ON indoor_network USING GIST (shape gist_geometry_ops_nd); -- 3D Index
+-- Per-venue data version of the export cache (indoor_network_version in api/app/services/network_services.py)
+CREATE INDEX IF NOT EXISTS idx_indoor_network_displayname ON indoor_network(displayname);
+CREATE INDEX IF NOT EXISTS idx_history_displayname ON indoor_network_history(displayname, history_id);
+-- Per-level vector tiles (api/app/services/tile_service.py)
+CREATE INDEX IF NOT EXISTS idx_indoor_network_level_id ON indoor_network(level_id);
 -- history table----------------------------------------------------------
 
 
@@ -365,3 +395,20 @@ FOR EACH ROW EXECUTE FUNCTION set_updated_at();
 ----------------------------------------------------------------------------------
 
 
+-- 6. Incremental import state----------------------------------------------------
+-- Per inetworkid: hash of the staging geometry + source attributes and the IMDF venue
+-- fingerprint it was enriched against (api/app/services/incremental_import.py).
+-- Re-imports skip rows whose hash and fingerprint are unchanged.
+-- Kept out of indoor_network so hash-only changes never write history rows.
+CREATE TABLE IF NOT EXISTS indoor_network_source (
+    inetworkid TEXT PRIMARY KEY REFERENCES indoor_network(inetworkid) ON DELETE CASCADE,
+    venue_id TEXT,
+    content_hash TEXT NOT NULL,
+    imdf_fingerprint TEXT NOT NULL,
+    imported_at TIMESTAMP DEFAULT (NOW() AT TIME ZONE 'Asia/Hong_Kong')
+);
+
+CREATE INDEX IF NOT EXISTS idx_indoor_network_source_venue_id ON indoor_network_source(venue_id);
+----------------------------------------------------------------------------------
+
+
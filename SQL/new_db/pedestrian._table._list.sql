@@ -4,6 +4,8 @@
 -- and types from indoor_network
 -------------------------------------------------------------------------------
 
+-- Column layout of the staging tables. Each FGDB import loads into its own
+-- pedestrian_staging_<uuid> table (created by ogr2ogr, dropped after the merge).
 CREATE TABLE IF NOT EXISTS pedestrian_staging (
     staging_fid SERIAL PRIMARY KEY,
     shape GEOMETRY(LineStringZ, 2326),
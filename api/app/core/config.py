@@ -21,6 +21,51 @@ MONGODB_URL = os.getenv(
     "mongodb://10.77.159.237:27017/?replicaSet=rs0"  # "mongodb://3dm-db4:27017/?replicaSet=rs0" # It is a special DNS name automatically provided by Docker Desktop (Mac & Windows).
 )
 
+# In-process cache of IMDF venue documents (app/services/mongo_service.py).
+# Entries are only served while the MongoDB change stream is live (requires a replica set).
+IMDF_CACHE_MAX_ENTRIES = int(os.getenv("IMDF_CACHE_MAX_ENTRIES", "32"))
+IMDF_CACHE_TTL_SECONDS = float(os.getenv("IMDF_CACHE_TTL_SECONDS", "600"))
+
+# Maximum number of venues imported at the same time (default for JOB_CONCURRENCY below).
+# Each import uses its own staging table, so imports are independent.
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "4"))
+
+# Background jobs (app/services/job_service.py): imports, FGDB loads and exports submitted
+# through the API run at most JOB_CONCURRENCY at a time; the last JOB_HISTORY_MAX finished
+# jobs stay queryable via GET /jobs/{job_id}.
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", str(IMPORT_CONCURRENCY)))
+JOB_HISTORY_MAX = int(os.getenv("JOB_HISTORY_MAX", "200"))
+
+# Network enrichment (app/services/enrichment_service.py): imports with at least
+# ENRICH_PARALLEL_MIN_ROWS rows to calculate are enriched in one pool of ENRICH_WORKERS processes,
+# shared by all imports.
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", str(os.cpu_count() or 1)))
+ENRICH_PARALLEL_MIN_ROWS = int(os.getenv("ENRICH_PARALLEL_MIN_ROWS", "5000"))
+
+# Export cache (app/services/export_cache.py): generated exports and download ZIPs are kept
+# under EXPORT_RESULT_DIR/.cache, keyed by venue data version; least recently used entries
+# are evicted beyond EXPORT_CACHE_MAX_BYTES (0 disables the cache).
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(2 * 1024**3)))
+
+# Bulk export (export_indoor_network_bulk): shapefiles of up to EXPORT_WORKERS venues are
+# written at the same time (one ogr2ogr process each).
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "4"))
+
+# Routing (app/services/routing_service.py): in-memory graphs of at most ROUTING_GRAPH_CACHE_MAX
+# venues are kept; a venue's graph is rebuilt when its indoor_network data changes. The data
+# version is checked at most every ROUTING_VERSION_TTL_SECONDS per venue (0: on every request),
+# so edits can take that long to reach routing.
+ROUTING_GRAPH_CACHE_MAX = int(os.getenv("ROUTING_GRAPH_CACHE_MAX", "64"))
+ROUTING_VERSION_TTL_SECONDS = float(os.getenv("ROUTING_VERSION_TTL_SECONDS", "5"))
+
+# Vector tiles (app/services/tile_service.py): encoded tiles are cached under
+# EXPORT_RESULT_DIR/.tiles up to TILE_CACHE_MAX_BYTES; zoom levels below TILE_MIN_ZOOM get empty tiles.
+# Cached tiles are keyed by their layer's table version, checked at most every
+# TILE_VERSION_TTL_SECONDS (0: on every request), so edits can take that long to show in tiles.
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", str(1024**3)))
+TILE_MIN_ZOOM = int(os.getenv("TILE_MIN_ZOOM", "14"))
+TILE_VERSION_TTL_SECONDS = float(os.getenv("TILE_VERSION_TTL_SECONDS", "5"))
+
 # MongoDB connesztion string in local mac machine
 # MONGODB_URL = os.getenv(
 #     "MONGODB_URL",
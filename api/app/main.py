@@ -1,13 +1,35 @@
+import asyncio
+import contextlib
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routes import system
 from app.routes import import_routes
 from app.routes import imdf_routes
 from app.routes import network_routes
+from app.routes import job_routes
+from app.routes import routing_routes
+from app.routes import tile_routes
 from app.core.middleware import RequestContextMiddleware
 from app.core.error_handlers import global_exception_handler
+from app.services.mongo_service import watch_imdf_changes
+from app.services.job_service import cancel_all_jobs
+from app.services.enrichment_service import shutdown_enrichment_pool
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep the in-process IMDF document cache coherent with MongoDB (change stream on rs0).
+    watcher = asyncio.create_task(watch_imdf_changes())
+    yield
+    await cancel_all_jobs()
+    shutdown_enrichment_pool()
+    watcher.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await watcher
+
+
+app = FastAPI(lifespan=lifespan)
 
 # 1. Register Context Middleware (Adds Request ID)
 app.add_middleware(RequestContextMiddleware)
@@ -32,5 +54,8 @@ app.include_router(system.router)
 app.include_router(import_routes.router)
 app.include_router(imdf_routes.router)
 app.include_router(network_routes.router)
+app.include_router(job_routes.router)
+app.include_router(routing_routes.router)
+app.include_router(tile_routes.router)
 from app.routes import pedestrian
 app.include_router(pedestrian.router)
\ No newline at end of file
@@ -3,6 +3,8 @@ from typing import List
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile
 from pydantic import BaseModel, Field
 from app.core.logger import logger  # Added Logger
+from app.services.job_service import submit_job
+from app.routes.job_routes import job_accepted
 
 from app.services.network_services import (
     process_network_import,
@@ -28,26 +30,27 @@ async def trigger_import_venues():
     """
     return await import_all_venues_to_postgis()
 
-@router.post("/import-network-upload/")
+@router.post("/import-network-upload/", status_code=202)
 async def import_network_upload(
     files: List[UploadFile] = File(..., description="List of ZIP files. Each ZIP must contain '3D Indoor Network.shp' (or case-insensitive equivalent). Display name is derived from zip filename."),
 ):
     """
-    Import network from multiple uploaded ZIP files.
+    Import network from multiple uploaded ZIP files, as background jobs.
     - **files**: List of ZIP archives.
     - **DisplayName**: Derived from the filename (e.g., 'HK_1_City Hall.zip' -> 'HK_1_City Hall').
-    - **Processing**: Sequential to ensure database staging table integrity.
+    - **Processing**: One job per file, returned immediately (in upload order); poll GET /jobs/{job_id}
+      for each result. Up to JOB_CONCURRENCY jobs run at a time; each import uses its own staging table.
+      Files that are not .zip are skipped, with a {"status": "error"} entry in their place.
     """
-    results = []
-    
+    jobs = []
     for file in files:
-        # 1. Basic validation
+        # 1. Basic validation: invalid files get an error entry, the others are still queued
         if not file.filename or not file.filename.lower().endswith(".zip"):
             msg = f"Invalid file skipped: {file.filename} (Must be .zip)"
             logger.warning(msg)
-            results.append({
+            jobs.append({
                 "filename": file.filename,
-                "status": "error", 
+                "status": "error",
                 "message": msg
             })
             continue
@@ -55,59 +58,46 @@ async def import_network_upload(
         # 2. Derive Display Name
         displayname = os.path.splitext(os.path.basename(file.filename))[0]
 
-        try:
-            # 3. Read and Process
-            content = await file.read()
-            logger.info(f"Received Upload: {file.filename} ({len(content)} bytes)")
+        # 3. Read now: the upload is closed once the response is sent
+        content = await file.read()
+        logger.info(f"Received Upload: {file.filename} ({len(content)} bytes)")
 
-            result = await process_network_import_from_zip(displayname, content)
-            
-            # 4. Format Result
-            results.append({
-                "filename": file.filename,
-                "displayname": displayname,
-                **result
-            })
-            
-        except Exception as e:
-            msg = f"Unexpected failure importing {file.filename}: {str(e)}"
-            logger.error(msg)
-            results.append({
-                "filename": file.filename,
-                "displayname": displayname,
-                "status": "error",
-                "message": msg
-            })
-    
-    # Check if any error occurred in the batch
-    if any(r.get("status") == "error" for r in results):
-        # Construct a summary error message
-        errors = [r.get("message") for r in results if r.get("status") == "error"]
-        raise HTTPException(status_code=500, detail=f"Import failed for {len(errors)} file(s): {'; '.join(errors)}")
+        job = submit_job(
+            "network_import",
+            process_network_import_from_zip,
+            displayname,
+            content,
+            params={"filename": file.filename, "displayname": displayname},
+        )
+        jobs.append(job_accepted(job))
 
-    return results
+    return jobs
 
 
-@router.post("/import-network-from-path/")
+@router.post("/import-network-from-path/", status_code=202)
 async def import_network_from_path(body: ImportFromPathRequest):
     """
-    Import network from a folder path. The folder must contain '3D Indoor Network.shp'.
+    Import network from a folder path, as a background job. The folder must contain '3D Indoor Network.shp'.
     On Docker, the host folder (e.g. Windows PC) should be mounted under the container's import base
     (default /data). Pass the path relative to that base, e.g. wing/HK_1_Hong Kong City Hall/SHP.
-    Performs the same validation and processing as POST /import-network/.
+    Performs the same validation and processing as POST /import-network/; poll GET /jobs/{job_id} for the result.
     """
-    result = await process_network_import_from_folder_path(body.displayname, body.folder_path)
-    if result.get("status") == "error":
-        raise HTTPException(status_code=400, detail=result)
-    return result
+    job = submit_job(
+        "network_import",
+        process_network_import_from_folder_path,
+        body.displayname,
+        body.folder_path,
+        params={"displayname": body.displayname, "folder_path": body.folder_path},
+    )
+    return job_accepted(job)
 
 
-@router.post("/import-network/")
+@router.post("/import-network/", status_code=202)
 async def import_network():
     displayName = "KLN_256_Ho Man Tin Sports Centre"
     file = "/data/wing/KLN_256_Ho Man Tin Sports Centre/SHP/"
-    result = await process_network_import( displayName,file)
-    return result
+    job = submit_job("network_import", process_network_import, displayName, file, params={"displayname": displayName})
+    return job_accepted(job)
 
 # @router.post("/import-network/")
 # # async def import_network(file: UploadFile = File(...)):
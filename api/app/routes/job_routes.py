@@ -0,0 +1,31 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException
+from app.services.job_service import get_job, list_jobs
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+def job_accepted(job: dict) -> dict:
+    """Response body for a route that submitted a background job (HTTP 202)."""
+    return {**job, "status_url": f"/jobs/{job['job_id']}"}
+
+
+@router.get("")
+async def read_jobs(status: Optional[str] = None):
+    """
+    List background jobs (most recent first), without their results.
+    - **status**: optional filter: "queued", "running", "success" or "error".
+    """
+    return list_jobs(status)
+
+
+@router.get("/{job_id}")
+async def read_job(job_id: str):
+    """
+    Status of one background job; **result** holds the service response once it has finished
+    (per-row "rows" summarised as "row_count", long lists cut to their first 100 items).
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
@@ -1,54 +1,197 @@
-from typing import Optional
+from typing import List, Literal, Optional, Union
+import asyncio
 import os
 import shutil
 import tempfile
-import zipfile
-import io
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
-from app.services.network_services import export_indoor_network_by_displayname
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy.exc import SQLAlchemyError
+from app.services.network_services import (
+    export_cache,
+    export_indoor_network_bulk,
+    export_indoor_network_by_displayname,
+    indoor_network_version,
+)
+from app.services.export_cache import export_cache_key
+from app.services.network_query import NETWORK_QUERY_DEFAULT_LIMIT, NETWORK_QUERY_MAX_LIMIT, query_network
+from app.services.job_service import submit_job
+from app.services.zip_stream import ZipStream
+from app.routes.job_routes import job_accepted
 from app.core.logger import logger
 
 router = APIRouter()
 
 
-@router.get("/export-indoor-network/")
-def export_indoor_network(
+@router.get("/export-indoor-network/", status_code=202)
+async def export_indoor_network(
     displayname: str = "KLN_256_Ho Man Tin Sports Centre",
     output_dir: Optional[str] = None,
     export_type: Optional[str] = "pedestrian", # "indoor", "pedestrian"
     export_format: str = "geojson", # "shapefile" or "geojson"
 ):
     """
-    Export indoor_network rows for the given displayname to a shapefile or GeoJSON.
+    Export indoor_network rows for the given displayname to a shapefile or GeoJSON, as a background job.
+    Returns immediately; poll GET /jobs/{job_id} for the result (output path).
     - **export_type**: "indoor" or "pedestrian". If None (default), full data is exported.
     - **export_format**: "shapefile" (default) or "geojson".
     - **output_dir**: Optional override for export path.
     """
     logger.info(f"EXPORT REQUEST: '{displayname}' Type={export_type} Format={export_format}")
-    result = export_indoor_network_by_displayname(displayname, output_dir, export_type, export_format)
-    
-    if result.get("status") == "error":
-        logger.error(f"EXPORT FAILED: {result.get('message')}")
-        raise HTTPException(status_code=500, detail=result.get("message"))
+    job = submit_job(
+        "export",
+        export_indoor_network_by_displayname,
+        displayname,
+        output_dir,
+        export_type,
+        export_format,
+        params={"displayname": displayname, "export_type": export_type, "export_format": export_format},
+    )
+    return job_accepted(job)
+
+class BulkExportRequest(BaseModel):
+    """Request body for export-indoor-network-bulk."""
+    displaynames: Union[List[str], str] = Field("all", description='Venue display names, or "all" for every venue with network data.')
+    region: Optional[str] = Field(None, description='Only venues of this region (venue table), e.g. "KLNE".')
+    export_type: Optional[str] = Field("all", description='"indoor", "pedestrian" or "all".')
+    export_formats: List[str] = Field(["shapefile", "geojson"], description='Any of "shapefile", "geojson".')
+    opendata: str = Field("full", description='"open" (restricted=\'N\' only) or "full".')
+    output_dir: Optional[str] = Field(None, description="Optional override for the export folder (default: data/result/bulk_<timestamp>).")
+
+
+@router.post("/export-indoor-network-bulk/", status_code=202)
+async def export_indoor_network_bulk_route(body: BulkExportRequest):
+    """
+    Export many venues as one background job, into <output_dir>/<displayname>/SHP and /GeoJSON.
+    Poll GET /jobs/{job_id}: **progress** counts finished exports (done / total / failed / cached),
+    **result** lists failures and requested venues without network data.
+    """
+    if isinstance(body.displaynames, str):
+        if body.displaynames != "all":
+            raise HTTPException(status_code=400, detail='displaynames must be a list of names or "all"')
+        displaynames = None
     else:
-        logger.info(f"EXPORT SUCCESS: {result.get('path')}")
-        
-    return result
+        displaynames = body.displaynames
+    unknown_formats = set(body.export_formats) - {"shapefile", "geojson"}
+    if unknown_formats or not body.export_formats:
+        raise HTTPException(status_code=400, detail=f"Unsupported export_formats: {sorted(unknown_formats) or body.export_formats}")
+
+    logger.info(f"BULK EXPORT REQUEST: venues={body.displaynames if displaynames is None else len(displaynames)} region={body.region}")
+    job = submit_job(
+        "bulk_export",
+        export_indoor_network_bulk,
+        displaynames,
+        body.region,
+        body.output_dir,
+        body.export_type,
+        tuple(dict.fromkeys(body.export_formats)),
+        body.opendata,
+        params={"displaynames": body.displaynames, "region": body.region, "export_formats": body.export_formats},
+    )
+    return job_accepted(job)
+
+
+# File name of a download ZIP inside its export cache entry.
+_ZIP_CACHE_NAME = "download.zip"
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match check (weak comparison, "*" matches any version)."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+async def _stream_export_zip(
+    exports: dict[asyncio.Task, tuple[str, str]],
+    temp_dir: str,
+    cache_key: str | None = None,
+):
+    """
+    Stream a ZIP of the export folders as each export finishes: exports maps an export task
+    to (output directory, archive folder name). Deletes temp_dir and cancels unfinished
+    exports when done or when the client goes away. With a cache_key, the archive is also
+    written to the export cache and stored there once complete.
+    """
+    zip_stream = ZipStream()
+    cache_file = None
+    if cache_key is not None and export_cache.enabled:
+        cache_file = open(await asyncio.to_thread(export_cache.new_part_path, ".zip"), "wb")
+
+    def produce(func, *args):
+        # Runs in a worker thread: next archive bytes, copied to the cache file.
+        data = func(*args)
+        if data is not None and cache_file is not None:
+            cache_file.write(data)
+        return data
+
+    try:
+        pending = set(exports)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if result.get("status") == "error":
+                    # Headers are already sent: abort the stream (client gets a truncated archive).
+                    raise RuntimeError(f"Export failed while streaming: {result.get('message')}")
+                dir_path, dir_name = exports[task]
+                # Compression runs in a worker thread, one chunk at a time.
+                chunks = zip_stream.add_dir(dir_path, dir_name)
+                while (chunk := await asyncio.to_thread(produce, next, chunks, None)) is not None:
+                    yield chunk
+        last = await asyncio.to_thread(produce, zip_stream.finish)
+        if cache_file is not None:
+            cache_file.close()
+            await asyncio.to_thread(export_cache.store_file, cache_key, cache_file.name, _ZIP_CACHE_NAME)
+            cache_file = None
+        yield last
+    finally:
+        for task in exports:
+            task.cancel()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        if cache_file is not None:
+            # Incomplete archive: never stored.
+            cache_file.close()
+            os.remove(cache_file.name)
+
 
 @router.get("/download-indoor-network-zip/")
-def download_indoor_network_zip(
+async def download_indoor_network_zip(
     displayname: str,
     type: str = "all",      # "pedestrian", "indoor", "all"
-    opendata: str = "full"  # "open", "full"
+    opendata: str = "full",  # "open", "full"
+    if_none_match: Optional[str] = Header(None),
 ):
     """
     Download a zipped file containing a ShapeFile and a GeoJSON folder for the given displayname.
     - **type**: "pedestrian", "indoor", or "all".
     - **opendata**: "open" (restricted='N' only) or "full".
+
+    The response carries an ETag derived from the venue's data version: a matching
+    If-None-Match gets 304, and unchanged venues are served from the export cache.
     """
+    filename = f"{displayname}_{type}_{opendata}.zip"
+    # Sanitize filename
+    filename = filename.replace(" ", "_").replace(":", "").replace("/", "_")
+
+    try:
+        version = await asyncio.to_thread(indoor_network_version, displayname)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
+    cache_key = export_cache_key("zip", displayname, type, opendata, version)
+    headers = {"ETag": f'"{cache_key}"', "Content-Disposition": f'attachment; filename="{filename}"'}
+    if _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers={"ETag": headers["ETag"]})
+
+    cached = await asyncio.to_thread(export_cache.lookup, cache_key)
+    if cached is not None:
+        logger.info(f"DOWNLOAD: '{displayname}' served from export cache")
+        return FileResponse(os.path.join(cached, _ZIP_CACHE_NAME), media_type="application/zip", headers=headers)
+
     # Create a temporary directory
     temp_dir = tempfile.mkdtemp()
+    exports: dict[asyncio.Task, tuple[str, str]] = {}
     
     try:
         # Define 3 sub-paths
@@ -58,61 +201,86 @@ def download_indoor_network_zip(
         shp_full_path = os.path.join(temp_dir, shp_dir_name)
         geojson_full_path = os.path.join(temp_dir, geojson_dir_name)
         
-        # 1. Export Shapefile
+        # 1. Export Shapefile and 2. Export GeoJSON, concurrently
         # Note: export_indoor_network_by_displayname creates the output_dir if not exists.
-        res_shp = export_indoor_network_by_displayname(
-            displayname=displayname, 
-            output_dir=shp_full_path, 
-            export_type=type, 
-            export_format="shapefile", 
-            opendata=opendata
-        )
-        if res_shp.get("status") == "error":
-            raise HTTPException(status_code=500, detail=res_shp.get("message"))
-
-        # 2. Export GeoJSON
-        res_geo = export_indoor_network_by_displayname(
-            displayname=displayname, 
-            output_dir=geojson_full_path, 
-            export_type=type, 
-            export_format="geojson", 
-            opendata=opendata
-        )
-        if res_geo.get("status") == "error":
-            raise HTTPException(status_code=500, detail=res_geo.get("message"))
-
-        # 3. Zip the results into memory
-        mem_zip = io.BytesIO()
-        with zipfile.ZipFile(mem_zip, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-            # Add ShapeFiles
-            for root, dirs, files in os.walk(shp_full_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    # Archive name should be relative to keep structure "Shapefile/..."
-                    # shp_full_path is .../temp/ShapeFile
-                    # We want zip to have ShapeFile/myfile.shp
-                    arcname = os.path.join(shp_dir_name, file) 
-                    zf.write(file_path, arcname=arcname)
-            
-            # Add GeoJSON files
-            for root, dirs, files in os.walk(geojson_full_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.join(geojson_dir_name, file)
-                    zf.write(file_path, arcname=arcname)
-
-        mem_zip.seek(0)
-        
-        filename = f"{displayname}_{type}_{opendata}.zip"
-        # Sanitize filename
-        filename = filename.replace(" ", "_").replace(":", "").replace("/", "_")
-        
+        for output_dir, export_format, dir_name in (
+            (shp_full_path, "shapefile", shp_dir_name),
+            (geojson_full_path, "geojson", geojson_dir_name),
+        ):
+            task = asyncio.create_task(export_indoor_network_by_displayname(
+                displayname=displayname, 
+                output_dir=output_dir, 
+                export_type=type, 
+                export_format=export_format, 
+                opendata=opendata
+            ))
+            exports[task] = (output_dir, dir_name)
+
+        # Wait for the first export so its failure can still be reported as an HTTP error.
+        done, _pending = await asyncio.wait(exports, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            result = task.result()
+            if result.get("status") == "error":
+                raise HTTPException(status_code=500, detail=result.get("message"))
+
+        # 3. Stream the archive: each export folder is deflated and sent as soon as it is ready.
         return StreamingResponse(
-            mem_zip, 
+            _stream_export_zip(exports, temp_dir, cache_key), 
             media_type="application/zip", 
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            headers=headers
         )
 
-    finally:
-        # Cleanup temporary directory
+    except BaseException:
+        # The stream never started: clean up here (otherwise _stream_export_zip does).
+        for task in exports:
+            task.cancel()
         shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+
+@router.get("/network/query")
+def query_indoor_network(
+    bbox: Optional[str] = Query(None, description='"minx,miny,maxx,maxy" in bbox_crs.'),
+    bbox_crs: Literal[4326, 2326] = 4326,
+    displayname: Optional[str] = None,
+    level_id: Optional[str] = None,
+    floorid: Optional[int] = None,
+    feattype: Optional[List[int]] = Query(None),
+    export_type: Optional[str] = "all",
+    opendata: str = "full",
+    crs: Literal[4326, 2326] = 4326,
+    after: Optional[int] = None,
+    limit: int = Query(NETWORK_QUERY_DEFAULT_LIMIT, ge=1, le=NETWORK_QUERY_MAX_LIMIT),
+    format: Literal["geojson", "ndjson"] = "geojson",
+):
+    """
+    indoor_network features matching the filters, streamed one page at a time in pedrouteid order.
+    - **bbox** / **bbox_crs**: features whose extent overlaps the box (EPSG:4326 or EPSG:2326).
+    - **displayname**, **level_id**, **floorid**, **feattype** (repeatable): attribute filters.
+    - **export_type**: property set of the field mapping ("indoor", "pedestrian" or "all").
+    - **crs**: geometry output CRS. **opendata**: "open" (restricted='N' only) or "full".
+    - **after** / **limit**: keyset pagination. Pass the previous page's "next_after" (geojson)
+      or last feature id (ndjson) as **after**.
+    - **format**: "geojson" (FeatureCollection) or "ndjson" (one Feature per line).
+    """
+    parsed_bbox = None
+    if bbox is not None:
+        try:
+            parsed_bbox = tuple(float(value) for value in bbox.split(","))
+        except ValueError:
+            parsed_bbox = ()
+        if len(parsed_bbox) != 4 or parsed_bbox[0] > parsed_bbox[2] or parsed_bbox[1] > parsed_bbox[3]:
+            raise HTTPException(status_code=400, detail=f"Invalid bbox '{bbox}': expected minx,miny,maxx,maxy")
+
+    logger.info(f"NETWORK QUERY: bbox={bbox} venue={displayname} level={level_id} floor={floorid} after={after} limit={limit}")
+    try:
+        features = query_network(
+            parsed_bbox, bbox_crs, displayname, level_id, floorid, feattype,
+            export_type, opendata, crs, after, limit, format,
+        )
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+    return StreamingResponse(
+        features,
+        media_type="application/x-ndjson" if format == "ndjson" else "application/geo+json",
+    )
@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter
 from pydantic import BaseModel
 from app.services.pedestrian_service import import_pedestrian_from_fgdb
+from app.services.job_service import submit_job
+from app.routes.job_routes import job_accepted
 from app.core.logger import logger
 
 router = APIRouter()
@@ -8,17 +10,13 @@ router = APIRouter()
 class ImportFGDBRequest(BaseModel):
     fgdb_path: str
 
-@router.post("/import-pedestrian-fgdb/")
+@router.post("/import-pedestrian-fgdb/", status_code=202)
 async def import_pedestrian_route():
     """
-    Imports 'PedestrianRoute' from FGDB. 
+    Imports 'PedestrianRoute' from FGDB, as a background job (poll GET /jobs/{job_id}).
     Performs an UPSERT: Updates existing IDs (logging history) and Inserts new IDs.
     """
     pedestrina_path = "/data/pedestrian/3DPN_20260130/3DPN_P2.gdb/"
     logger.info(f"IMPORT REQUEST: FGDB at {pedestrina_path}")
-    result = await import_pedestrian_from_fgdb(pedestrina_path)
-    
-    if result.get("status") == "error":
-        raise HTTPException(status_code=500, detail=result.get("message"))
-        
-    return result
\ No newline at end of file
+    job = submit_job("pedestrian_fgdb_import", import_pedestrian_from_fgdb, pedestrina_path, params={"fgdb_path": pedestrina_path})
+    return job_accepted(job)
\ No newline at end of file
@@ -0,0 +1,103 @@
+import io
+from typing import List, Literal, Optional
+import numpy as np
+from fastapi import APIRouter, HTTPException, Response
+from pydantic import BaseModel, Field
+from app.services.job_service import submit_job
+from app.services.routing_service import find_route
+from app.services.travel_matrix import TRAVEL_MATRIX_PROFILES, get_travel_matrix, precompute_travel_matrices
+from app.routes.job_routes import job_accepted
+
+router = APIRouter(tags=["Routing"])
+
+
+@router.get("/route")
+async def route(
+    displayname: str,
+    from_lon: float,
+    from_lat: float,
+    to_lon: float,
+    to_lat: float,
+    from_level_id: Optional[str] = None,
+    to_level_id: Optional[str] = None,
+    profile: Literal["walk", "wheelchair", "emergency"] = "walk",
+    algorithm: Literal["astar", "dijkstra"] = "astar",
+):
+    """
+    Shortest indoor route of a venue between two WGS84 points, over its indoor_network.
+    Each point snaps to the nearest network node, on **from_level_id** / **to_level_id** if given.
+    - **profile**: "walk", "wheelchair" (avoids wc_barrier segments: stairs, escalators) or
+      "emergency" (avoids lifts). All profiles respect one-way **direction**.
+    - **algorithm**: "astar" (default) or "dijkstra".
+    """
+    result = await find_route(
+        displayname, from_lon, from_lat, to_lon, to_lat, from_level_id, to_level_id, profile, algorithm
+    )
+    if result["status"] == "error":
+        raise HTTPException(status_code=404, detail=result["message"])
+    return result
+
+
+class TravelMatrixRequest(BaseModel):
+    """Request body for building travel matrices."""
+    displaynames: List[str] = Field(..., description="Venue display names.")
+    profiles: List[Literal["walk", "wheelchair", "emergency"]] = Field(list(TRAVEL_MATRIX_PROFILES), description="Routing profiles.")
+
+
+@router.post("/travel-matrix/", status_code=202)
+async def build_travel_matrices(body: TravelMatrixRequest):
+    """
+    Precompute door-to-door travel matrices (named openings x named openings) of venues, as a
+    background job (poll GET /jobs/{job_id}). Matrices are stored per venue data version;
+    GET /travel-matrix/ then reads them without recomputing.
+    """
+    job = submit_job(
+        "travel_matrix",
+        precompute_travel_matrices,
+        body.displaynames,
+        tuple(dict.fromkeys(body.profiles)),
+        params={"displaynames": body.displaynames, "profiles": body.profiles},
+    )
+    return job_accepted(job)
+
+
+@router.get("/travel-matrix/")
+async def read_travel_matrix(
+    displayname: str,
+    profile: Literal["walk", "wheelchair", "emergency"] = "walk",
+    from_id: Optional[str] = None,
+    to_id: Optional[str] = None,
+    format: Literal["json", "npy"] = "json",
+):
+    """
+    Network cost (metres, null when unreachable) between named openings of a venue (IMDF opening ids).
+    - **from_id** and **to_id**: one cost; only one of them: that row / column as {opening id: cost}.
+    - Neither: the whole matrix with its openings (row / column order), or with **format=npy** the
+      float32 matrix as a NumPy .npy file (inf when unreachable).
+    The matrix is computed on first use if it was not precomputed for the current data.
+    """
+    matrix = await get_travel_matrix(displayname, profile)
+    for opening_id in (from_id, to_id):
+        if opening_id is not None and opening_id not in matrix.index:
+            raise HTTPException(status_code=404, detail=f"Opening {opening_id} not found in '{displayname}'")
+
+    def as_costs(values) -> list:
+        return [None if np.isinf(value) else round(float(value), 3) for value in values]
+
+    ids = [opening["id"] for opening in matrix.openings]
+    if from_id is not None and to_id is not None:
+        return {"from_id": from_id, "to_id": to_id, "profile": profile, "cost": matrix.cost(from_id, to_id)}
+    if from_id is not None:
+        return {"from_id": from_id, "profile": profile, "costs": dict(zip(ids, as_costs(matrix.costs[matrix.index[from_id]])))}
+    if to_id is not None:
+        return {"to_id": to_id, "profile": profile, "costs": dict(zip(ids, as_costs(matrix.costs[:, matrix.index[to_id]])))}
+    if format == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(matrix.costs))
+        return Response(content=buffer.getvalue(), media_type="application/octet-stream", headers={"ETag": f'"{matrix.key}"'})
+    return {
+        "displayname": displayname,
+        "profile": profile,
+        "openings": matrix.openings,
+        "costs": [as_costs(row) for row in matrix.costs],
+    }
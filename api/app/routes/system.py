@@ -1,18 +1,51 @@
-from fastapi import APIRouter
-from sqlalchemy import text
+import itertools
+from typing import Iterator
+import orjson
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Connection, text
+from sqlalchemy.exc import SQLAlchemyError
 from app.core.database import engine
 from app.core.mongodb import client
 
 router = APIRouter()
 
+# Rows fetched per round trip from the server-side cursor (one response chunk each).
+TEST_DB_BATCH_SIZE = 1000
+
+
+def _stream_indoor_network(conn: Connection, columns: list[str], partitions: Iterator[list]) -> Iterator[bytes]:
+    """{"result": [...]} of the fetched indoor_network rows, encoded batch by batch; closes conn when done."""
+    with conn:
+        yield b'{"result":['
+        for i, rows in enumerate(partitions):
+            chunk = b",".join(orjson.dumps(dict(zip(columns, row))) for row in rows)
+            yield chunk if i == 0 else b"," + chunk
+        yield b"]}"
+
+
 @router.get("/test-db")
 def test_db():
-    with engine.connect() as conn:
-        result = conn.execute(text("SELECT pedrouteid, aliasnamen, aliasnamtc, levelid, ST_AsGeoJSON(shape) AS geojson FROM indoor_network;"))
-        rows = result.fetchall()
-        columns = result.keys()
-        result_list = [dict(zip(columns, row)) for row in rows]
-    return {"result": result_list}
+    """Every indoor_network row, streamed from a server-side cursor (memory stays flat)."""
+    # Run the query and fetch the first batch before the response starts, so errors still get a 500.
+    try:
+        conn = engine.connect()
+        try:
+            result = conn.execution_options(stream_results=True, yield_per=TEST_DB_BATCH_SIZE).execute(
+                text("SELECT pedrouteid, aliasnamen, aliasnamtc, level_id, ST_AsGeoJSON(shape) AS geojson FROM indoor_network")
+            )
+            columns = list(result.keys())
+            partitions = result.partitions(TEST_DB_BATCH_SIZE)
+            first = next(partitions, [])
+        except BaseException:
+            conn.close()
+            raise
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Database query failed: {str(e)}")
+    return StreamingResponse(
+        _stream_indoor_network(conn, columns, itertools.chain([first], partitions)),
+        media_type="application/json",
+    )
 
 @router.get("/test-mongo")
 async def test_mongo():
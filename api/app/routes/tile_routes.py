@@ -0,0 +1,38 @@
+from typing import Literal, Optional
+from fastapi import APIRouter, Header, HTTPException, Response
+from app.services.tile_service import get_tile
+
+router = APIRouter(tags=["Tiles"])
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+@router.get("/tiles/{layer}/{z}/{x}/{y}.mvt")
+async def read_tile(
+    layer: Literal["indoor_network", "pedestrian_network"],
+    z: int,
+    x: int,
+    y: int,
+    level_id: Optional[str] = None,
+    floorid: Optional[int] = None,
+    displayname: Optional[str] = None,
+    opendata: str = "full",
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    Mapbox Vector Tile (z/x/y, Web Mercator) of indoor_network or pedestrian_network lines.
+    - **level_id** (indoor_network only) / **floorid**: one level of the network.
+    - **displayname** (indoor_network only): one venue.
+    - **opendata**: "open" (restricted='N' only, indoor_network) or "full".
+    Tiles carry an ETag; they are cached on disk until the layer's table changes.
+    """
+    if z < 0 or z > 30 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail=f"Invalid tile {z}/{x}/{y}")
+    if layer == "pedestrian_network" and (level_id is not None or displayname is not None):
+        raise HTTPException(status_code=400, detail="pedestrian_network has no level_id / displayname; filter by floorid")
+
+    data, key = await get_tile(layer, z, x, y, level_id, floorid, displayname, opendata)
+    etag = f'"{key}"'
+    if if_none_match and etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=data, media_type=MVT_MEDIA_TYPE, headers={"ETag": etag})
@@ -0,0 +1,206 @@
+# app/services/enrichment_service.py
+
+import asyncio
+import multiprocessing
+import pickle
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+from app.core.config import ENRICH_PARALLEL_MIN_ROWS, ENRICH_WORKERS
+from app.core.logger import logger
+from app.schema.network import NetworkStagingRow
+from app.services.imdf_service import flpolyid_slices
+from app.services.pedestrian_service import (
+    OpeningIndex,
+    build_opening_index,
+    calculate_wheelchair_access,
+    get_alias_name,
+)
+from app.services.utils import (
+    UnitIndex,
+    build_row_geometries,
+    build_unit_index,
+    calculate_feature_type,
+    calculate_gradient,
+)
+
+# Chunks per worker: small enough to balance uneven rows, large enough to amortise pickling.
+_CHUNKS_PER_WORKER = 4
+
+
+def build_enrichment_context(bundle: dict) -> dict:
+    """
+    Reduce a venue bundle (get_venue_bundle_by_displayName) to the compact, picklable data
+    enrichment needs: feature lists for the spatial indexes plus hash indexes for
+    level / building lookups.
+    """
+    level_features = bundle["level_features"]
+    # FloorPolyID -> level id (last level feature wins, as the former per-level loop did).
+    level_id_by_floor_poly_id = {
+        (f.get("properties") or {}).get("FloorPolyID"): f.get("id") for f in level_features
+    }
+    # level id -> level feature, and buildingCSUID -> BuildingInfo (first match wins, as next(...) did).
+    level_feature_by_id: dict = {}
+    for f in level_features:
+        level_feature_by_id.setdefault(f.get("id"), f)
+    building_info_by_csuid: dict = {}
+    for doc in bundle["building_info"]:
+        building_info_by_csuid.setdefault(doc["buildingCSUID"], doc)
+
+    return {
+        "unit_features": bundle["unit_features"],
+        "unit3d_features": bundle["unit3d_features"],
+        "opening_name_features": bundle["opening_name_features"],
+        "level_id_by_floor_poly_id": level_id_by_floor_poly_id,
+        "level_feature_by_id": level_feature_by_id,
+        "building_info_by_csuid": building_info_by_csuid,
+    }
+
+
+def build_spatial_indexes(context: dict) -> tuple[UnitIndex, OpeningIndex]:
+    """Build the unit and named-opening STRtrees for an enrichment context."""
+    return build_unit_index(context["unit_features"]), build_opening_index(context["opening_name_features"])
+
+
+def enrich_rows(
+    displayName: str,
+    rows: list[NetworkStagingRow],
+    context: dict,
+    indexes: tuple[UnitIndex, OpeningIndex] | None = None,
+) -> list[NetworkStagingRow]:
+    """
+    Compute all pedestrian-related fields on each row: feattype (from units) and building/floor enrichment (from flpolyid).
+    Does not replace geometry. Updates rows in place and returns the same list. CPU-bound; never call on the event loop.
+    """
+    unit_index, opening_index = indexes or build_spatial_indexes(context)
+    unit_features = context["unit_features"]
+    unit3d_features = context["unit3d_features"]
+    opening_name_features = context["opening_name_features"]
+    level_id_by_floor_poly_id = context["level_id_by_floor_poly_id"]
+    level_feature_by_id = context["level_feature_by_id"]
+    building_info_by_csuid = context["building_info_by_csuid"]
+
+    for row in rows:
+        if row.flpolyid in level_id_by_floor_poly_id:
+            row.level_id = level_id_by_floor_poly_id[row.flpolyid]
+    # Parse + reproject every row geometry in one vectorized batch; shared by feattype, wheelchair, alias and gradient.
+    row_geometries = build_row_geometries([row.geojson for row in rows])
+    for row, geom in zip(rows, row_geometries):
+        if row.pedrouteid is not None:
+            row.pedrouteid = int(row.pedrouteid)
+        row.displayname = displayName
+        row.feattype = calculate_feature_type(row, unit_features, unit3d_features, unit_index, geom)
+        flpolyid = row.flpolyid
+        buildingCSUID, floorNumber = flpolyid_slices(flpolyid)
+        buildingCSUIDInfo = building_info_by_csuid.get(buildingCSUID)
+        sixDigitID = buildingCSUIDInfo.get("SixDigitID")
+        floorId = f"{sixDigitID}{floorNumber}"
+        row.bldgid_1 = buildingCSUIDInfo.get("BuildingID")
+        row.buildnamen = buildingCSUIDInfo.get("Name_EN")
+        row.buildnamzh = buildingCSUIDInfo.get("Name_CH")
+        matched_level_feature = level_feature_by_id.get(row.level_id)
+        row.leveleng = matched_level_feature.get("properties", {}).get("name",{}).get("en","")
+        row.levelzh = matched_level_feature.get("properties",{}).get("name",{}).get("zh","")
+        row.floorid = floorId
+        row.emergency = (
+            'no' if row.feattype == 10
+            else 'yes'
+        )
+        row.direction = (
+            0 if row.oneway == 'no'
+            else -1 if row.oneway == 'reverse'
+            else 1
+        )
+        # WheelchairBarrier / wc_Access: 1 if escalator(8), stairs(12), or wheelchair no; else 2
+        row.wc_barrier = (
+            1
+            if (
+                row.feattype == 8
+                or row.feattype == 12
+                or (row.wheelchair == "no")
+            )
+            else 2
+        )
+        row.wx_proof = 1
+        row.wc_access = calculate_wheelchair_access(row, opening_name_features, geom, opening_index)
+        get_alias_name(row, opening_name_features, geom, opening_index)
+        # if not mtr
+        row.location = 2
+        # calculate gradient for walkways if elevation data is present (e.g. escalators)
+        row.gradient = calculate_gradient(row.highway, row.geojson, geom)
+    return rows
+
+
+# --- Process pool workers ---------------------------------------------------
+# One pool per API process, shared by all imports (at most ENRICH_WORKERS processes in total),
+# created on first use and shut down with the app (shutdown_enrichment_pool). Each chunk carries
+# its venue context pickled once by run_enrichment; a worker only unpickles it and builds the
+# spatial indexes when the context differs from its previous chunk's.
+
+_pool: ProcessPoolExecutor | None = None
+_worker_state: dict[str, Any] = {}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # "spawn": never fork the running server process (event loop, DB pool and Mongo threads).
+        _pool = ProcessPoolExecutor(max_workers=ENRICH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_enrichment_pool() -> None:
+    """Stop the enrichment pool without waiting for running chunks (app shutdown)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _enrich_chunk(token: str, displayName: str, context_data: bytes, rows: list[NetworkStagingRow]) -> list[NetworkStagingRow]:
+    if _worker_state.get("token") != token:
+        context = pickle.loads(context_data)
+        _worker_state.update(token=token, context=context, indexes=build_spatial_indexes(context))
+    return enrich_rows(displayName, rows, _worker_state["context"], _worker_state["indexes"])
+
+
+async def run_enrichment(displayName: str, rows: list[NetworkStagingRow], context: dict) -> list[NetworkStagingRow]:
+    """
+    Enrich rows in place, off the event loop, and return them.
+
+    Venues with at least ENRICH_PARALLEL_MIN_ROWS rows are split into chunks and enriched in the
+    shared process pool; the enriched copies are written back into the input rows. Smaller venues
+    run in a worker thread. Both paths give identical results.
+    """
+    workers = ENRICH_WORKERS
+    if workers <= 1 or len(rows) < ENRICH_PARALLEL_MIN_ROWS:
+        return await asyncio.to_thread(enrich_rows, displayName, rows, context)
+
+    chunk_size = -(-len(rows) // (workers * _CHUNKS_PER_WORKER))
+    chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    logger.info(f"Parallel enrichment for {displayName}: {len(rows)} rows, {len(chunks)} chunks, {workers} workers")
+
+    token = uuid.uuid4().hex
+    context_data = await asyncio.to_thread(pickle.dumps, context, pickle.HIGHEST_PROTOCOL)
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    futures = [loop.run_in_executor(pool, _enrich_chunk, token, displayName, context_data, chunk) for chunk in chunks]
+    try:
+        results = await asyncio.gather(*futures)
+    except BrokenProcessPool:
+        # A worker died: the pool is unusable, the next import starts a new one.
+        if _pool is pool:
+            shutdown_enrichment_pool()
+        raise
+    finally:
+        # On failure or cancellation, drop the chunks not started yet (never block the event loop).
+        for future in futures:
+            future.cancel()
+
+    enriched = (row for chunk in results for row in chunk)
+    for row, enriched_row in zip(rows, enriched):
+        # Field values only (no validation): same effect as enrich_rows' in-place updates.
+        row.__dict__.update(enriched_row.__dict__)
+    return rows
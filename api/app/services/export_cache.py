@@ -0,0 +1,164 @@
+# app/services/export_cache.py
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from app.core.logger import logger
+
+
+def export_cache_key(*parts) -> str:
+    """Cache key (also used as ETag) for an export: hash of its parameters and data version."""
+    return hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ExportCache:
+    """
+    Size-bounded LRU disk cache of generated export files.
+
+    Each entry is a directory <root>/<key>/ holding the files of one export (e.g. the
+    shapefile parts, a GeoJSON file or a zip). Entries are immutable once stored; the key
+    must change when the exported data changes (see export_cache_key). Reads refresh the
+    entry's mtime; after each store the least recently used entries are evicted until the
+    cache fits in max_bytes (0 disables the cache). The directory is only rescanned when the
+    running size estimate exceeds max_bytes, so small entries (tiles) stay cheap to store.
+    Blocking file I/O: call from a worker thread.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Bytes in the cache: last full scan plus entries stored since (None: not scanned yet).
+        self._total_bytes: int | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def lookup(self, key: str) -> str | None:
+        """Directory of the cached entry, or None on a miss."""
+        entry = self._entry(key)
+        if not self.enabled or not os.path.isdir(entry):
+            return None
+        try:
+            os.utime(entry)
+        except OSError:
+            return None  # evicted meanwhile
+        return entry
+
+    def restore(self, key: str, out_dir: str) -> list[str] | None:
+        """Copy a cached entry's files into out_dir; returns the copied paths, or None on a miss."""
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        os.makedirs(out_dir, exist_ok=True)
+        try:
+            return [shutil.copy2(os.path.join(entry, name), os.path.join(out_dir, name)) for name in os.listdir(entry)]
+        except OSError as e:
+            logger.warning(f"Export cache entry {key} unreadable: {e}")
+            return None
+
+    def store(self, key: str, paths: list[str]) -> str | None:
+        """Copy files into a new entry (atomically) and evict; returns the entry directory."""
+        if not self.enabled:
+            return None
+        entry = self._entry(key)
+        if os.path.isdir(entry):
+            return entry
+        staging = None
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            staging = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+            for path in paths:
+                shutil.copy2(path, os.path.join(staging, os.path.basename(path)))
+            os.replace(staging, entry)
+        except OSError as e:
+            # Another request stored the same key first, or the disk is full: not fatal.
+            logger.warning(f"Export cache store {key} skipped: {e}")
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+            return entry if os.path.isdir(entry) else None
+        self._added(entry)
+        return entry
+
+    def store_file(self, key: str, part_path: str, name: str) -> str | None:
+        """Move an already-written file (e.g. a streamed zip) into a new entry as <name>."""
+        staging = None
+        try:
+            staging = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+            os.replace(part_path, os.path.join(staging, name))
+            os.replace(staging, self._entry(key))
+        except OSError as e:
+            logger.warning(f"Export cache store {key} skipped: {e}")
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return None
+        self._added(self._entry(key))
+        return self._entry(key)
+
+    def store_bytes(self, key: str, name: str, data: bytes) -> str | None:
+        """Store data as a new entry holding one file <name>."""
+        if not self.enabled:
+            return None
+        part_path = self.new_part_path()
+        with open(part_path, "wb") as f:
+            f.write(data)
+        return self.store_file(key, part_path, name)
+
+    def new_part_path(self, suffix: str = "") -> str:
+        """New empty file to write an entry into before store_file (inside the cache root)."""
+        os.makedirs(self.root, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix=".part-", suffix=suffix, dir=self.root)
+        os.close(fd)
+        return path
+
+    def _added(self, entry: str) -> None:
+        """Account for a new entry; evict once the estimate goes over max_bytes."""
+        try:
+            size = sum(item.stat().st_size for item in os.scandir(entry) if item.is_file())
+        except OSError:
+            return
+        if self._total_bytes is None or self._total_bytes + size > self.max_bytes:
+            self.evict()
+        else:
+            self._total_bytes += size
+
+    def evict(self) -> None:
+        """Delete least recently used entries until the cache is back under 90% of max_bytes."""
+        entries = []
+        total = 0
+        now = time.time()
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if name.startswith("."):
+                    # Leftovers of interrupted writes; live ones are recent.
+                    if now - os.path.getmtime(path) > 24 * 3600:
+                        shutil.rmtree(path, ignore_errors=True) if os.path.isdir(path) else os.remove(path)
+                    continue
+                size = sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+                entries.append((os.path.getmtime(path), size, path))
+                total += size
+            except OSError:
+                continue
+        evicted = 0
+        evicted_bytes = 0
+        # Evict below the limit, so the next stores do not each trigger a rescan.
+        low_water = self.max_bytes * 0.9 if total > self.max_bytes else self.max_bytes
+        for _mtime, size, path in sorted(entries):
+            if total <= low_water:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            evicted += 1
+            evicted_bytes += size
+        self._total_bytes = total
+        if evicted:
+            logger.info(f"Cache {self.root}: evicted {evicted} entries ({evicted_bytes} bytes)")
@@ -1,172 +1,214 @@
 # app/services/imdf_service.py
 
+import asyncio
 import json
 import logging
 from fastapi import HTTPException
 from app.core.database import SessionLocal
 from sqlalchemy import text
+from sqlalchemy.orm import Session
+from psycopg2.extras import execute_values
 from app.core.mongodb import mongo_db
 from app.services.mongo_service import find_one_by_display_name, find_records_by_display_name
 
 logger = logging.getLogger(__name__)
 
+# Venue features per executemany batch into the import temp table.
+VENUE_IMPORT_BATCH_SIZE = 500
+
+# Attribute columns of venue written by import_all_venues_to_postgis (besides id, shape, display_point).
+_VENUE_COLUMNS = [
+    "category", "restriction", "name_en", "name_zh", "alt_name", "hours", "website", "phone",
+    "address_id", "organization_id", "building_type", "region", "displayname",
+]
+_VENUE_IMPORT_FIELDS = ["seq", "id"] + _VENUE_COLUMNS + ["shape_json", "dp_json"]
+
+
+def _venue_rows(doc: dict) -> list[dict]:
+    """Venue table rows (GeoJSON geometry, WGS84) for the 'venue' features of one IMDFVenue document."""
+    # Document-level properties
+    region = doc.get("region")
+    display_name = doc.get("displayName")
+
+    building_type = doc.get("buildingType")
+
+    # Fix for potentially malformed buildingType (e.g. "", None, or single string)
+    if building_type is None or building_type == "":
+        building_type = []
+    elif not isinstance(building_type, list):
+        # If it's a single value (string/int), wrap it in a list
+        building_type = [str(building_type)]
+
+    # Iterate through features
+    features_data = doc.get("features", [])
+
+    # Check if features_data is list
+    if not isinstance(features_data, list):
+        return []
+
+    rows = []
+    for feature in features_data:
+        # Only process features with type 'venue' or feature_type 'venue'
+        ft = feature.get("feature_type")
+        if ft != "venue":
+            continue
+
+        fid = feature.get("id")
+        if not fid:
+            continue # Skip without ID
+
+        props = feature.get("properties", {})
+        geometry = feature.get("geometry")
+
+        if not geometry:
+            continue # Skip without geometry
+
+        # Name (handle object or string)
+        name_field = props.get("name")
+        name_en = None
+        name_zh = None
+
+        if isinstance(name_field, dict):
+            name_en = name_field.get("en")
+            name_zh = name_field.get("zh")
+        elif isinstance(name_field, str):
+            name_en = name_field # Fallback
+
+        alt_name_field = props.get("alt_name")
+        alt_name = None
+        if isinstance(alt_name_field, dict):
+            alt_name = json.dumps(alt_name_field, ensure_ascii=False)
+        elif isinstance(alt_name_field, str):
+            alt_name = alt_name_field
+
+        display_point_geo = props.get("display_point") # GeoJSON Point
+
+        rows.append({
+            "id": fid,
+            "category": props.get("category"),
+            "restriction": props.get("restriction"),
+            "name_en": name_en,
+            "name_zh": name_zh,
+            "alt_name": alt_name,
+            "hours": props.get("hours"),
+            "website": props.get("website"),
+            "phone": props.get("phone"),
+            "address_id": props.get("address_id"),
+            "organization_id": props.get("OrganizationID"),
+            "building_type": building_type,
+            "region": region,
+            "displayname": display_name,
+            "shape_json": json.dumps(geometry),
+            "dp_json": json.dumps(display_point_geo) if display_point_geo else None,
+        })
+    return rows
+
+
+def _create_venue_import_table(session: Session) -> None:
+    """Temp table the venue features are staged in: text columns, as typed in venue (building_type text[])."""
+    session.execute(text(f"""
+        CREATE TEMP TABLE venue_import (
+            seq integer, id text,
+            {", ".join(f"{c} text[]" if c == "building_type" else f"{c} text" for c in _VENUE_COLUMNS)},
+            shape_json text, dp_json text
+        ) ON COMMIT DROP
+    """))
+
+
+def _stage_venue_rows(session: Session, rows: list[dict]) -> None:
+    """Insert one batch into the venue_import temp table: one multi-row INSERT per page (execute_values)."""
+    with session.connection().connection.cursor() as cur:
+        execute_values(
+            cur,
+            f"INSERT INTO venue_import ({', '.join(_VENUE_IMPORT_FIELDS)}) VALUES %s",
+            [tuple(row[field] for field in _VENUE_IMPORT_FIELDS) for row in rows],
+            page_size=VENUE_IMPORT_BATCH_SIZE,
+        )
+
+
+def _merge_venue_import(session: Session) -> dict[str, int]:
+    """
+    Set-based upsert of venue_import into venue (geometry WGS84 -> EPSG:2326 in one statement).
+    A venue id seen twice keeps its last occurrence, as the former per-row upserts did; rows
+    whose values are unchanged are not rewritten. Returns {"inserted", "updated", "unchanged"}.
+    """
+    cols = ", ".join(_VENUE_COLUMNS)
+    excluded = ", ".join(f"EXCLUDED.{c}" for c in _VENUE_COLUMNS)
+    current = ", ".join(f"venue.{c}" for c in _VENUE_COLUMNS)
+    updates = ",\n            ".join(f"{c} = EXCLUDED.{c}" for c in _VENUE_COLUMNS)
+    result = session.execute(text(f"""
+        INSERT INTO venue (id, {cols}, shape, display_point, created_at, updated_at)
+        SELECT DISTINCT ON (id)
+            id, {cols},
+            ST_Transform(ST_GeomFromGeoJSON(shape_json), 2326),
+            CASE
+                WHEN dp_json IS NOT NULL THEN ST_Transform(ST_GeomFromGeoJSON(dp_json), 2326)
+                ELSE NULL
+            END,
+            (NOW() AT TIME ZONE 'Asia/Hong_Kong'),
+            (NOW() AT TIME ZONE 'Asia/Hong_Kong')
+        FROM venue_import
+        ORDER BY id, seq DESC
+        ON CONFLICT (id) DO UPDATE SET
+            {updates},
+            shape = EXCLUDED.shape,
+            display_point = EXCLUDED.display_point,
+            updated_at = (NOW() AT TIME ZONE 'Asia/Hong_Kong')
+        WHERE ({current}, venue.shape, venue.display_point)
+            IS DISTINCT FROM ({excluded}, EXCLUDED.shape, EXCLUDED.display_point)
+        RETURNING (xmax = 0) AS inserted
+    """))
+    flags = [row.inserted for row in result]
+    distinct_ids = session.execute(text("SELECT COUNT(DISTINCT id) FROM venue_import")).scalar()
+    inserted = sum(1 for f in flags if f)
+    updated = len(flags) - inserted
+    return {"inserted": inserted, "updated": updated, "unchanged": distinct_ids - inserted - updated}
+
+
 async def import_all_venues_to_postgis():
     """
     Fetch all IMDFVenue documents from MongoDB and insert/update them into PostGIS 'venue' table.
     Projection: MongoDB (WGS84) -> PostGIS (EPSG:2326).
+
+    Documents are streamed from a Mongo cursor; venue features go in batches into a temp table,
+    then one set-based upsert writes them (unchanged venues are skipped), all in one transaction.
     """
     try:
-        venues = await get_all_venues()
-        if not venues:
-             return {"message": "No venues found in MongoDB to import."}
-
+        doc_count = 0
         count = 0
-        engine = SessionLocal().bind
-
-        with engine.connect() as conn:
-            with conn.begin():  # Start transaction
-                for doc in venues:
-                    try:
-                        # Document-level properties
-                        region = doc.get("region")
-                        display_name = doc.get("displayName")
-                        
-                        building_type = doc.get("buildingType")
-                        
-                        # Fix for potentially malformed buildingType (e.g. "", None, or single string)
-                        if building_type is None or building_type == "":
-                            building_type = []
-                        elif not isinstance(building_type, list):
-                            # If it's a single value (string/int), wrap it in a list
-                            building_type = [str(building_type)]
-
-                        # Iterate through features
-                        features_data = doc.get("features", [])
-                        
-                        # Check if features_data is list
-                        if not isinstance(features_data, list):
-                            continue
-
-                        for feature in features_data:
-                            # Only process features with type 'venue' or feature_type 'venue'
-                            ft = feature.get("feature_type")
-                            if ft != "venue":
-                                continue
-
-                            fid = feature.get("id")
-                            if not fid:
-                                continue # Skip without ID
-
-                            props = feature.get("properties", {})
-                            geometry = feature.get("geometry")
-                            
-                            if not geometry:
-                                continue # Skip without geometry
-
-                            # Extract properties
-                            category = props.get("category")
-                            restriction = props.get("restriction")
-                            
-                            # Name (handle object or string)
-                            name_field = props.get("name")
-                            name_en = None
-                            name_zh = None
-
-                            if isinstance(name_field, dict):
-                                name_en = name_field.get("en")
-                                name_zh = name_field.get("zh")
-                            elif isinstance(name_field, str): 
-                                name_en = name_field # Fallback
-                            
-                            alt_name_field = props.get("alt_name")
-                            alt_name = None
-                            if isinstance(alt_name_field, dict):
-                                alt_name = json.dumps(alt_name_field, ensure_ascii=False)
-                            elif isinstance(alt_name_field, str):
-                                alt_name = alt_name_field
-
-                            hours = props.get("hours")
-                            website = props.get("website")
-                            phone = props.get("phone")
-                            address_id = props.get("address_id")
-                            organization_id = props.get("OrganizationID")
-                            
-                            display_point_geo = props.get("display_point") # GeoJSON Point
-
-                            # Prepare Geometry JSON strings
-                            shape_json = json.dumps(geometry)
-                            dp_json = json.dumps(display_point_geo) if display_point_geo else None
-
-                            # SQL Query
-                            sql = text("""
-                                INSERT INTO venue (
-                                    id, category, restriction, name_en, name_zh,
-                                    alt_name, hours, website, phone, address_id, organization_id,
-                                    building_type, region, displayname,
-                                    shape, display_point, created_at, updated_at
-                                ) VALUES (
-                                    :fid, :category, :restriction, :name_en, :name_zh,
-                                    :alt_name, :hours, :website, :phone, :address_id, :organization_id,
-                                    :building_type, :region, :displayname,
-                                    ST_Transform(ST_GeomFromGeoJSON(:shape_json), 2326),
-                                    CASE 
-                                        WHEN :dp_json IS NOT NULL THEN ST_Transform(ST_GeomFromGeoJSON(:dp_json), 2326)
-                                        ELSE NULL
-                                    END,
-                                    (NOW() AT TIME ZONE 'Asia/Hong_Kong'),
-                                    (NOW() AT TIME ZONE 'Asia/Hong_Kong')
-                                )
-                                ON CONFLICT (id) DO UPDATE SET
-                                    category = EXCLUDED.category,
-                                    restriction = EXCLUDED.restriction,
-                                    name_en = EXCLUDED.name_en,
-                                    name_zh = EXCLUDED.name_zh,
-                                    alt_name = EXCLUDED.alt_name,
-                                    hours = EXCLUDED.hours,
-                                    website = EXCLUDED.website,
-                                    phone = EXCLUDED.phone,
-                                    address_id = EXCLUDED.address_id,
-                                    organization_id = EXCLUDED.organization_id,
-                                    building_type = EXCLUDED.building_type,
-                                    region = EXCLUDED.region,
-                                    displayname = EXCLUDED.displayname,
-                                    shape = EXCLUDED.shape,
-                                    display_point = EXCLUDED.display_point,
-                                    updated_at = (NOW() AT TIME ZONE 'Asia/Hong_Kong');
-                            """)
-                            
-                            # Convert dict/list params to json if needed for SQL array types
-                            # building_type is TEXT[] in postgres, SQLAlchemy should handle list fine or cast
-                            
-                            params = {
-                                "fid": fid,
-                                "category": category,
-                                "restriction": restriction,
-                                "name_en": name_en,
-                                "name_zh": name_zh,
-                                "alt_name": alt_name,
-                                "hours": hours,
-                                "website": website,
-                                "phone": phone,
-                                "address_id": address_id,
-                                "organization_id": organization_id,
-                                "building_type": building_type, # passing list
-                                "region": region,
-                                "displayname": display_name,
-                                "shape_json": shape_json,
-                                "dp_json": dp_json
-                            }
-
-                            conn.execute(sql, params)
-                            count += 1
-                    except Exception as e:
-                        logger.error(f"Error processing venue document {doc.get('_id')}: {str(e)}")
-                        # Continue to next document or raise? 
-                        # Raising here checks if transaction rolls back. 
-                        # Since we are in conn.begin(), raising will rollback this batch.
-                        raise e 
-        
-        return {"message": f"Successfully imported {count} venues to PostGIS"}
+        with SessionLocal() as session:
+            await asyncio.to_thread(_create_venue_import_table, session)
+
+            batch: list[dict] = []
+            cursor = mongo_db.IMDFVenue.find(
+                {}, {"region": 1, "displayName": 1, "buildingType": 1, "features": 1}
+            ).batch_size(100)
+            async for doc in cursor:
+                doc_count += 1
+                try:
+                    rows = _venue_rows(doc)
+                except Exception as e:
+                    logger.error(f"Error processing venue document {doc.get('_id')}: {str(e)}")
+                    # Raising rolls back the whole import.
+                    raise e
+                for row in rows:
+                    row["seq"] = count
+                    count += 1
+                batch.extend(rows)
+                if len(batch) >= VENUE_IMPORT_BATCH_SIZE:
+                    await asyncio.to_thread(_stage_venue_rows, session, batch)
+                    batch = []
+            if batch:
+                await asyncio.to_thread(_stage_venue_rows, session, batch)
+
+            if doc_count == 0:
+                return {"message": "No venues found in MongoDB to import."}
+
+            counts = await asyncio.to_thread(_merge_venue_import, session)
+            await asyncio.to_thread(session.commit)
+
+        logger.info(f"Venue import: {count} features, {counts}")
+        return {"message": f"Successfully imported {count} venues to PostGIS", **counts}
 
     except Exception as e:
         logger.error(f"Failed to import venues: {str(e)}")
@@ -228,12 +270,8 @@ async def get_buildinginfo_by_buildingCSUID(buildingCSUID: str):
         doc["_id"] = str(doc["_id"])
     return doc
 
-async def get_openings_with_name_by_displayName(displayName: str):
-    """
-    Fetch opening FeatureCollection by displayName, then return only features
-    where feature.properties.name is not null, as an array of features.
-    """
-    doc = await find_one_by_display_name("IMDFOpening", displayName)
+def _features_with_name(doc: dict | None) -> list[dict]:
+    """Return features of a FeatureCollection doc whose properties.name is not null."""
     if not doc or "features" not in doc:
         return []
 
@@ -249,6 +287,74 @@ async def get_openings_with_name_by_displayName(displayName: str):
     ]
 
 
+async def get_openings_with_name_by_displayName(displayName: str):
+    """
+    Fetch opening FeatureCollection by displayName, then return only features
+    where feature.properties.name is not null, as an array of features.
+    """
+    doc = await find_one_by_display_name("IMDFOpening", displayName)
+    return _features_with_name(doc)
+
+
+# Mongo projections: only the fields update_pedestrian_fields reads from each collection.
+_UNIT_PROJECTION = {
+    "features.id": 1,
+    "features.geometry": 1,
+    "features.properties.category": 1,
+    "features.properties.level_id": 1,
+    "features.properties.name": 1,
+    "features.properties.UnitPolyID": 1,
+}
+_UNIT3D_PROJECTION = {
+    "features.properties.UnitPolyID": 1,
+    "features.properties.UnitSubtype": 1,
+}
+_OPENING_PROJECTION = {
+    "features.id": 1,
+    "features.geometry": 1,
+    "features.properties.name": 1,
+    "features.properties.level_id": 1,
+}
+_LEVEL_PROJECTION = {
+    "features.id": 1,
+    "features.properties.FloorPolyID": 1,
+    "features.properties.name": 1,
+}
+_BUILDINGINFO_PROJECTION = {
+    "buildingCSUID": 1,
+    "SixDigitID": 1,
+    "BuildingID": 1,
+    "Name_EN": 1,
+    "Name_CH": 1,
+}
+
+
+async def get_venue_bundle_by_displayName(displayName: str) -> dict:
+    """
+    Fetch every IMDF collection needed to enrich a venue's network, concurrently.
+
+    IMDFOpening is read once; the named-opening subset is derived in memory.
+    Each read uses a projection so only the fields used by enrichment are transferred.
+    Returns a dict of feature lists: unit_features, unit3d_features, building_info,
+    opening_features, opening_name_features, level_features.
+    """
+    unit_doc, unit3d_doc, building_info, opening_doc, level_doc = await asyncio.gather(
+        find_one_by_display_name("IMDFUnit", displayName, _UNIT_PROJECTION),
+        find_one_by_display_name("3DUnits", displayName, _UNIT3D_PROJECTION),
+        find_records_by_display_name("BuildingInfo", displayName, _BUILDINGINFO_PROJECTION),
+        find_one_by_display_name("IMDFOpening", displayName, _OPENING_PROJECTION),
+        find_one_by_display_name("IMDFLevel", displayName, _LEVEL_PROJECTION),
+    )
+    return {
+        "unit_features": (unit_doc or {}).get("features") or [],
+        "unit3d_features": (unit3d_doc or {}).get("features") or [],
+        "building_info": building_info or [],
+        "opening_features": (opening_doc or {}).get("features") or [],
+        "opening_name_features": _features_with_name(opening_doc),
+        "level_features": (level_doc or {}).get("features") or [],
+    }
+
+
 def flpolyid_slices(flpolyid: str):
     if not flpolyid or len(flpolyid) < 26:
         return None, None
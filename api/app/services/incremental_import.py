@@ -0,0 +1,74 @@
+# app/services/incremental_import.py
+
+import hashlib
+import json
+from typing import TYPE_CHECKING
+
+from sqlalchemy import text
+
+from app.schema.network import NetworkStagingRow
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+# Bump when the enrichment logic changes, so every stored row is re-enriched on its next import.
+ENRICHMENT_VERSION = 1
+
+# Source attributes + geometry (shape) of a staging row; geojson is derived from shape.
+_HASHED_FIELDS = [name for name in NetworkStagingRow.model_fields if name != "geojson"]
+
+
+def content_hash(row: NetworkStagingRow) -> str:
+    """Hash of a staging row's geometry and source attributes. Call before enrichment mutates the row."""
+    values = repr(tuple(getattr(row, name) for name in _HASHED_FIELDS))
+    return hashlib.blake2b(values.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def imdf_fingerprint(bundle: dict) -> str:
+    """Fingerprint of the IMDF data enrichment reads for a venue (get_venue_bundle_by_displayName)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"v{ENRICHMENT_VERSION}".encode("ascii"))
+    for key in sorted(bundle):
+        digest.update(key.encode("utf-8"))
+        digest.update(json.dumps(bundle[key], sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_source_hashes(session: "Session", inetworkids: list[str]) -> dict[str, tuple[str, str]]:
+    """inetworkid -> (content_hash, imdf_fingerprint) recorded by the last import of those rows."""
+    if not inetworkids:
+        return {}
+    result = session.execute(
+        text("""
+            SELECT inetworkid, content_hash, imdf_fingerprint
+            FROM indoor_network_source
+            WHERE inetworkid = ANY(:ids)
+        """),
+        {"ids": inetworkids},
+    )
+    return {inetworkid: (content, fingerprint) for inetworkid, content, fingerprint in result}
+
+
+def save_source_hashes(session: "Session", venue_id: str | None, entries: list[tuple[str, str]], fingerprint: str) -> None:
+    """
+    Record (inetworkid, content_hash) for rows just upserted into indoor_network, with the IMDF
+    fingerprint they were enriched against. Runs in the caller's transaction, after the upsert
+    (indoor_network_source references indoor_network and is cleared with it on delete).
+    """
+    if not entries:
+        return
+    session.execute(
+        text("""
+            INSERT INTO indoor_network_source (inetworkid, venue_id, content_hash, imdf_fingerprint)
+            VALUES (:inetworkid, :venue_id, :content_hash, :imdf_fingerprint)
+            ON CONFLICT (inetworkid) DO UPDATE SET
+                venue_id = EXCLUDED.venue_id,
+                content_hash = EXCLUDED.content_hash,
+                imdf_fingerprint = EXCLUDED.imdf_fingerprint,
+                imported_at = (NOW() AT TIME ZONE 'Asia/Hong_Kong')
+        """),
+        [
+            {"inetworkid": inetworkid, "venue_id": venue_id, "content_hash": content, "imdf_fingerprint": fingerprint}
+            for inetworkid, content in entries
+        ],
+    )
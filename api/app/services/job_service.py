@@ -0,0 +1,140 @@
+# app/services/job_service.py
+
+import asyncio
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
+
+from app.core.config import JOB_CONCURRENCY, JOB_HISTORY_MAX
+from app.core.logger import logger
+
+# In-process job registry: job_id -> job record (insertion order = submission order).
+# Jobs live in this API worker only; a restart forgets them.
+_jobs: "OrderedDict[str, dict]" = OrderedDict()
+_tasks: dict[str, asyncio.Task] = {}
+# Bounds how many jobs (imports, FGDB loads, exports) do heavy work at the same time.
+_job_slots = asyncio.Semaphore(JOB_CONCURRENCY)
+# Id of the job whose task is running (inherited by tasks it creates), for report_progress.
+_current_job_id: ContextVar[str | None] = ContextVar("current_job_id", default=None)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCESS = "success"
+JOB_ERROR = "error"
+
+# Lists longer than this in a stored job result are cut to their first items (see _trim_result).
+JOB_RESULT_MAX_ITEMS = 100
+
+
+def _prune_finished() -> None:
+    """Forget the oldest finished jobs beyond JOB_HISTORY_MAX."""
+    finished = [job_id for job_id, job in _jobs.items() if job["status"] in (JOB_SUCCESS, JOB_ERROR)]
+    for job_id in finished[:max(0, len(finished) - JOB_HISTORY_MAX)]:
+        _jobs.pop(job_id, None)
+
+
+def _trim_result(result: Any) -> Any:
+    """
+    Result as kept in the job record, bounded in size for the JOB_HISTORY_MAX finished jobs held
+    in memory: per-row "rows" are replaced by "row_count", other long lists are cut to
+    JOB_RESULT_MAX_ITEMS items with their full length in "<key>_total".
+    """
+    if not isinstance(result, dict):
+        return result
+    trimmed = {}
+    for key, value in result.items():
+        if key == "rows" and isinstance(value, list):
+            trimmed["row_count"] = len(value)
+        elif isinstance(value, list) and len(value) > JOB_RESULT_MAX_ITEMS:
+            trimmed[key] = value[:JOB_RESULT_MAX_ITEMS]
+            trimmed[f"{key}_total"] = len(value)
+        else:
+            trimmed[key] = value
+    return trimmed
+
+
+async def _run_job(job_id: str, func: Callable[..., Awaitable[dict]], args: tuple, kwargs: dict) -> None:
+    job = _jobs[job_id]
+    _current_job_id.set(job_id)
+    try:
+        async with _job_slots:
+            job["status"] = JOB_RUNNING
+            job["started_at"] = time.time()
+            logger.info(f"JOB START {job_id} ({job['kind']})")
+            result = await func(*args, **kwargs)
+        job["result"] = _trim_result(result)
+        # Services report failures as {"status": "error" | "validation_failed", ...}
+        failed = isinstance(result, dict) and result.get("status") not in (None, "success", "warning")
+        job["status"] = JOB_ERROR if failed else JOB_SUCCESS
+    except asyncio.CancelledError:
+        job["status"] = JOB_ERROR
+        job["error"] = "Job cancelled"
+        raise
+    except Exception as e:
+        logger.error(f"JOB FAILED {job_id} ({job['kind']}): {e}")
+        logger.error(traceback.format_exc())
+        job["status"] = JOB_ERROR
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = time.time()
+        _tasks.pop(job_id, None)
+        logger.info(f"JOB END {job_id} ({job['kind']}): {job['status']}")
+        _prune_finished()
+
+
+def submit_job(kind: str, func: Callable[..., Awaitable[dict]], *args: Any, params: dict | None = None, **kwargs: Any) -> dict:
+    """
+    Schedule func(*args, **kwargs) as a background job and return its record immediately.
+    At most JOB_CONCURRENCY jobs run at once; the rest wait in "queued". params is echoed
+    in the job record so callers can tell jobs apart (e.g. displayname, filename).
+    """
+    job_id = str(uuid.uuid4())
+    _jobs[job_id] = {
+        "job_id": job_id,
+        "kind": kind,
+        "params": params or {},
+        "status": JOB_QUEUED,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "progress": None,
+        "result": None,
+        "error": None,
+    }
+    _tasks[job_id] = asyncio.create_task(_run_job(job_id, func, args, kwargs))
+    return dict(_jobs[job_id])
+
+
+def report_progress(**progress: Any) -> None:
+    """
+    Merge progress fields (e.g. done / total counts) into the running job's "progress".
+    Call from the job's coroutine (or tasks it created); does nothing outside a job.
+    """
+    job = _jobs.get(_current_job_id.get())
+    if job is not None:
+        job["progress"] = {**(job["progress"] or {}), **progress}
+
+
+def get_job(job_id: str) -> dict | None:
+    job = _jobs.get(job_id)
+    return dict(job) if job is not None else None
+
+
+def list_jobs(status: str | None = None) -> list[dict]:
+    """Job summaries (without results), most recent first."""
+    return [
+        {k: v for k, v in job.items() if k != "result"}
+        for job in reversed(_jobs.values())
+        if status is None or job["status"] == status
+    ]
+
+
+async def cancel_all_jobs() -> None:
+    """Cancel queued and running jobs (application shutdown)."""
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
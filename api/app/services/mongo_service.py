@@ -1,25 +1,199 @@
+import asyncio
+import pickle
+import time
+import traceback
+from collections import OrderedDict
+from typing import Any
+
+from pymongo.errors import PyMongoError
+
+from app.core.config import IMDF_CACHE_MAX_ENTRIES, IMDF_CACHE_TTL_SECONDS
+from app.core.logger import logger
 from app.core.mongodb import mongo_db
 
+# ---------------------------------------------------------------------------
+# IMDF document cache
+# ---------------------------------------------------------------------------
+# LRU cache (size bound + TTL) of documents read by displayName, keyed by
+# (kind, collection, displayName, projection). It is only consulted while the
+# change stream started by watch_imdf_changes() is live: every insert/update/
+# replace/delete on the database evicts the affected displayName, and if the
+# stream drops (or fails) the whole cache is cleared and bypassed until it reconnects.
+# Entries are stored pickled and every read unpickles a fresh copy, so callers
+# may mutate what they get without affecting later reads.
+
+_CACHE_RETRY_SECONDS = 30
+
+# key -> (stored at, pickled value, (collection, str(_id)) of its documents)
+_cache: "OrderedDict[tuple, tuple[float, bytes, list[tuple[str, str]]]]" = OrderedDict()
+# (collection, str(_id)) -> [displayName, number of cached entries holding the document], so
+# update/delete events (which carry only _id) can be resolved. Pruned with the entries.
+_cache_ids: dict[tuple[str, str], list] = {}
+# Bumped on every invalidation; a read that raced with an invalidation is not stored.
+_cache_generation = 0
+_watch_active = False
+
+
+def _projection_key(projection: dict | None) -> tuple:
+    return tuple(sorted(projection.items())) if projection else ()
+
+
+def _drop_entry(key: tuple) -> None:
+    """Remove a cache entry and release its documents from _cache_ids."""
+    entry = _cache.pop(key, None)
+    if entry is None:
+        return
+    for doc_key in entry[2]:
+        ref = _cache_ids.get(doc_key)
+        if ref is not None:
+            ref[1] -= 1
+            if ref[1] <= 0:
+                del _cache_ids[doc_key]
+
+
+def _cache_get(key: tuple) -> Any:
+    if not _watch_active:
+        return None
+    entry = _cache.get(key)
+    if entry is None:
+        return None
+    stored_at, data, _ = entry
+    if time.monotonic() - stored_at > IMDF_CACHE_TTL_SECONDS:
+        _drop_entry(key)
+        return None
+    _cache.move_to_end(key)
+    return pickle.loads(data)
+
+
+def _cache_put(key: tuple, value: Any, docs: list[dict], generation: int) -> None:
+    if not _watch_active or generation != _cache_generation or IMDF_CACHE_MAX_ENTRIES <= 0:
+        return
+    _, collection_name, display_name, _ = key
+    _drop_entry(key)
+    doc_keys = [(collection_name, str(doc["_id"])) for doc in docs]
+    for doc_key in doc_keys:
+        ref = _cache_ids.setdefault(doc_key, [display_name, 0])
+        ref[0] = display_name
+        ref[1] += 1
+    _cache[key] = (time.monotonic(), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), doc_keys)
+    while len(_cache) > IMDF_CACHE_MAX_ENTRIES:
+        _drop_entry(next(iter(_cache)))
+
 
-async def find_one_by_display_name(collection_name: str, display_name: str):
+def invalidate_display_name(collection_name: str, display_name: str | None) -> None:
+    """Drop every cached read of collection_name for display_name."""
+    global _cache_generation
+    _cache_generation += 1
+    for key in [k for k in _cache if k[1] == collection_name and k[2] == display_name]:
+        _drop_entry(key)
+
+
+def clear_cache() -> None:
+    """Drop all cached documents."""
+    global _cache_generation
+    _cache_generation += 1
+    _cache.clear()
+    _cache_ids.clear()
+
+
+def _apply_change(change: dict) -> None:
+    """Evict cache entries affected by one change stream event."""
+    op = change.get("operationType")
+    collection_name = (change.get("ns") or {}).get("coll")
+    if op not in ("insert", "update", "replace", "delete") or not collection_name:
+        # drop / rename / dropDatabase / invalidate: anything may have changed.
+        clear_cache()
+        return
+
+    doc_id = str((change.get("documentKey") or {}).get("_id"))
+    known = _cache_ids.get((collection_name, doc_id))
+    known_name = known[0] if known is not None else None
+    if known_name is not None:
+        invalidate_display_name(collection_name, known_name)
+
+    # New name of an inserted/replaced/renamed document (it may now match a cached displayName query).
+    new_name = (change.get("fullDocument") or {}).get("displayName")
+    if new_name is None:
+        new_name = ((change.get("updateDescription") or {}).get("updatedFields") or {}).get("displayName")
+    if new_name is not None:
+        invalidate_display_name(collection_name, new_name)
+    elif known_name is None:
+        # Unknown document: keep the generation moving so in-flight reads are not cached.
+        invalidate_display_name(collection_name, None)
+
+
+async def watch_imdf_changes() -> None:
+    """
+    Long-running task keeping the IMDF cache coherent through a MongoDB change stream.
+    Start once at application startup; cancel on shutdown. Whenever the stream is not
+    live (closed, failed, cancelled) the cache is cleared and bypassed.
+    """
+    global _watch_active
+    # Only ship the fields needed to resolve the affected displayName, never the documents themselves.
+    pipeline = [{"$project": {
+        "operationType": 1,
+        "ns": 1,
+        "documentKey": 1,
+        "fullDocument.displayName": 1,
+        "updateDescription.updatedFields.displayName": 1,
+    }}]
+    while True:
+        retry = False
+        try:
+            async with mongo_db.watch(pipeline) as stream:
+                clear_cache()
+                _watch_active = True
+                logger.info("IMDF cache enabled: MongoDB change stream connected")
+                async for change in stream:
+                    _apply_change(change)
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError as e:
+            retry = True
+            logger.warning(f"IMDF cache disabled, change stream unavailable (retry in {_CACHE_RETRY_SECONDS}s): {e}")
+        except Exception as e:
+            retry = True
+            logger.error(f"IMDF cache disabled, change stream failed (retry in {_CACHE_RETRY_SECONDS}s): {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            _watch_active = False
+            clear_cache()
+        if retry:
+            await asyncio.sleep(_CACHE_RETRY_SECONDS)
+
+
+async def find_one_by_display_name(collection_name: str, display_name: str, projection: dict | None = None):
+    key = ("one", collection_name, display_name, _projection_key(projection))
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    generation = _cache_generation
     collection = mongo_db[collection_name]
 
-    doc = await collection.find_one({"displayName": display_name})
+    doc = await collection.find_one({"displayName": display_name}, projection)
 
     if doc:
         doc["_id"] = str(doc["_id"])
+        _cache_put(key, doc, [doc], generation)
 
     return doc
 
-async def find_records_by_display_name(collection_name: str, display_name: str):
+async def find_records_by_display_name(collection_name: str, display_name: str, projection: dict | None = None):
+    key = ("many", collection_name, display_name, _projection_key(projection))
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    generation = _cache_generation
     collection = mongo_db[collection_name]
 
-    cursor = collection.find({"displayName": display_name})
+    cursor = collection.find({"displayName": display_name}, projection)
     docs = await cursor.to_list(length=None)   # length=None = no limit
 # now docs is a list; use it
     if docs:
         for doc in docs:
             doc["_id"] = str(doc["_id"])
+        _cache_put(key, docs, docs, generation)
 
     return docs
-
@@ -0,0 +1,130 @@
+# app/services/network_query.py
+
+import itertools
+import json
+from typing import Iterator
+
+from sqlalchemy import Connection, text
+
+from app.core.database import engine
+from app.services.network_services import load_export_fields
+
+# Page size of /network/query (features per response) and its upper bound.
+NETWORK_QUERY_DEFAULT_LIMIT = 1000
+NETWORK_QUERY_MAX_LIMIT = 10000
+# Rows fetched per round trip from the server-side cursor, and features per response chunk.
+NETWORK_QUERY_FETCH_SIZE = 500
+
+
+def _query_where(
+    bbox: tuple[float, float, float, float] | None,
+    bbox_crs: int,
+    displayname: str | None,
+    level_id: str | None,
+    floorid: int | None,
+    feattype: list[int] | None,
+    opendata: str,
+    after: int | None,
+) -> tuple[str, dict]:
+    conditions = []
+    params: dict = {}
+    if bbox is not None:
+        # &&& (n-D overlap) is the operator of the gist_geometry_ops_nd shape index.
+        envelope = "ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, :bbox_crs)"
+        if bbox_crs != 2326:
+            envelope = f"ST_Transform({envelope}, 2326)"
+        conditions.append(f"shape &&& {envelope}")
+        params.update(minx=bbox[0], miny=bbox[1], maxx=bbox[2], maxy=bbox[3], bbox_crs=bbox_crs)
+    if displayname is not None:
+        conditions.append("displayname = :displayname")
+        params["displayname"] = displayname
+    if level_id is not None:
+        conditions.append("level_id = :level_id")
+        params["level_id"] = level_id
+    if floorid is not None:
+        conditions.append("floorid = :floorid")
+        params["floorid"] = floorid
+    if feattype:
+        conditions.append("feattype = ANY(:feattype)")
+        params["feattype"] = list(feattype)
+    if opendata == "open":
+        conditions.append("restricted = 'N'")
+    if after is not None:
+        conditions.append("pedrouteid > :after")
+        params["after"] = after
+    return " AND ".join(conditions) or "TRUE", params
+
+
+def query_network(
+    bbox: tuple[float, float, float, float] | None = None,
+    bbox_crs: int = 4326,
+    displayname: str | None = None,
+    level_id: str | None = None,
+    floorid: int | None = None,
+    feattype: list[int] | None = None,
+    export_type: str | None = "all",
+    opendata: str = "full",
+    crs: int = 4326,
+    after: int | None = None,
+    limit: int = NETWORK_QUERY_DEFAULT_LIMIT,
+    output_format: str = "geojson",
+) -> Iterator[str]:
+    """
+    Stream one page of indoor_network features matching the filters, in pedrouteid order
+    (keyset pagination: pass the last pedrouteid as after). Properties follow the GeoJSON
+    field mapping of export_type; geometry is in crs (4326 or 2326).
+    output_format "geojson": a FeatureCollection whose last member "next_after" is the cursor
+    of the next page (null on the last page). "ndjson": one Feature per line; the next page
+    starts after the last feature's id, and a page shorter than limit is the last one.
+    Rows come from a server-side cursor, so memory does not grow with the page size. The query
+    runs and its first rows are fetched before this returns, so database errors (SQLAlchemyError)
+    raise here rather than in the middle of the stream.
+    """
+    properties = [(db_col, name) for db_col, name in load_export_fields(export_type, "geojson") if db_col != "shape"]
+    names = [name for _, name in properties]
+    columns = "".join(f', "{db_col}"' for db_col, _ in properties)
+    geometry_sql = "ST_AsGeoJSON(ST_Transform(shape, 4326), 8)" if crs == 4326 else "ST_AsGeoJSON(shape, 3)"
+    where, params = _query_where(bbox, bbox_crs, displayname, level_id, floorid, feattype, opendata, after)
+    # One row past the page tells whether there is a next page.
+    query = text(
+        f"SELECT pedrouteid, {geometry_sql} AS geometry_json{columns} FROM indoor_network "
+        f"WHERE {where} ORDER BY pedrouteid LIMIT :limit"
+    )
+    params["limit"] = limit + 1
+
+    conn = engine.connect()
+    try:
+        result = conn.execution_options(stream_results=True, yield_per=NETWORK_QUERY_FETCH_SIZE).execute(query, params)
+        partitions = result.partitions(NETWORK_QUERY_FETCH_SIZE)
+        first = next(partitions, [])
+    except BaseException:
+        conn.close()
+        raise
+    return _stream_features(conn, itertools.chain([first], partitions), names, limit, output_format == "ndjson")
+
+
+def _stream_features(conn: Connection, partitions: Iterator[list], names: list[str], limit: int, ndjson: bool) -> Iterator[str]:
+    """Serialize the fetched partitions of query_network; closes conn when done."""
+    separator = "\n" if ndjson else ",\n"
+    count = 0
+    last_id = None
+    has_more = False
+    with conn:
+        if not ndjson:
+            yield '{"type": "FeatureCollection", "features": [\n'
+        for rows in partitions:
+            chunk = []
+            for row in rows:
+                if count == limit:
+                    has_more = True
+                    break
+                props = json.dumps(dict(zip(names, row[2:])), ensure_ascii=False, default=str)
+                chunk.append(f'{{"type": "Feature", "id": {row[0]}, "properties": {props}, "geometry": {row[1] or "null"}}}')
+                count += 1
+                last_id = row[0]
+            if chunk:
+                yield ("" if ndjson or count == len(chunk) else separator) + separator.join(chunk) + ("\n" if ndjson else "")
+            if has_more:
+                break
+    if not ndjson:
+        yield f'\n], "next_after": {json.dumps(last_id if has_more else None)}}}\n'
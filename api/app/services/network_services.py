@@ -1,33 +1,38 @@
+import asyncio
+import json
 import os
 import re
 import shutil
 import tempfile
 import uuid
 import zipfile
-import subprocess
 import traceback
 import time
+import psycopg2
+from typing import Callable, TextIO
 from sqlalchemy import text
-from app.core.database import SessionLocal
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal, engine
 from app.core.logger import logger  # <--- Import the logger
+from app.core.config import EXPORT_CACHE_MAX_BYTES, EXPORT_WORKERS
 from app.services.imdf_service import (
-    flpolyid_slices,
-    get_opening_by_displayName,
-    get_openings_with_name_by_displayName,
-    get_unit_by_displayName,
-    get_3d_units_by_displayName,
-    get_buildinginfo_by_buildingCSUID,
-    get_buildinginfo_by_displayName,
-    get_level_by_displayName,
+    get_venue_bundle_by_displayName,
     get_venue_by_displayName
 )
-from app.services.utils import (calculate_feature_type,calculate_gradient)
+from app.services.staging_batch import NetworkStagingBatch
+from app.services.incremental_import import content_hash, imdf_fingerprint, load_source_hashes, save_source_hashes
+from app.services.shapefile_loader import ShapefileLoadError, load_shapefile_to_staging
+from app.services.validation import get_validation_errors, validate_staging
+from app.services.enrichment_service import build_enrichment_context, run_enrichment
 from app.services.pedestrian_service import (
     sync_pedrouterelfloorpoly_from_imdf,
-    calculate_wheelchair_access,
-    get_alias_name,
+    PedrouteidConflictError,
     insert_network_rows_into_indoor_network,
 )
+from app.services.utils import run_ogr2ogr
+from app.services.export_cache import ExportCache, export_cache_key
+from app.services.job_service import report_progress
 from app.schema.network import NetworkStagingRow
 
 
@@ -38,6 +43,14 @@ DEFAULT_EXPORT_RESULT_DIR = os.environ.get(
     "EXPORT_RESULT_DIR",
     os.path.join(_PROJECT_ROOT, "data", "result"),
 )
+# Generated exports, reused while the venue's data is unchanged (see indoor_network_version).
+export_cache = ExportCache(os.path.join(DEFAULT_EXPORT_RESULT_DIR, ".cache"), EXPORT_CACHE_MAX_BYTES)
+# Bump when export output changes for the same data, so cached exports are not served.
+EXPORT_CACHE_VERSION = 1
+# Field mapping of exports: database column -> shapefile / GeoJSON names, per export type.
+EXPORT_MAPPING_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "reference", "pedestrian_convert_table.json"
+)
 PG_CONNECTION = "PG:host=postgis user=postgres dbname=gis password=postgres"
 # Base path for user-provided folder paths (e.g. /data when Docker mounts host ./data here)
 IMPORT_BASE_PATH = os.path.normpath(os.environ.get("IMPORT_BASE_PATH", "/data"))
@@ -134,16 +147,6 @@ async def process_network_import(displayName:str, filePath:str):
 
     job_id = str(uuid.uuid4())
 
-    # 🔽 PRE-CLEANUP: Ensure staging table is empty before we start
-    # This prevents data contamination if ogr2ogr fails to overwrite or multiple runs overlap/fail
-    try:
-        with SessionLocal() as session:
-            session.execute(text("TRUNCATE TABLE network_staging"))
-            session.commit()
-    except Exception as e:
-        # Log warning but continue, as it might just be because the table doesn't exist yet
-        logger.warning(f"Pre-cleanup TRUNCATE failed (non-fatal): {e}")
-
     shp_path = os.path.join(filePath, INDOOR_NETWORK_SHP_NAME)
 
     # Check for exact match first; if not found, look for case-insensitive match
@@ -163,230 +166,243 @@ async def process_network_import(displayName:str, filePath:str):
             logger.error(msg)
             return {"status": "error", "message": msg}
 
-    cmd = [
-        "ogr2ogr",
-        "-f", "PostgreSQL",
-        'PG:host=postgis user=postgres dbname=gis password=postgres',
-        shp_path,
-        "-nln", "public.network_staging",
-        "-nlt", "LINESTRINGZ",
-        "-lco", "GEOMETRY_NAME=shape",
-        "-t_srs", "EPSG:2326",
-        "-overwrite"
-    ]
+    # Each import loads into its own staging table, so concurrent imports never share rows.
+    # It is dropped when the import finishes, whatever the outcome.
+    staging_table = f"network_staging_{job_id.replace('-', '')}"
 
     try:
-        # Capture output to help debug ogr2ogr issues
-        subprocess.run(cmd, check=True, capture_output=True, text=True)
-    except subprocess.CalledProcessError as e:
-        # Log the specific OGR failure
-        logger.error(f"Ogr2ogr Failed for {displayName}: {e.stderr}")
-        return {"status": "error", "message": f"Ogr2ogr failed: {e.stderr}"}
-
-    # 🔽 Now database validation + merge
-    with SessionLocal() as session:
+        # Stream the shapefile into the staging table in process (batched reprojection + COPY),
+        # in a worker thread so the event loop and concurrent imports keep running.
         try:
-            # Execute function calling scalar() to retrieve the JSON object directly
-            validation_output = session.execute(
-                text("SELECT validate_network_staging();")
-            ).scalar()
-
-            # The function returns a JSON object (dict in Python), e.g. {"valid": true, "error_count": 0}
-            is_valid = False
-            if isinstance(validation_output, dict):
-                is_valid = validation_output.get("valid", False)
-            elif validation_output is None:
-                 is_valid = False
-            else:
-                 # In case it returns a Mapping/Row proxy or other type, try attribute access or generic get
-                 is_valid = getattr(validation_output, "valid", False)
+            loaded = await asyncio.to_thread(_load_staging_table, shp_path, staging_table)
+        except (ShapefileLoadError, SQLAlchemyError, psycopg2.Error) as e:
+            logger.error(f"Shapefile load failed for {displayName}: {e}")
+            return {"status": "error", "message": f"Shapefile load failed: {e}"}
+        logger.info(f"Staged {loaded} records for {displayName} in {staging_table}")
 
-            if not is_valid:
-                errors = session.execute(
-                    text("SELECT * FROM network_staging_errors;")
-                ).mappings().all()
-
-                logger.warning(f"Validation Failed for {displayName}. Found {len(errors)} errors.")
-                
-                return {
-                    "status": "validation_failed",
-                    "errors": errors
-                }
-            
-            # Select all columns + explicitly convert shape to WKB Hex for validation
-            # We use ST_AsBinary -> encode hex to match Pydantic expectation of 'shape' string
-            staging_result = session.execute(text("SELECT *, ST_AsGeoJSON(shape) AS geojson FROM network_staging"))
-            
-            staging_rows = []
-            for r in staging_result.mappings().all():
-                # Convert RowMapping to dict
-                row_dict = dict(r)
-                
-                # 2. Key Step: specific handling for 'crtby' default behavior
-                # If crtby is None (NULL in DB), remove it so Pydantic uses the default "03".
-                if row_dict.get("crtby") is None:
-                    row_dict.pop("crtby", None)
-                if row_dict.get("lstamdby") is None:
-                    row_dict.pop("lstamdby", None)
-
-                staging_rows.append(row_dict)
-
-            rows_result = []
-            for i, r in enumerate(staging_rows):
-                try:
-                    rows_result.append(NetworkStagingRow.model_validate(r))
-                except Exception as e:
-                    msg = f"Pydantic Validation failed at row index {i} (ID: {r.get('inetworkid')}). Error: {str(e)}"
-                    logger.error(msg)
-                    return {
-                        "status": "error",
-                        "message": msg,
-                        "row_data": r
-                    }
-
-            # 3. SYNC DELETE LOGIC
-            # Remove records from indoor_network that belong to this venue but are missing from the current import (staging).
-            # This must run BEFORE truncating staging.
-            if venue_id:
-                start_del = time.time()
-                # We use INETWORKID as the unique key to match
-                delete_query = text("""
-                    DELETE FROM indoor_network
-                    WHERE venue_id = :vid
-                    AND inetworkid NOT IN (
-                        SELECT inetworkid FROM network_staging WHERE inetworkid IS NOT NULL
-                    );
-                """)
-                del_result = session.execute(delete_query, {"vid": venue_id})
-                deleted_count = del_result.rowcount
-                logger.info(f"SYNC DELETE: Removed {deleted_count} stale records for venue_id='{venue_id}' in {time.time() - start_del:.2f}s")
-            else:
-                 logger.warning("SKIPPING SYNC DELETE: No venue_id found. Cannot safely scope deletions.")
+        # 🔽 Now database validation + merge
+        with SessionLocal() as session:
+            try:
+                staged = await asyncio.to_thread(_read_staging_rows, session, displayName, staging_table)
+                if staged["status"] != "success":
+                    return staged
+                rows_result = staged["rows"]
+
+                # 3. SYNC DELETE LOGIC
+                # Remove records from indoor_network that belong to this venue but are missing from the current import (staging).
+                # This must run BEFORE the staging table is dropped.
+                if venue_id:
+                    start_del = time.time()
+                    # We use INETWORKID as the unique key to match
+                    delete_query = text(sync_delete_sql(staging_table))
+                    del_result = await asyncio.to_thread(session.execute, delete_query, {"vid": venue_id})
+                    deleted_count = del_result.rowcount
+                    logger.info(f"SYNC DELETE: Removed {deleted_count} stale records for venue_id='{venue_id}' in {time.time() - start_del:.2f}s")
+                else:
+                     logger.warning("SKIPPING SYNC DELETE: No venue_id found. Cannot safely scope deletions.")
 
 
-            session.execute(text("TRUNCATE TABLE network_staging"))
             
-            # Split rows based on pedrouteid for optimization
-            rows_to_calculate = []
-            rows_direct = []
+                # 4. INCREMENTAL IMPORT
+                # A row whose geometry + source attributes (content hash) and venue IMDF data (fingerprint)
+                # match its last import is already up to date in indoor_network: skip enrichment and upsert.
+                bundle = await get_venue_bundle_by_displayName(displayName)
+                fingerprint, row_hashes = await asyncio.to_thread(_hash_import, bundle, rows_result)
+                stored_hashes = await asyncio.to_thread(
+                    load_source_hashes, session, [r.inetworkid for r in rows_result]
+                )
+                changed_rows = []
+                changed_hashes = []
+                for row, row_hash in zip(rows_result, row_hashes):
+                    if stored_hashes.get(row.inetworkid) != (row_hash, fingerprint):
+                        changed_rows.append(row)
+                        changed_hashes.append((row.inetworkid, row_hash))
+                unchanged_count = len(rows_result) - len(changed_rows)
+                logger.info(f"INCREMENTAL {displayName}: {len(changed_rows)} changed, {unchanged_count} unchanged since last import")
+
+                # Split rows based on pedrouteid for optimization
+                rows_to_calculate = []
+                rows_direct = []
             
-            for row in rows_result:
-                # Logic: if pedrouteid is 0/empty/null -> calc
-                if not row.pedrouteid or row.pedrouteid == 0:
-                    rows_to_calculate.append(row)
-                else:
-                    rows_direct.append(row)
+                for row in changed_rows:
+                    # Logic: if pedrouteid is 0/empty/null -> calc
+                    if not row.pedrouteid or row.pedrouteid == 0:
+                        rows_to_calculate.append(row)
+                    else:
+                        rows_direct.append(row)
             
-            # venue_id is already retrieved at the start of the function
-
-            final_rows = []
-            if rows_to_calculate:
-                # Update only property fields; geometry (shape/geojson) from staging must not be changed.
-                calculated_rows = await update_pedestrian_fields(displayName, rows_to_calculate)
-                # Assign venue_id
-                for r in calculated_rows:
-                    r.venue_id = venue_id
-                final_rows.extend(calculated_rows)
+                # venue_id is already retrieved at the start of the function
+
+                final_rows = []
+                if rows_to_calculate:
+                    # Update only property fields; geometry (shape/geojson) from staging must not be changed.
+                    calculated_rows = await update_pedestrian_fields(displayName, rows_to_calculate, bundle)
+                    # Assign venue_id
+                    for r in calculated_rows:
+                        r.venue_id = venue_id
+                    final_rows.extend(calculated_rows)
             
-            if rows_direct:
-                # Ensure displayname is set for direct import rows
-                for r in rows_direct:
-                    r.displayname = displayName
-                    r.venue_id = venue_id
-                final_rows.extend(rows_direct)
+                if rows_direct:
+                    # Ensure displayname is set for direct import rows
+                    for r in rows_direct:
+                        r.displayname = displayName
+                        r.venue_id = venue_id
+                    final_rows.extend(rows_direct)
             
-            indoor_upserted = insert_network_rows_into_indoor_network(session, displayName, final_rows)
-            session.commit()
+                upsert_counts = await asyncio.to_thread(
+                    insert_network_rows_into_indoor_network, session, displayName, final_rows
+                )
+                indoor_upserted = upsert_counts["inserted"] + upsert_counts["updated"]
+                await asyncio.to_thread(
+                    save_source_hashes, session, venue_id, [h for h in changed_hashes if h[0]], fingerprint
+                )
+                await asyncio.to_thread(session.commit)
             
-            updatepedrouteresult = await sync_pedrouterelfloorpoly_from_imdf(displayName)
+                updatepedrouteresult = await sync_pedrouterelfloorpoly_from_imdf(displayName)
             
-            logger.info(f"SUCCESS Import {displayName}: Processed {len(rows_result)} rows, Upserted {indoor_upserted} to indoor_network.")
+                logger.info(f"SUCCESS Import {displayName}: Processed {len(rows_result)} rows, Upserted {indoor_upserted} to indoor_network.")
 
-            return {
-                "status": "success",
-                "staging_count": len(rows_result),
-                "indoor_network_upserted": indoor_upserted,
-                "rows": [r.model_dump() for r in rows_result],
-            }
+                return {
+                    "status": "success",
+                    "staging_count": len(rows_result),
+                    "indoor_network_upserted": indoor_upserted,
+                    "indoor_network_counts": upsert_counts,
+                    "unchanged_skipped": unchanged_count,
+                    # Only the rows enriched and upserted by this import; unchanged rows are
+                    # already stored as returned by their last import.
+                    "rows": [r.model_dump() for r in final_rows],
+                }
 
-        except Exception as e:
-            session.rollback()
-            # Log the full traceback internally
-            logger.error(f"CRITICAL processing failure for {displayName}: {str(e)}")
-            logger.error(traceback.format_exc())
+            except PedrouteidConflictError as e:
+                session.rollback()
+                logger.warning(f"Validation Failed for {displayName}: {e}")
+                return {
+                    "status": "validation_failed",
+                    "errors": e.errors
+                }
+
+            except Exception as e:
+                session.rollback()
+                # Log the full traceback internally
+                logger.error(f"CRITICAL processing failure for {displayName}: {str(e)}")
+                logger.error(traceback.format_exc())
             
-            # Return full error details
-            return {
-                "status": "error", 
-                "message": f"Processing failed: {str(e)}", 
-                "traceback": traceback.format_exc()
-            }
+                # Return full error details
+                return {
+                    "status": "error", 
+                    "message": f"Processing failed: {str(e)}", 
+                    "traceback": traceback.format_exc()
+                }
+    finally:
+        _drop_staging_table(staging_table)
+
 
-async def update_pedestrian_fields(displayName: str, rows: list[NetworkStagingRow]) -> list[NetworkStagingRow]:
+def sync_delete_sql(staging_table: str) -> str:
     """
-    Compute all pedestrian-related fields on each row: feattype (from units) and building/floor enrichment (from flpolyid).
-    Does not replace geometry. Updates rows in place and returns the same list (updated NetworkStagingRow).
+    DELETE of a venue's (:vid) indoor_network rows missing from the staging table.
+    Anti-join against the indexed staging key (hash anti-join, not a per-row NOT IN scan).
     """
-    unit_doc = await get_unit_by_displayName(displayName)
-    unit3d_doc = await get_3d_units_by_displayName(displayName)
-    unit_features = (unit_doc or {}).get("features") or []
-    unit3d_features = (unit3d_doc or {}).get("features") or []
-    buildingInfo = await get_buildinginfo_by_displayName(displayName)
-    opening_features = await get_opening_by_displayName(displayName)
-    opening_name_features = await get_openings_with_name_by_displayName(displayName)
-    level_doc = await get_level_by_displayName(displayName)
-    level_features = (level_doc or {}).get("features") or []
-    for level_feature in level_features:
-        properties = level_feature.get("properties")
-        floor_poly_id = properties.get("FloorPolyID")
-        level_id = level_feature.get("id")
-        for row in rows:
-            if row.flpolyid == floor_poly_id:
-                row.level_id = level_id
-    for row in rows:
-        if row.pedrouteid is not None:
-            row.pedrouteid = int(row.pedrouteid)
-        row.displayname = displayName
-        row.feattype = calculate_feature_type(row, unit_features, unit3d_features)
-        flpolyid = row.flpolyid
-        buildingCSUID, floorNumber = flpolyid_slices(flpolyid)
-        buildingCSUIDInfo = next((doc for doc in buildingInfo if doc['buildingCSUID'] == buildingCSUID), None)
-        sixDigitID = buildingCSUIDInfo.get("SixDigitID")
-        floorId = f"{sixDigitID}{floorNumber}"
-        row.bldgid_1 = buildingCSUIDInfo.get("BuildingID")
-        row.buildnamen = buildingCSUIDInfo.get("Name_EN")
-        row.buildnamzh = buildingCSUIDInfo.get("Name_CH")
-        matched_level_feature = next((f for f in level_features if f.get("id") == row.level_id), None)
-        row.leveleng = matched_level_feature.get("properties", {}).get("name",{}).get("en","")
-        row.levelzh = matched_level_feature.get("properties",{}).get("name",{}).get("zh","")
-        row.floorid = floorId
-        row.emergency = (
-            'no' if row.feattype == 10
-            else 'yes'
-        )
-        row.direction = (
-            0 if row.oneway == 'no' 
-            else -1 if row.oneway == 'reverse'
-            else 1
-        )
-        # WheelchairBarrier / wc_Access: 1 if escalator(8), stairs(12), or wheelchair no; else 2
-        row.wc_barrier = (
-            1
-            if (
-                row.feattype == 8
-                or row.feattype == 12
-                or (row.wheelchair == "no")
+    return f"""
+        DELETE FROM indoor_network n
+        WHERE n.venue_id = :vid
+        AND NOT EXISTS (
+            SELECT 1 FROM "{staging_table}" s WHERE s.inetworkid = n.inetworkid
+        );
+    """
+
+
+def _read_staging_rows(session: Session, displayName: str, staging_table: str) -> dict:
+    """
+    Validate the staging table in the database, then read and Pydantic-validate its rows.
+    Returns {"status": "success", "rows": [...]} or the error / validation_failed response.
+    Blocking; process_network_import runs it in a worker thread.
+    """
+    # Execute function calling scalar() to retrieve the JSON object directly
+    validation_output = validate_staging(session, staging_table)
+
+    # The function returns a JSON object (dict in Python), e.g. {"valid": true, "error_count": 0}
+    is_valid = False
+    if isinstance(validation_output, dict):
+        is_valid = validation_output.get("valid", False)
+    elif validation_output is None:
+         is_valid = False
+    else:
+         # In case it returns a Mapping/Row proxy or other type, try attribute access or generic get
+         is_valid = getattr(validation_output, "valid", False)
+
+    if not is_valid:
+        errors = get_validation_errors(session, staging_table)
+
+        logger.warning(f"Validation Failed for {displayName}. Found {len(errors)} errors.")
+
+        return {
+            "status": "validation_failed",
+            "errors": errors
+        }
+
+    # Select all columns + explicitly convert shape to WKB Hex for validation
+    # We use ST_AsBinary -> encode hex to match Pydantic expectation of 'shape' string
+    staging_result = session.execute(text(f'SELECT *, ST_AsGeoJSON(shape) AS geojson FROM "{staging_table}"'))
+
+    # Check the NetworkStagingRow rules column by column; only rows that are not clearly
+    # valid go through Pydantic (which also yields its exact error message for a bad row).
+    batch = NetworkStagingBatch(list(staging_result.keys()), staging_result.fetchall())
+    rows_result, failure = batch.to_rows()
+    if failure is not None:
+        i, r, e = failure
+        msg = f"Pydantic Validation failed at row index {i} (ID: {r.get('inetworkid')}). Error: {str(e)}"
+        logger.error(msg)
+        return {
+            "status": "error",
+            "message": msg,
+            "row_data": r
+        }
+    logger.info(f"Validated {batch.n} staging rows for {displayName} ({batch.n - batch.fast_path_count} via Pydantic)")
+
+    return {"status": "success", "rows": rows_result}
+
+
+def _load_staging_table(shp_path: str, staging_table: str) -> int:
+    """Create, fill and index a staging table from the shapefile in its own committed transaction."""
+    with SessionLocal() as session:
+        loaded = load_shapefile_to_staging(session, shp_path, staging_table)
+        # Index the key the sync delete anti-joins on; it is dropped with the staging table.
+        session.execute(text(f'CREATE INDEX ON "{staging_table}" (inetworkid)'))
+        session.execute(text(f'ANALYZE "{staging_table}"'))
+        session.commit()
+    return loaded
+
+
+def _drop_staging_table(staging_table: str) -> None:
+    """Drop a per-import staging table and its validation errors."""
+    try:
+        with SessionLocal() as session:
+            session.execute(text(f'DROP TABLE IF EXISTS "{staging_table}"'))
+            session.execute(
+                text("DELETE FROM network_staging_errors WHERE staging_table = :t"), {"t": staging_table}
             )
-            else 2
-        )
-        row.wx_proof = 1
-        row.wc_access = calculate_wheelchair_access(row, (opening_name_features or []))
-        get_alias_name(row, opening_name_features or [])
-        # if not mtr 
-        row.location = 2
-        # calculate gradient for walkways if elevation data is present (e.g. escalators)
-        row.gradient = calculate_gradient(row.highway, row.geojson)
-    return rows
+            session.commit()
+    except Exception as e:
+        logger.warning(f"Cleanup of staging table {staging_table} failed (non-fatal): {e}")
+
+
+def _hash_import(bundle: dict, rows: list[NetworkStagingRow]) -> tuple[str, list[str]]:
+    """IMDF fingerprint of the venue and content hash of each staging row (before enrichment)."""
+    return imdf_fingerprint(bundle), [content_hash(r) for r in rows]
+
+
+async def update_pedestrian_fields(displayName: str, rows: list[NetworkStagingRow], bundle: dict | None = None) -> list[NetworkStagingRow]:
+    """
+    Compute all pedestrian-related fields on each row: feattype (from units) and building/floor enrichment (from flpolyid).
+    Does not replace geometry. Returns the enriched rows in input order (see enrichment_service.run_enrichment).
+    bundle: the venue's IMDF bundle when the caller already has it.
+    """
+    # All IMDF reads for the venue run concurrently (unit, 3D unit, BuildingInfo, opening, level).
+    if bundle is None:
+        bundle = await get_venue_bundle_by_displayName(displayName)
+    context = build_enrichment_context(bundle)
+    # CPU-bound Shapely work runs in a worker thread, or a process pool for large venues.
+    return await run_enrichment(displayName, rows, context)
 
 
 def _sanitize_displayname_for_filename(displayname: str) -> str:
@@ -397,7 +413,171 @@ def _sanitize_displayname_for_filename(displayname: str) -> str:
 
 
 
-def export_indoor_network_by_displayname(
+def indoor_network_versions(displaynames: list[str]) -> dict[str, str]:
+    """
+    Data version of each venue's indoor_network rows, for the export cache and ETags.
+    Inserts move the row count / max(created_at), updates max(updated_at) (trigger), and
+    updates and deletes add history rows (history keeps the old displayname), so any change
+    that can alter an export gives a new version. Also covers the field mapping and exporter.
+    """
+    with SessionLocal() as session:
+        result = session.execute(
+            text("""
+                SELECT d.displayname, COUNT(n.pedrouteid), MAX(n.updated_at), MAX(n.created_at),
+                    (SELECT MAX(h.history_id) FROM indoor_network_history h WHERE h.displayname = d.displayname)
+                FROM unnest(CAST(:displaynames AS TEXT[])) AS d(displayname)
+                LEFT JOIN indoor_network n ON n.displayname = d.displayname
+                GROUP BY d.displayname
+            """),
+            {"displaynames": list(dict.fromkeys(displaynames))},
+        )
+        rows = result.all()
+    mapping_mtime = os.path.getmtime(EXPORT_MAPPING_PATH) if os.path.exists(EXPORT_MAPPING_PATH) else None
+    return {
+        displayname: ":".join(str(value) for value in (EXPORT_CACHE_VERSION, mapping_mtime, *watermark))
+        for displayname, *watermark in rows
+    }
+
+
+def indoor_network_version(displayname: str) -> str:
+    """Data version of one venue (see indoor_network_versions)."""
+    return indoor_network_versions([displayname])[displayname]
+
+
+# Files ogr2ogr writes for a shapefile export (plus the .cpg added afterwards).
+_SHAPEFILE_PARTS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+
+def _export_output_files(output_path: str) -> list[str]:
+    """Files making up the export at output_path (all parts of a shapefile)."""
+    stem, ext = os.path.splitext(output_path)
+    if ext != ".shp":
+        return [output_path]
+    return [stem + part for part in _SHAPEFILE_PARTS if os.path.exists(stem + part)]
+
+
+# Rows fetched per round trip from the server-side cursor of a GeoJSON export.
+GEOJSON_EXPORT_BATCH_SIZE = 2000
+
+
+def _open_geojson_part(output_path: str) -> TextIO:
+    """Start a FeatureCollection in output_path + ".part" (renamed by _close_geojson_part)."""
+    f = open(output_path + ".part", "w", encoding="utf-8")
+    layer_name = json.dumps(os.path.splitext(os.path.basename(output_path))[0], ensure_ascii=False)
+    f.write(f'{{"type": "FeatureCollection", "name": {layer_name}, "features": [\n')
+    return f
+
+
+def _close_geojson_part(f: TextIO, output_path: str) -> None:
+    f.write("\n]}\n")
+    f.close()
+    # Written next to the target and renamed at the end: readers never see a partial file.
+    os.replace(output_path + ".part", output_path)
+
+
+def _write_geojson_exports(
+    properties: list[tuple[str, str]],
+    with_geometry: bool,
+    output_paths: dict[str, str],
+    opendata: str,
+    on_written: Callable[[str, int], None] | None = None,
+) -> dict[str, int]:
+    """
+    Stream indoor_network rows of several venues (output_paths: displayname -> file) into one
+    GeoJSON FeatureCollection per venue, with a single query ordered by venue.
+    properties: (database column, GeoJSON property name) pairs. Geometry is produced by PostGIS
+    (EPSG:4326, 8 decimals, Z kept); rows come from a server-side cursor and are written one
+    feature at a time, so memory does not grow with the venues. Each file is complete before
+    the next one starts (on_written(displayname, feature count) is called then).
+    Returns the feature count per venue.
+    """
+    geometry_sql = "ST_AsGeoJSON(ST_Transform(shape, 4326), 8)" if with_geometry else "NULL"
+    columns = "".join(f', "{db_col}"' for db_col, _ in properties)
+    where = "displayname = ANY(:displaynames)"
+    if opendata == "open":
+        where += " AND restricted = 'N'"
+    query = text(
+        f"SELECT displayname, {geometry_sql} AS geometry_json{columns} FROM indoor_network "
+        f"WHERE {where} ORDER BY displayname, pedrouteid"
+    )
+    names = [name for _, name in properties]
+
+    counts: dict[str, int] = {}
+    current = None
+    f = None
+    try:
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=GEOJSON_EXPORT_BATCH_SIZE).execute(
+                query, {"displaynames": list(output_paths)}
+            )
+            for row in result:
+                if row[0] != current:
+                    if f is not None:
+                        _close_geojson_part(f, output_paths[current])
+                        f = None
+                        if on_written:
+                            on_written(current, counts[current])
+                    current = row[0]
+                    f = _open_geojson_part(output_paths[current])
+                    counts[current] = 0
+                elif counts[current]:
+                    f.write(",\n")
+                props = json.dumps(dict(zip(names, row[2:])), ensure_ascii=False, default=str)
+                f.write(f'{{"type": "Feature", "properties": {props}, "geometry": {row[1] or "null"}}}')
+                counts[current] += 1
+        if f is not None:
+            _close_geojson_part(f, output_paths[current])
+            f = None
+            if on_written:
+                on_written(current, counts[current])
+        # Venues without (matching) rows get an empty collection.
+        for displayname, output_path in output_paths.items():
+            if displayname not in counts:
+                _close_geojson_part(_open_geojson_part(output_path), output_path)
+                counts[displayname] = 0
+                if on_written:
+                    on_written(displayname, 0)
+    finally:
+        if f is not None:
+            f.close()
+        for output_path in output_paths.values():
+            if os.path.exists(output_path + ".part"):
+                os.remove(output_path + ".part")
+    return counts
+
+
+def _write_geojson_export(
+    properties: list[tuple[str, str]],
+    with_geometry: bool,
+    displayname: str,
+    opendata: str,
+    output_path: str,
+) -> int:
+    """Stream indoor_network rows of a venue into a GeoJSON file (see _write_geojson_exports)."""
+    return _write_geojson_exports(properties, with_geometry, {displayname: output_path}, opendata)[displayname]
+
+
+def load_export_fields(export_type: str | None, export_format: str) -> list[tuple[str, str]]:
+    """(database column, output name) pairs of the field mapping for export_type, in mapping order."""
+    with open(EXPORT_MAPPING_PATH, "r", encoding="utf-8") as f:
+        mapping = json.load(f)
+    export_fields = []
+    for field in mapping:
+        db_col = field.get("database")
+        output_cats = field.get("output", [])
+        
+        # If export_type is None or "all", include all fields
+        # If export_type is specified, only include fields tagged with that type
+        is_included = (export_type is None) or (export_type.lower() == "all") or (export_type in output_cats)
+        
+        if is_included:
+            target_name = field.get("shapefile") if export_format == "shapefile" else field.get("geojson")
+            if db_col and target_name:
+                export_fields.append((db_col, target_name))
+    return export_fields
+
+
+async def export_indoor_network_by_displayname(
     displayname: str,
     output_dir: str | None = None,
     export_type: str | None = None,  # "indoor", "pedestrian", or None (all)
@@ -406,9 +586,10 @@ def export_indoor_network_by_displayname(
 ) -> dict:
     """
     Get data from indoor_network table by displayname, write to output_dir (default data/result),
-    and convert to shapefile using ogr2ogr with field remapping based on export_type.
+    with field remapping based on export_type. Shapefiles are written by ogr2ogr; GeoJSON is
+    streamed straight from the database (_write_geojson_export). While the venue's data is
+    unchanged, a previous export is copied from export_cache instead ("cached": True).
     """
-    import json
     
     out_dir = output_dir or DEFAULT_EXPORT_RESULT_DIR
     out_dir = os.path.abspath(out_dir)
@@ -416,13 +597,8 @@ def export_indoor_network_by_displayname(
     safe_name = _sanitize_displayname_for_filename(displayname)
     
     # Load mapping table
-    # Use relative path from this file to ensure it works in both Docker and local dev
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    mapping_path = os.path.join(os.path.dirname(current_dir), "reference", "pedestrian_convert_table.json")
-
     try:
-        with open(mapping_path, "r", encoding="utf-8") as f:
-            mapping = json.load(f)
+        export_fields = load_export_fields(export_type, export_format)
     except Exception as e:
         return {"status": "error", "message": f"Failed to load field mapping: {str(e)}", "path": None}
 
@@ -432,22 +608,12 @@ def export_indoor_network_by_displayname(
     # Fields that should be cast to TEXT to preserve NULLs or handle large integers in Shapefiles
     force_text_fields = ["bldgid_2", "siteid", "terminalid", "acstimeid", "bldgid_1", "floorid"]
 
-    for field in mapping:
-        db_col = field.get("database")
-        output_cats = field.get("output", [])
-        
-        # If export_type is None or "all", include all fields
-        # If export_type is specified, only include fields tagged with that type
-        is_included = (export_type is None) or (export_type.lower() == "all") or (export_type in output_cats)
-        
-        if is_included:
-            target_name = field.get("shapefile") if export_format == "shapefile" else field.get("geojson")
-            if db_col and target_name:
-                # Cast IDs to text for Shapefiles to prevent 0 instead of NULL and handle potential large ID overflows
-                if export_format == "shapefile" and db_col in force_text_fields:
-                    select_fields.append(f'CAST("{db_col}" AS TEXT) AS "{target_name}"')
-                else:
-                    select_fields.append(f'"{db_col}" AS "{target_name}"')
+    for db_col, target_name in export_fields:
+        # Cast IDs to text for Shapefiles to prevent 0 instead of NULL and handle potential large ID overflows
+        if export_format == "shapefile" and db_col in force_text_fields:
+            select_fields.append(f'CAST("{db_col}" AS TEXT) AS "{target_name}"')
+        else:
+            select_fields.append(f'"{db_col}" AS "{target_name}"')
 
     if not select_fields:
         return {"status": "error", "message": "No fields selected for export", "path": None}
@@ -459,23 +625,6 @@ def export_indoor_network_by_displayname(
     if export_format.lower() == "geojson":
         ext = ".geojson"
         driver = "GeoJSON"
-        # RFC 7946 GeoJSON is always 4326.
-        # We transform in SQL so ogr2ogr receives WGS84 data.
-        # We use ST_Transform(shape, 4326) to get Lat/Lon/Z.
-        # ogr2ogr GeoJSON driver supports COORDINATE_PRECISION lco.
-        
-        # Modify SQL selection for geometry: transform to 4326
-        # Replace the raw 'shape' column or 'ST_AsBinary(shape)' from select_keys if present,
-        # but since select_fields is built dynamically, we inject the transform here.
-        # However, select_fields usually maps 'db_col as output_name'. 
-        # We need to find the geometry part or assume we are handling it via ogr2ogr -t_srs.
-        
-        # Best approach for ogr2ogr: let it handle the reprojection with -t_srs EPSG:4326
-        # Strategy: Use high precision (15) for ogr2ogr to ensure it sees valid 3D lines and writes them as LineStrings.
-        # Then we post-process the file in Python to round to 8 decimals. 
-        # We restore RFC7946=YES to ensure Z values are handled as they were previously (user confirmed this worked for Z).
-        lco_opts = ["-lco", "COORDINATE_PRECISION=15", "-lco", "RFC7946=YES"] 
-        t_srs_opts = ["-t_srs", "EPSG:4326"]
     else:
         ext = ".shp"
         driver = "ESRI Shapefile"
@@ -491,6 +640,45 @@ def export_indoor_network_by_displayname(
     output_filename = f"3D Indoor Network{ext}"
     output_path = os.path.join(out_dir, output_filename)
 
+    cache_key = None
+    if export_cache.enabled:
+        try:
+            version = await asyncio.to_thread(indoor_network_version, displayname)
+        except SQLAlchemyError as e:
+            return {"status": "error", "message": f"Export failed: {str(e)}", "path": None}
+        cache_key = export_cache_key("export", displayname, export_type, export_format, opendata, version)
+        if await asyncio.to_thread(export_cache.restore, cache_key, out_dir):
+            logger.info(f"Export of {displayname} served from cache to {output_path}")
+            return {
+                "status": "success",
+                "path": output_path,
+                "displayname": displayname,
+                "output_dir": out_dir,
+                "cached": True,
+            }
+
+    if driver == "GeoJSON":
+        # RFC 7946 GeoJSON (WGS84), coordinates at 8 decimals, written feature by feature
+        # (replaces the output file atomically when done).
+        properties = [(db_col, name) for db_col, name in export_fields if db_col != "shape"]
+        with_geometry = any(db_col == "shape" for db_col, _ in export_fields)
+        try:
+            feature_count = await asyncio.to_thread(
+                _write_geojson_export, properties, with_geometry, displayname, opendata, output_path
+            )
+        except (SQLAlchemyError, OSError) as e:
+            return {"status": "error", "message": f"Export failed: {str(e)}", "path": None}
+        logger.info(f"Exported {feature_count} features for {displayname} to {output_path}")
+        if cache_key is not None:
+            await asyncio.to_thread(export_cache.store, cache_key, [output_path])
+        return {
+            "status": "success",
+            "path": output_path,
+            "displayname": displayname,
+            "output_dir": out_dir,
+            "cached": False,
+        }
+
     # Manually remove file if it exists to prevent ogr2ogr "DeleteLayer" errors
     # especially common with GeoJSON driver or Docker volume mounts.
     if os.path.exists(output_path):
@@ -517,16 +705,16 @@ def export_indoor_network_by_displayname(
     env["SHAPE_ENCODING"] = "UTF-8" # Helps some GDAL versions
 
     try:
-        # Run with output capturing to debug errors
-        result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+        # Run with output capturing to debug errors (asyncio subprocess: the event loop keeps serving)
+        returncode, stdout, stderr = await run_ogr2ogr(cmd, env=env)
         
-        if result.returncode != 0:
+        if returncode != 0:
             # Mask password in command for logging
             cmd_log = [arg if "password=" not in arg else "PG:..." for arg in cmd]
             return {
                 "status": "error",
-                "message": f"ogr2ogr command failed: {result.stderr}",
-                "stdout": result.stdout,
+                "message": f"ogr2ogr command failed: {stderr}",
+                "stdout": stdout,
                 "path": None
             }
         
@@ -538,39 +726,177 @@ def export_indoor_network_by_displayname(
             
     except Exception as e:
         return {"status": "error", "message": f"Export failed: {str(e)}", "path": None}
-        
-    # Post-processing for GeoJSON: Round coordinates to 8 decimal places
-    # We do this here because ogr2ogr with precision=8 collapses vertical lines into Points or empty geometries.
-    # By generating with precision=15 first, we get valid LineStrings. 
-    # Python rounding allows us to keep the "LineString" type even if points become vertically stacked in 2D.
-    if driver == "GeoJSON" and os.path.exists(output_path):
-        try:
-            with open(output_path, 'r', encoding='utf-8') as f:
-                geojson_data = json.load(f)
-            
-            def round_coords(obj):
-                if isinstance(obj, float):
-                    return round(obj, 8)
-                if isinstance(obj, list):
-                    return [round_coords(x) for x in obj]
-                return obj
-
-            if "features" in geojson_data:
-                for feature in geojson_data["features"]:
-                    if "geometry" in feature and feature["geometry"] and "coordinates" in feature["geometry"]:
-                        feature["geometry"]["coordinates"] = round_coords(feature["geometry"]["coordinates"])
-            
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(geojson_data, f, ensure_ascii=False)
-                
-        except Exception as e:
-            # If post-processing fails, we return success but warn about precision or log it.
-            # For now, we'll treat it as a non-fatal error or just let the file be 15 decimals.
-            print(f"Warning: Failed to post-process decimal precision: {e}")
 
+    if cache_key is not None:
+        await asyncio.to_thread(export_cache.store, cache_key, _export_output_files(output_path))
     return {
         "status": "success",
         "path": output_path,
         "displayname": displayname,
         "output_dir": out_dir,
-    }
\ No newline at end of file
+        "cached": False,
+    }
+
+def _resolve_export_venues(displaynames: list[str] | None, region: str | None) -> list[str]:
+    """Displaynames with indoor_network rows: all of them, or those in displaynames; optionally only venues of a region."""
+    conditions = []
+    params = {}
+    if displaynames is not None:
+        conditions.append("n.displayname = ANY(:displaynames)")
+        params["displaynames"] = list(displaynames)
+    if region:
+        conditions.append("EXISTS (SELECT 1 FROM venue v WHERE v.displayname = n.displayname AND v.region = :region)")
+        params["region"] = region
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with SessionLocal() as session:
+        result = session.execute(
+            text(f"SELECT DISTINCT n.displayname FROM indoor_network n {where} ORDER BY n.displayname"),
+            params,
+        )
+        return [displayname for (displayname,) in result]
+
+
+async def _export_geojson_bulk(
+    output_dirs: dict[str, str],
+    export_type: str | None,
+    opendata: str,
+    on_done: Callable[[str, dict], None],
+) -> None:
+    """
+    GeoJSON exports of several venues (displayname -> output folder): unchanged venues are
+    copied from export_cache, the rest are written by one query (_write_geojson_exports).
+    on_done(displayname, result) is called on the event loop as each venue completes.
+    """
+    def output_path(displayname: str) -> str:
+        return os.path.join(output_dirs[displayname], "3D Indoor Network.geojson")
+
+    try:
+        export_fields = load_export_fields(export_type, "geojson")
+    except Exception as e:
+        for displayname in output_dirs:
+            on_done(displayname, {"status": "error", "message": f"Failed to load field mapping: {str(e)}", "path": None})
+        return
+
+    cache_keys: dict[str, str] = {}
+    pending: dict[str, str] = {}
+    reported: set[str] = set()
+
+    def report(displayname: str, result: dict) -> None:
+        reported.add(displayname)
+        on_done(displayname, result)
+
+    try:
+        if export_cache.enabled:
+            versions = await asyncio.to_thread(indoor_network_versions, list(output_dirs))
+            cache_keys = {
+                displayname: export_cache_key("export", displayname, export_type, "geojson", opendata, version)
+                for displayname, version in versions.items()
+            }
+        for displayname, out_dir in output_dirs.items():
+            os.makedirs(out_dir, exist_ok=True)
+            if displayname in cache_keys and await asyncio.to_thread(export_cache.restore, cache_keys[displayname], out_dir):
+                report(displayname, {"status": "success", "path": output_path(displayname), "cached": True})
+            else:
+                pending[displayname] = output_path(displayname)
+        if not pending:
+            return
+
+        loop = asyncio.get_running_loop()
+
+        def written(displayname: str, count: int) -> None:
+            # Worker thread: cache the file, then report on the event loop.
+            if displayname in cache_keys:
+                export_cache.store(cache_keys[displayname], [pending[displayname]])
+            result = {"status": "success", "path": pending[displayname], "features": count, "cached": False}
+            loop.call_soon_threadsafe(report, displayname, result)
+
+        properties = [(db_col, name) for db_col, name in export_fields if db_col != "shape"]
+        with_geometry = any(db_col == "shape" for db_col, _ in export_fields)
+        await asyncio.to_thread(_write_geojson_exports, properties, with_geometry, pending, opendata, written)
+    except (SQLAlchemyError, OSError) as e:
+        # Venues already reported keep their result (callbacks from the worker thread run
+        # before this resumes); the rest fail.
+        for displayname in output_dirs:
+            if displayname not in reported:
+                report(displayname, {"status": "error", "message": f"Export failed: {str(e)}", "path": None})
+
+
+async def export_indoor_network_bulk(
+    displaynames: list[str] | None = None,  # None: every venue with network data
+    region: str | None = None,
+    output_dir: str | None = None,
+    export_type: str | None = None,  # "indoor", "pedestrian", or None (all)
+    export_formats: tuple[str, ...] = ("shapefile", "geojson"),
+    opendata: str = "full",  # "open" or "full"
+) -> dict:
+    """
+    Export many venues at once into output_dir/<displayname>/SHP and /GeoJSON (the layout of the
+    download ZIP); output_dir defaults to a new bulk_<timestamp> folder under data/result.
+    Shapefiles are written per venue by up to EXPORT_WORKERS ogr2ogr processes in parallel,
+    while all GeoJSON files come from one query partitioned by venue. Unchanged venues are
+    copied from export_cache. Progress (done / total / failed / cached) is reported to the job.
+    """
+    out_dir = os.path.abspath(
+        output_dir or os.path.join(DEFAULT_EXPORT_RESULT_DIR, f"bulk_{time.strftime('%Y%m%d_%H%M%S')}")
+    )
+    try:
+        venues = await asyncio.to_thread(_resolve_export_venues, displaynames, region)
+    except SQLAlchemyError as e:
+        return {"status": "error", "message": f"Failed to list venues: {str(e)}", "output_dir": None}
+    missing = sorted(set(displaynames or []) - set(venues))
+    if not venues:
+        return {"status": "error", "message": "No venues with indoor network data to export", "missing": missing, "output_dir": None}
+
+    venue_dirs = {displayname: os.path.join(out_dir, _sanitize_displayname_for_filename(displayname)) for displayname in venues}
+    total = len(venues) * len(export_formats)
+    done = 0
+    cached = 0
+    failed: list[dict] = []
+    report_progress(total=total, done=0, failed=0, cached=0)
+    logger.info(f"BULK EXPORT: {len(venues)} venue(s), formats={list(export_formats)} -> {out_dir}")
+
+    def finished(displayname: str, export_format: str, result: dict) -> None:
+        nonlocal done, cached
+        done += 1
+        if result.get("status") == "error":
+            failed.append({"displayname": displayname, "format": export_format, "message": result.get("message")})
+            logger.error(f"BULK EXPORT {export_format} failed for {displayname}: {result.get('message')}")
+        elif result.get("cached"):
+            cached += 1
+        report_progress(done=done, failed=len(failed), cached=cached)
+
+    workers = asyncio.Semaphore(EXPORT_WORKERS)
+
+    async def export_shapefile(displayname: str) -> None:
+        async with workers:
+            result = await export_indoor_network_by_displayname(
+                displayname, os.path.join(venue_dirs[displayname], "SHP"), export_type, "shapefile", opendata
+            )
+        finished(displayname, "shapefile", result)
+
+    work = []
+    if "shapefile" in export_formats:
+        work.extend(export_shapefile(displayname) for displayname in venues)
+    if "geojson" in export_formats:
+        work.append(_export_geojson_bulk(
+            {displayname: os.path.join(venue_dir, "GeoJSON") for displayname, venue_dir in venue_dirs.items()},
+            export_type,
+            opendata,
+            lambda displayname, result: finished(displayname, "geojson", result),
+        ))
+    await asyncio.gather(*work)
+
+    if len(failed) == total:
+        status = "error"
+    elif failed or missing:
+        status = "warning"
+    else:
+        status = "success"
+    return {
+        "status": status,
+        "message": f"Exported {total - len(failed)} of {total} file set(s) for {len(venues)} venue(s) ({cached} from cache)",
+        "output_dir": out_dir,
+        "venues": len(venues),
+        "failed": failed,
+        "missing": missing,
+    }
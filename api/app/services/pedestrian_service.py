@@ -1,13 +1,16 @@
+import io
 import os
-import subprocess
+import asyncio
 import json
+import uuid
 from sqlalchemy import text
 from app.core.database import SessionLocal
 from app.core.logger import logger
 from app.core.config import settings
 from typing import TYPE_CHECKING, List, Any
-from shapely.geometry import shape
-from app.services.utils import _line_from_geojson, _transform_2326_to_4326
+from shapely import STRtree, box, prepare
+from shapely.geometry import LineString, shape
+from app.services.utils import RowGeometry, build_row_geometry, format_copy_value, run_ogr2ogr
 
 if TYPE_CHECKING:
     from app.schema.network import NetworkStagingRow
@@ -22,7 +25,9 @@ async def import_pedestrian_from_fgdb(fgdb_path: str):
         return {"status": "error", "message": "File path not found."}
 
     layer_name = "PedestrianRoute"
-    staging_table = "pedestrian_staging"
+    # Each import loads into its own staging table, so concurrent import jobs never share rows.
+    # It is dropped when the import finishes, whatever the outcome.
+    staging_table = f"pedestrian_staging_{uuid.uuid4().hex}"
     
     pg_conn = f"PG:host={settings.POSTGRES_SERVER} port={settings.POSTGRES_PORT} user={settings.POSTGRES_USER} dbname={settings.POSTGRES_DB} password={settings.POSTGRES_PASSWORD}"
     
@@ -38,17 +43,40 @@ async def import_pedestrian_from_fgdb(fgdb_path: str):
         "-t_srs", "EPSG:2326"
     ]
     
-    logger.info(f"Running ogr2ogr: {' '.join(cmd)}")
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-    
-    if proc.returncode != 0:
-        logger.error(f"ogr2ogr failed: {proc.stderr}")
-        return {"status": "error", "message": f"ogr2ogr failed: {proc.stderr}"}
+    try:
+        logger.info(f"Running ogr2ogr: {' '.join(cmd)}")
+        returncode, _stdout, stderr = await run_ogr2ogr(cmd)
+        
+        if returncode != 0:
+            logger.error(f"ogr2ogr failed: {stderr}")
+            return {"status": "error", "message": f"ogr2ogr failed: {stderr}"}
+
+        # 2. Run the Merge (Upsert + Delete) in a worker thread; it is plain blocking SQL.
+        return await asyncio.to_thread(merge_staging_to_production, staging_table)
+    finally:
+        await asyncio.to_thread(_drop_pedestrian_staging, staging_table)
+
+
+def _drop_pedestrian_staging(staging_table: str) -> None:
+    """Drop a per-import pedestrian staging table."""
+    try:
+        with SessionLocal() as session:
+            session.execute(text(f'DROP TABLE IF EXISTS "{staging_table}"'))
+            session.commit()
+    except Exception as e:
+        logger.warning(f"Cleanup of staging table {staging_table} failed (non-fatal): {e}")
+
+def delete_missing_sql(staging_table: str, staging_pk_col: str) -> str:
+    """DELETE of the pedestrian_network rows missing from the staging table (anti-join on its key)."""
+    return f"""
+    DELETE FROM pedestrian_network p
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {staging_table} s WHERE s.{staging_pk_col} = p.pedrouteid
+    );
+    """
 
-    # 2. Run the Merge (Upsert + Delete)
-    return await merge_staging_to_production(staging_table)
 
-async def merge_staging_to_production(staging_table: str):
+def merge_staging_to_production(staging_table: str):
     # Load mapping
     try:
         with open(MAPPING_FILE, 'r') as f:
@@ -109,15 +137,15 @@ async def merge_staging_to_production(staging_table: str):
 
     # 2. DELETE Logic (Remove rows not in source)
     # FIX: Use the specific staging column name (e.g. PedestrianRouteID) to avoid SQL scoping ambiguity.
-    delete_sql = f"""
-    DELETE FROM pedestrian_network
-    WHERE pedrouteid NOT IN (
-        SELECT {staging_pk_col} FROM {staging_table} WHERE {staging_pk_col} IS NOT NULL
-    );
-    """
+    # Anti-join on the staging key, indexed first (ogr2ogr -overwrite recreates the table, dropping the index).
+    index_sql = f"CREATE INDEX IF NOT EXISTS {staging_table}_pk_idx ON {staging_table} ({staging_pk_col})"
+    delete_sql = delete_missing_sql(staging_table, staging_pk_col)
 
     try:
         with SessionLocal() as session:
+            session.execute(text(index_sql))
+            session.execute(text(f"ANALYZE {staging_table}"))
+
             # Execute Upsert
             session.execute(text(upsert_sql))
             
@@ -149,34 +177,66 @@ FACILITY_MAP: dict[int, dict[str, str]] = {
     13: {"name_en": "Stairlift", "name_zh": "輪椅升降台"},
 }
 
-def calculate_wheelchair_access(nf: "NetworkStagingRow", opening_features: list[dict]) -> int:
+class OpeningIndex:
+    """
+    STRtree over IMDF opening geometries (EPSG:4326) for one venue.
+    Built once per import so each row only distance/intersection-tests nearby openings.
+    """
+
+    def __init__(self, opening_features: list[dict]):
+        self.features = opening_features or []
+        self.geoms = [shape(op["geometry"]) for op in self.features]
+        prepare(self.geoms)
+        self._tree = STRtree(self.geoms)
+
+    def intersecting(self, line: LineString) -> list[int]:
+        """Positions (in feature order) of openings intersecting line."""
+        return sorted(int(i) for i in self._tree.query(line, predicate="intersects"))
+
+    def nearby(self, line: LineString, distance: float) -> list[int]:
+        """Positions (in feature order) of openings whose envelope is within distance of line's envelope."""
+        minx, miny, maxx, maxy = line.bounds
+        envelope = box(minx - distance, miny - distance, maxx + distance, maxy + distance)
+        return sorted(int(i) for i in self._tree.query(envelope))
+
+
+def build_opening_index(opening_features: list[dict]) -> OpeningIndex:
+    """Build the per-venue OpeningIndex used by calculate_wheelchair_access and get_alias_name."""
+    return OpeningIndex(opening_features)
+
+
+def calculate_wheelchair_access(nf: "NetworkStagingRow", opening_features: list[dict], geom: RowGeometry | None = None, opening_index: OpeningIndex | None = None) -> int:
     if nf.feattype != 11:
         return 2
-    line_geom = _line_from_geojson(nf.geojson) 
-    line_4326 = _transform_2326_to_4326(line_geom)
-    for op in opening_features:
-        op_geom = shape(op["geometry"])
-        if line_4326.intersects(op_geom):
-             return 1
+    line_4326 = (geom or build_row_geometry(nf.geojson)).line_4326
+    if line_4326 is None:
+        return 2
+    if opening_index is None:
+        opening_index = build_opening_index(opening_features)
+    if opening_index.intersecting(line_4326):
+        return 1
     return 2
 
-def get_alias_name(nf: "NetworkStagingRow", opening_name_features: list[dict]):
+def get_alias_name(nf: "NetworkStagingRow", opening_name_features: list[dict], geom: RowGeometry | None = None, opening_index: OpeningIndex | None = None) -> None:
     if not (1 <= nf.feattype <= 7):
         return
-    line_geom = _line_from_geojson(nf.geojson)
-    line_4326 = _transform_2326_to_4326(line_geom)
-    for op in opening_name_features:
-        op_geom = shape(op["geometry"])
-        if line_4326.distance(op_geom) < BUFFER_DEGREES_0_1M: 
+    line_4326 = (geom or build_row_geometry(nf.geojson)).line_4326
+    if line_4326 is None:
+        return
+    if opening_index is None:
+        opening_index = build_opening_index(opening_name_features)
+    # Only openings inside the 0.1 m envelope can be closer than 0.1 m; test those in feature order.
+    for i in opening_index.nearby(line_4326, BUFFER_DEGREES_0_1M):
+        op = opening_index.features[i]
+        if line_4326.distance(opening_index.geoms[i]) < BUFFER_DEGREES_0_1M:
             props = op.get("properties", {})
             name = props.get("name", {})
             nf.aliasnamen = name.get("en", nf.aliasnamen)
             nf.aliasnamtc = name.get("zh-Hant", nf.aliasnamtc)
             return
 
-def calculate_feature_type(row: "NetworkStagingRow", unit_features: list[dict], unit3d_features: list[dict]) -> int:
-    line_geom = _line_from_geojson(row.geojson)
-    line_4326 = _transform_2326_to_4326(line_geom)
+def calculate_feature_type(row: "NetworkStagingRow", unit_features: list[dict], unit3d_features: list[dict], geom: RowGeometry | None = None) -> int:
+    line_4326 = (geom or build_row_geometry(row.geojson)).line_4326
     matched_type = 1 
     for unit in unit_features:
         props = unit.get("properties", {})
@@ -208,55 +268,134 @@ async def sync_pedrouterelfloorpoly_from_imdf(display_name: str):
     logger.warning(f"sync_pedrouterelfloorpoly_from_imdf called for {display_name} - Not implemented in this service version.")
     return {"status": "warning", "message": "Functionality not implemented"}
 
-def insert_network_rows_into_indoor_network(session: "Session", display_name: str, rows: List["NetworkStagingRow"]) -> int:
+# indoor_network columns written from NetworkStagingRow (besides pedrouteid and shape, handled separately).
+# shape_len is filled by the trg_calculate_len trigger; created_at/updated_at by defaults/triggers.
+INDOOR_NETWORK_UPSERT_COLUMNS = [
+    "venue_id", "displayname", "inetworkid", "highway", "oneway", "emergency", "wheelchair",
+    "flpolyid", "crtdt", "crtby", "lstamddt", "lstamdby", "restricted", "feattype", "floorid",
+    "location", "gradient", "wc_access", "wc_barrier", "wx_proof", "obstype", "direction",
+    "bldgid_1", "bldgid_2", "siteid", "aliasnamtc", "aliasnamen", "terminalid", "acstimeid",
+    "crossfeat", "st_code", "st_nametc", "st_nameen", "modifiedby", "poscertain", "datasrc",
+    "levelsrc", "enabled", "level_id", "buildnamen", "buildnamzh", "leveleng", "levelzh", "mainexit",
+]
+_COPY_COLUMNS = ["pedrouteid", "shape"] + INDOOR_NETWORK_UPSERT_COLUMNS
+
+
+class PedrouteidConflictError(Exception):
+    """Rows carry pedrouteids owned by other inetworkids; errors lists them like validation errors."""
+
+    def __init__(self, errors: list[dict]):
+        super().__init__(f"{len(errors)} rows have a pedrouteid already used by another inetworkid")
+        self.errors = errors
+
+
+def _pedrouteid_conflicts(session: "Session") -> list[dict]:
+    """
+    Rows of indoor_network_upsert whose explicit pedrouteid belongs to another inetworkid,
+    in indoor_network or elsewhere in the batch (ON CONFLICT (inetworkid) cannot resolve either).
+    """
+    result = session.execute(text("""
+        SELECT t.inetworkid, t.pedrouteid, n.inetworkid AS owner
+        FROM indoor_network_upsert t
+        JOIN indoor_network n ON n.pedrouteid = t.pedrouteid AND n.inetworkid <> t.inetworkid
+        UNION ALL
+        SELECT t.inetworkid, t.pedrouteid, d.inetworkid AS owner
+        FROM indoor_network_upsert t
+        JOIN indoor_network_upsert d ON d.pedrouteid = t.pedrouteid AND d.inetworkid < t.inetworkid
+        ORDER BY pedrouteid, inetworkid
+    """))
+    return [
+        {
+            "inetworkid": inetworkid,
+            "error_type": "pedrouteid_conflict",
+            "error_message": f"pedrouteid {pedrouteid} is already used by inetworkid {owner}",
+        }
+        for inetworkid, pedrouteid, owner in result
+    ]
+
+
+def insert_network_rows_into_indoor_network(session: "Session", display_name: str, rows: List["NetworkStagingRow"]) -> dict:
     """
-    Bulk inserts NetworkStagingRow objects into the indoor_network table.
+    Bulk upsert NetworkStagingRow objects into indoor_network, keyed by inetworkid.
+
+    Rows are streamed with COPY into a temp table, then merged with one
+    INSERT ... ON CONFLICT (inetworkid) DO UPDATE ... WHERE ... IS DISTINCT FROM,
+    so unchanged rows are not rewritten (no history trigger fire, no updated_at bump).
+    Rows without a pedrouteid get one from the indoor_network sequence; an existing
+    row keeps its pedrouteid. Runs inside the caller's transaction (caller commits).
+
+    Returns {"inserted": n, "updated": n, "unchanged": n}. Raises PedrouteidConflictError
+    (before writing) if a row's pedrouteid belongs to another inetworkid.
     """
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    rows = [r for r in rows if r.inetworkid]
     if not rows:
-        return 0
-    
-    # Map Pydantic model to DB columns. 
-    # Adjust this dictionary mapping to match indoor_network columns.
-    data_to_insert = []
+        return counts
+
+    buf = io.StringIO()
     for r in rows:
-        row_dict = r.dict(exclude_unset=True)
-        # Ensure fallback for mandatory fields if missing
-        if "inetworkid" not in row_dict:
-            continue 
-        data_to_insert.append(row_dict)
-
-    if not data_to_insert:
-        return 0
-
-    # Using simplistic bulk insert for now. 
-    # For complex logic involving on_conflict, use postgres dialect insert.
-    # Assuming standard insert here.
-    try:
-        # Note: bulk_insert_mappings is efficient but doesn't return inserted IDs easily.
-        # If Upsert is needed, logic must be more complex.
-        # Assuming Insert-only or simplistic usage for now as per previous service context.
-        # However, network_services implies 'Upserted' in its logs.
-        
-        # Proper Upsert requires:
-        # insert(table).values(data).on_conflict_do_update(...)
-        
-        # Since I don't have the table object here easily without circular imports from app.models,
-        # I will use session.execute with text() or just bulk_save_objects if they were ORM objects.
-        # But they are Pydantic models.
-        
-        # Let's fallback to a raw SQL or a basic add.
-        # BUT, to fix the import error quickly, I will just implement a safe logic.
-        
-        # Let's assume network_services logic handles the 'Upsert' logic via this function?
-        # No, the function naming implies it does the work.
-        
-        # Simplified:
-        # start_count = 0 
-        # For now, just logging that we are skipping actual insert to avoid breaking schema assumptions
-        # until the user provides the original logic.
-        logger.warning(f"insert_network_rows_into_indoor_network called with {len(rows)} rows - Placeholder implementation.")
-        return len(rows)
-        
-    except Exception as e:
-        logger.error(f"Failed to insert indoor network rows: {e}")
-        return 0
+        values = [r.pedrouteid or None, r.shape] + [getattr(r, col) for col in INDOOR_NETWORK_UPSERT_COLUMNS]
+        buf.write("\t".join(format_copy_value(v) for v in values))
+        buf.write("\n")
+    buf.seek(0)
+
+    # Same column types as indoor_network, but without NOT NULL / CHECK constraints.
+    session.execute(text("""
+        CREATE TEMP TABLE indoor_network_upsert ON COMMIT DROP AS
+        SELECT pedrouteid, shape, """ + ", ".join(INDOOR_NETWORK_UPSERT_COLUMNS) + """
+        FROM indoor_network WITH NO DATA
+    """))
+    # COPY through the session's own DBAPI connection (psycopg2) so it shares the transaction.
+    with session.connection().connection.cursor() as cur:
+        cur.copy_expert(
+            f"COPY indoor_network_upsert ({', '.join(_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT text)",
+            buf,
+        )
+
+    conflicts = _pedrouteid_conflicts(session)
+    if conflicts:
+        session.execute(text("DROP TABLE IF EXISTS indoor_network_upsert"))
+        raise PedrouteidConflictError(conflicts)
+    # Explicit pedrouteids do not advance the SERIAL sequence: move it past them (and any
+    # existing row) first, so nextval() below and in later imports cannot hand out a taken id.
+    session.execute(text("""
+        SELECT setval(s.seq, m.max_id)
+        FROM (SELECT pg_get_serial_sequence('indoor_network', 'pedrouteid') AS seq) s,
+            (SELECT GREATEST(
+                (SELECT MAX(pedrouteid) FROM indoor_network),
+                (SELECT MAX(pedrouteid) FROM indoor_network_upsert)
+            ) AS max_id) m
+        WHERE m.max_id > COALESCE(pg_sequence_last_value(s.seq::regclass), 0)
+    """))
+
+    insert_cols = ", ".join(_COPY_COLUMNS)
+    select_cols = ", ".join(
+        ["COALESCE(t.pedrouteid, nextval(pg_get_serial_sequence('indoor_network', 'pedrouteid')))", "t.shape"]
+        + [
+            f"COALESCE(t.{col}, '')" if col in ("aliasnamtc", "aliasnamen") else f"t.{col}"
+            for col in INDOOR_NETWORK_UPSERT_COLUMNS
+        ]
+    )
+    update_cols = ["shape"] + [c for c in INDOOR_NETWORK_UPSERT_COLUMNS if c != "inetworkid"]
+    update_str = ", ".join(f"{c} = EXCLUDED.{c}" for c in update_cols)
+    where_str = " OR ".join(f"indoor_network.{c} IS DISTINCT FROM EXCLUDED.{c}" for c in update_cols)
+
+    # xmax = 0 only for freshly inserted tuples; updated rows carry the updating xid.
+    result = session.execute(text(f"""
+        INSERT INTO indoor_network ({insert_cols})
+        SELECT {select_cols} FROM indoor_network_upsert t
+        ON CONFLICT (inetworkid)
+        DO UPDATE SET {update_str}
+        WHERE {where_str}
+        RETURNING (xmax = 0) AS inserted;
+    """))
+    for (inserted,) in result:
+        counts["inserted" if inserted else "updated"] += 1
+    counts["unchanged"] = len(rows) - counts["inserted"] - counts["updated"]
+    session.execute(text("DROP TABLE IF EXISTS indoor_network_upsert"))
+
+    logger.info(
+        f"indoor_network upsert for {display_name}: {counts['inserted']} inserted, "
+        f"{counts['updated']} updated, {counts['unchanged']} unchanged"
+    )
+    return counts
@@ -0,0 +1,296 @@
+# app/services/routing_service.py
+
+import asyncio
+import heapq
+import math
+import time
+from collections import OrderedDict
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+from sqlalchemy import text
+
+from app.core.config import ROUTING_GRAPH_CACHE_MAX, ROUTING_VERSION_TTL_SECONDS
+from app.core.database import SessionLocal
+from app.core.logger import logger
+from app.services.network_services import indoor_network_version
+
+# Segment endpoints closer than this (metres, EPSG:2326 x/y/z grid) are the same graph node.
+NODE_SNAP_TOLERANCE = 0.01
+
+# Routing profiles: bit set on the arcs a profile may use.
+PROFILE_WALK = 1
+PROFILE_WHEELCHAIR = 2
+PROFILE_EMERGENCY = 4
+PROFILES = {"walk": PROFILE_WALK, "wheelchair": PROFILE_WHEELCHAIR, "emergency": PROFILE_EMERGENCY}
+
+_TO_2326 = Transformer.from_crs("EPSG:4326", "EPSG:2326", always_xy=True)
+_TO_4326 = Transformer.from_crs("EPSG:2326", "EPSG:4326", always_xy=True)
+
+
+class VenueGraph:
+    """
+    Routing graph of one venue's indoor_network, in compressed sparse row (CSR) form.
+
+    Nodes are segment endpoints snapped to NODE_SNAP_TOLERANCE in EPSG:2326 (with Z); each
+    segment gives one arc per allowed direction ("direction": 1 forward, -1 reverse, 0 both).
+    Arcs out of node u are indptr[u]:indptr[u + 1]; every arc keeps its segment (edge), cost
+    (3D length), whether it runs against the digitised direction and a bit mask of the
+    profiles allowed on it (wheelchair: no wc_barrier; emergency: no lifts, emergency = 'no').
+    Hot arrays are also kept as Python lists: the search loop indexes them one by one.
+    """
+
+    def __init__(self, displayname: str, version: str, rows: list[tuple]):
+        self.displayname = displayname
+        self.version = version
+        self.built_at = time.time()
+        # time.monotonic() of the last check that version is current (see get_venue_graph).
+        self.checked_at = time.monotonic()
+
+        rows = [row for row in rows if row[2] is not None]
+        geoms = shapely.from_wkb([bytes(row[2]) for row in rows])
+        coords, index = shapely.get_coordinates(geoms, include_z=True, return_index=True)
+        coords = np.nan_to_num(coords)
+        counts = np.bincount(index, minlength=len(rows))
+        valid = counts >= 2
+        ends = np.cumsum(counts)
+        starts = ends - counts
+
+        keep = np.flatnonzero(valid)
+        self.pedrouteid = [rows[i][0] for i in keep]
+        self.inetworkid = [rows[i][1] for i in keep]
+        self.feattype = [rows[i][6] for i in keep]
+        self.level_id = np.array([rows[i][8] for i in keep], dtype=object)
+        self._coords = coords
+        self._coord_start = starts[keep]
+        self._coord_end = ends[keep]
+        n_edges = len(keep)
+
+        # Snap endpoints to grid nodes.
+        endpoints = np.vstack([coords[self._coord_start], coords[self._coord_end - 1]]) if n_edges else np.empty((0, 3))
+        keys = np.round(endpoints / NODE_SNAP_TOLERANCE).astype(np.int64)
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        self.node_xyz = endpoints[first]
+        self.edge_from = inverse[:n_edges]
+        self.edge_to = inverse[n_edges:]
+
+        # Cost: stored 3D length, never below the straight-line distance (keeps A* admissible).
+        straight = np.linalg.norm(endpoints[n_edges:] - endpoints[:n_edges], axis=1) if n_edges else np.empty(0)
+        shape_len = np.array([rows[i][7] if rows[i][7] is not None else np.nan for i in keep], dtype=float)
+        self.edge_length = np.fmax(np.nan_to_num(shape_len, nan=0.0), straight)
+
+        direction = np.array([rows[i][3] or 0 for i in keep], dtype=np.int64)
+        wc_barrier = np.array([rows[i][4] for i in keep], dtype=object)
+        emergency = np.array([rows[i][5] for i in keep], dtype=object)
+        mask = np.full(n_edges, PROFILE_WALK, dtype=np.int64)
+        mask |= np.where(wc_barrier != 1, PROFILE_WHEELCHAIR, 0)
+        mask |= np.where(emergency != "no", PROFILE_EMERGENCY, 0)
+
+        forward = np.flatnonzero(direction >= 0)
+        backward = np.flatnonzero(direction <= 0)
+        arc_src = np.concatenate([self.edge_from[forward], self.edge_to[backward]])
+        arc_dst = np.concatenate([self.edge_to[forward], self.edge_from[backward]])
+        arc_edge = np.concatenate([forward, backward])
+        arc_reversed = np.concatenate([np.zeros(len(forward), dtype=bool), np.ones(len(backward), dtype=bool)])
+        order = np.argsort(arc_src, kind="stable")
+        self.n_nodes = len(self.node_xyz)
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(arc_src, minlength=self.n_nodes))])
+        self.arc_src = arc_src[order]
+        self.arc_dst = arc_dst[order]
+        self.arc_edge = arc_edge[order]
+        self.arc_reversed = arc_reversed[order]
+        self.arc_cost = self.edge_length[self.arc_edge]
+        self.arc_mask = mask[self.arc_edge]
+
+        self._indptr = self.indptr.tolist()
+        self._arc_src = self.arc_src.tolist()
+        self._arc_dst = self.arc_dst.tolist()
+        self._arc_cost = self.arc_cost.tolist()
+        self._arc_mask = self.arc_mask.tolist()
+        self._node_xyz = [tuple(xyz) for xyz in self.node_xyz.tolist()]
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.pedrouteid)
+
+    def nearest_node(self, x: float, y: float, level_id: str | None = None) -> tuple[int, float] | None:
+        """Closest node (2D distance, EPSG:2326) to x/y, among nodes of level_id's segments if given."""
+        if level_id is not None:
+            on_level = self.level_id == level_id
+            candidates = np.unique(np.concatenate([self.edge_from[on_level], self.edge_to[on_level]]))
+        else:
+            candidates = np.arange(self.n_nodes)
+        if len(candidates) == 0:
+            return None
+        distances = np.hypot(self.node_xyz[candidates, 0] - x, self.node_xyz[candidates, 1] - y)
+        best = int(np.argmin(distances))
+        return int(candidates[best]), float(distances[best])
+
+    def shortest_path(self, source: int, target: int, profile: int, astar: bool = True) -> tuple[float, list[int]] | None:
+        """
+        Least-cost path source -> target over the arcs allowed for profile (A* with a 3D
+        straight-line heuristic, or plain Dijkstra). Returns (cost, arc indices) or None.
+        """
+        indptr, arc_dst, arc_cost, arc_mask = self._indptr, self._arc_dst, self._arc_cost, self._arc_mask
+        node_xyz = self._node_xyz
+        goal = node_xyz[target]
+        dist = {source: 0.0}
+        prev: dict[int, int] = {}
+        done = set()
+        heap = [(math.dist(node_xyz[source], goal) if astar else 0.0, 0.0, source)]
+        while heap:
+            _, cost, u = heapq.heappop(heap)
+            if u == target:
+                break
+            if u in done:
+                continue
+            done.add(u)
+            for arc in range(indptr[u], indptr[u + 1]):
+                if not arc_mask[arc] & profile:
+                    continue
+                v = arc_dst[arc]
+                new_cost = cost + arc_cost[arc]
+                if new_cost < dist.get(v, math.inf):
+                    dist[v] = new_cost
+                    prev[v] = arc
+                    estimate = new_cost + math.dist(node_xyz[v], goal) if astar else new_cost
+                    heapq.heappush(heap, (estimate, new_cost, v))
+        else:
+            return None
+        arcs = []
+        node = target
+        while node != source:
+            arc = prev[node]
+            arcs.append(arc)
+            node = self._arc_src[arc]
+        arcs.reverse()
+        return dist[target], arcs
+
+    def path_features(self, arcs: list[int]) -> list[dict]:
+        """GeoJSON features (EPSG:4326, in travel order) of the segments along a path."""
+        features = []
+        for arc in arcs:
+            edge = int(self.arc_edge[arc])
+            xyz = self._coords[self._coord_start[edge]:self._coord_end[edge]]
+            if self.arc_reversed[arc]:
+                xyz = xyz[::-1]
+            lon, lat = _TO_4326.transform(xyz[:, 0], xyz[:, 1])
+            coordinates = [[round(a, 8), round(b, 8), round(c, 3)] for a, b, c in zip(lon.tolist(), lat.tolist(), xyz[:, 2].tolist())]
+            features.append({
+                "type": "Feature",
+                "properties": {
+                    "pedrouteid": self.pedrouteid[edge],
+                    "inetworkid": self.inetworkid[edge],
+                    "feattype": self.feattype[edge],
+                    "level_id": self.level_id[edge],
+                    "length": round(float(self.edge_length[edge]), 3),
+                },
+                "geometry": {"type": "LineString", "coordinates": coordinates},
+            })
+        return features
+
+
+def build_venue_graph(displayname: str, version: str) -> VenueGraph:
+    """Load a venue's enabled indoor_network segments and build its VenueGraph."""
+    with SessionLocal() as session:
+        rows = session.execute(
+            text("""
+                SELECT pedrouteid, inetworkid, ST_AsBinary(shape), direction, wc_barrier, emergency,
+                    feattype, shape_len, level_id
+                FROM indoor_network
+                WHERE displayname = :displayname AND COALESCE(enabled, 1) <> 0
+                ORDER BY pedrouteid
+            """),
+            {"displayname": displayname},
+        ).all()
+    return VenueGraph(displayname, version, rows)
+
+
+# displayname -> VenueGraph, least recently used first.
+_graphs: "OrderedDict[str, VenueGraph]" = OrderedDict()
+# displayname -> lock serializing its graph builds; dropped with the venue's graph.
+_graph_locks: dict[str, asyncio.Lock] = {}
+
+
+async def get_venue_graph(displayname: str) -> VenueGraph:
+    """
+    Cached VenueGraph of a venue, rebuilt when its data version changes. The version is
+    looked up at most every ROUTING_VERSION_TTL_SECONDS, so hot venues skip the query.
+    """
+    graph = _graphs.get(displayname)
+    if graph is None or time.monotonic() - graph.checked_at >= ROUTING_VERSION_TTL_SECONDS:
+        version = await asyncio.to_thread(indoor_network_version, displayname)
+        graph = _graphs.get(displayname)
+        if graph is None or graph.version != version:
+            lock = _graph_locks.setdefault(displayname, asyncio.Lock())
+            try:
+                async with lock:
+                    graph = _graphs.get(displayname)
+                    if graph is None or graph.version != version:
+                        started = time.perf_counter()
+                        graph = await asyncio.to_thread(build_venue_graph, displayname, version)
+                        logger.info(
+                            f"ROUTING: graph of {displayname} built ({graph.n_nodes} nodes, {graph.n_edges} segments) "
+                            f"in {time.perf_counter() - started:.2f}s"
+                        )
+            except BaseException:
+                if displayname not in _graphs:
+                    _graph_locks.pop(displayname, None)
+                raise
+        graph.checked_at = time.monotonic()
+    _graphs[displayname] = graph
+    _graphs.move_to_end(displayname)
+    while len(_graphs) > ROUTING_GRAPH_CACHE_MAX:
+        evicted, _ = _graphs.popitem(last=False)
+        _graph_locks.pop(evicted, None)
+    return graph
+
+
+def _snap(graph: VenueGraph, lon: float, lat: float, level_id: str | None) -> tuple[int, float] | None:
+    x, y = _TO_2326.transform(lon, lat)
+    return graph.nearest_node(x, y, level_id)
+
+
+async def find_route(
+    displayname: str,
+    from_lon: float,
+    from_lat: float,
+    to_lon: float,
+    to_lat: float,
+    from_level_id: str | None = None,
+    to_level_id: str | None = None,
+    profile: str = "walk",
+    algorithm: str = "astar",
+) -> dict:
+    """
+    Shortest route between two points (EPSG:4326) of a venue. Each point snaps to the nearest
+    network node (on its level_id if given). Returns the route as GeoJSON segments in travel order.
+    """
+    graph = await get_venue_graph(displayname)
+    if graph.n_nodes == 0:
+        return {"status": "error", "message": f"No indoor network for '{displayname}'"}
+    start = _snap(graph, from_lon, from_lat, from_level_id)
+    end = _snap(graph, to_lon, to_lat, to_level_id)
+    if start is None or end is None:
+        missing = from_level_id if start is None else to_level_id
+        return {"status": "error", "message": f"No network segments on level '{missing}'"}
+
+    started = time.perf_counter()
+    found = graph.shortest_path(start[0], end[0], PROFILES[profile], astar=algorithm == "astar")
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if found is None:
+        return {"status": "error", "message": f"No {profile} route between the given points"}
+    cost, arcs = found
+    return {
+        "status": "success",
+        "displayname": displayname,
+        "profile": profile,
+        "algorithm": algorithm,
+        "distance": round(cost, 3),
+        "segments": len(arcs),
+        "snap_distance": {"from": round(start[1], 3), "to": round(end[1], 3)},
+        "search_ms": round(elapsed_ms, 3),
+        "route": {"type": "FeatureCollection", "features": graph.path_features(arcs)},
+    }
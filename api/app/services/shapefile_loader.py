@@ -0,0 +1,210 @@
+# app/services/shapefile_loader.py
+
+import codecs
+import io
+import os
+import re
+from typing import TYPE_CHECKING
+
+import numpy as np
+import shapefile  # pyshp
+import shapely
+from shapely.geometry import MultiLineString
+from pyproj import CRS, Transformer
+from pyproj.exceptions import CRSError
+from sqlalchemy import text
+
+from app.core.logger import logger
+from app.services.utils import format_copy_value
+
+if TYPE_CHECKING:
+    from psycopg2.extensions import cursor as PgCursor
+    from sqlalchemy.orm import Session
+
+# Staging geometry: same as the former ogr2ogr call (-nlt LINESTRINGZ -t_srs EPSG:2326 -lco GEOMETRY_NAME=shape).
+STAGING_SRID = 2326
+# Records read, reprojected and COPY'd per batch; bounds memory regardless of shapefile size.
+LOAD_BATCH_SIZE = 5000
+
+_LINE_SHAPE_TYPES = (shapefile.POLYLINE, shapefile.POLYLINEZ, shapefile.POLYLINEM)
+
+
+class ShapefileLoadError(Exception):
+    """The shapefile cannot be loaded (unreadable, unsupported geometry type or unknown CRS)."""
+
+
+def _launder(name: str) -> str:
+    """Column name as ogr2ogr's PostgreSQL driver would create it (LAUNDER=YES)."""
+    return re.sub(r"[\-#' ]", "_", name.lower())
+
+
+def _pg_type(field_type: str, size: int, decimal: int) -> str:
+    """PostgreSQL column type for a DBF field, following the ogr2ogr shapefile -> PG mapping."""
+    if field_type == "N" and decimal == 0:
+        if size < 10:
+            return "integer"
+        return "bigint" if size < 19 else f"numeric({size},0)"
+    if field_type in ("N", "F"):
+        return "double precision"
+    if field_type == "D":
+        return "date"
+    if field_type == "L":
+        return "boolean"
+    return "varchar"
+
+
+def _source_transformer(shp_path: str) -> Transformer | None:
+    """Transformer from the shapefile's .prj CRS to EPSG:2326, or None if it is already 2326."""
+    prj_path = os.path.splitext(shp_path)[0] + ".prj"
+    if not os.path.exists(prj_path):
+        logger.warning(f"No .prj next to {shp_path}; assuming EPSG:{STAGING_SRID}")
+        return None
+    try:
+        with open(prj_path, "r", encoding="utf-8", errors="replace") as f:
+            source_crs = CRS.from_user_input(f.read())
+    except CRSError as e:
+        raise ShapefileLoadError(f"Unrecognised CRS in {prj_path}: {e}") from e
+    if source_crs.to_epsg() == STAGING_SRID:
+        return None
+    return Transformer.from_crs(source_crs, f"EPSG:{STAGING_SRID}", always_xy=True)
+
+
+def _cpg_to_codec(cpg: str) -> str | None:
+    """
+    Python codec for a .cpg value, as GDAL reads them: code page numbers ("950", "ANSI 1252")
+    -> cpNNNN, 65001 -> utf-8, "8859_1" -> iso-8859-1, otherwise the value itself.
+    None when Python has no such codec.
+    """
+    value = cpg.strip().upper()
+    code_page = re.fullmatch(r"(?:ANSI\s*|CP|WINDOWS-)?(\d+)", value)
+    if value.startswith("8859"):
+        name = "iso-8859-" + value[4:].lstrip("_-")
+    elif code_page:
+        name = "utf-8" if code_page.group(1) == "65001" else f"cp{code_page.group(1)}"
+    else:
+        name = value
+    try:
+        return codecs.lookup(name).name
+    except LookupError:
+        return None
+
+
+def _dbf_encoding(shp_path: str) -> str:
+    cpg_path = os.path.splitext(shp_path)[0] + ".cpg"
+    if os.path.exists(cpg_path):
+        with open(cpg_path, "r", encoding="ascii", errors="ignore") as f:
+            cpg = f.read().strip()
+        if cpg:
+            codec = _cpg_to_codec(cpg)
+            if codec is not None:
+                return codec
+            logger.warning(f"Unknown encoding '{cpg}' in {cpg_path}; reading attributes as utf-8")
+    return "utf-8"
+
+
+def _batch_to_hex_ewkb(shapes: list, transformer: Transformer | None) -> list[str | None]:
+    """
+    Convert a batch of pyshp line shapes to hex EWKB LineStringZ (EPSG:2326).
+    All vertices of the batch are reprojected in one vectorized call. Null, empty and
+    multi-part shapes that do not merge into one line become None (reported as
+    GEOMETRY_NULL by validate_network_staging).
+    """
+    coords: list[np.ndarray] = []
+    counts: list[int] = []
+    for shp in shapes:
+        if shp.shapeType not in _LINE_SHAPE_TYPES or len(shp.points) < 2:
+            counts.append(0)
+            continue
+        xy = np.asarray(shp.points, dtype=float)
+        z = np.asarray(getattr(shp, "z", None) or [0.0] * len(xy), dtype=float)
+        coords.append(np.column_stack([xy, z]))
+        counts.append(len(xy))
+
+    out: list[str | None] = [None] * len(shapes)
+    if not coords:
+        return out
+
+    all_coords = np.concatenate(coords)
+    if transformer is not None:
+        x, y, z = transformer.transform(all_coords[:, 0], all_coords[:, 1], all_coords[:, 2])
+        all_coords = np.column_stack([x, y, z])
+
+    offset = 0
+    for i, (shp, n) in enumerate(zip(shapes, counts)):
+        if n == 0:
+            continue
+        points = all_coords[offset:offset + n]
+        offset += n
+        parts = list(shp.parts) + [n]
+        if len(shp.parts) > 1:
+            pieces = [points[parts[k]:parts[k + 1]] for k in range(len(shp.parts))]
+            merged = shapely.line_merge(MultiLineString([p for p in pieces if len(p) >= 2]))
+            if merged.geom_type != "LineString":
+                continue
+            line = merged
+        else:
+            line = shapely.linestrings(points)
+        out[i] = shapely.to_wkb(shapely.set_srid(line, STAGING_SRID), hex=True, include_srid=True, output_dimension=3)
+    return out
+
+
+def load_shapefile_to_staging(session: "Session", shp_path: str, staging_table: str) -> int:
+    """
+    Stream a network shapefile into a new UNLOGGED staging table, in process (replaces ogr2ogr).
+
+    The table gets an ogc_fid serial key, one column per DBF field (laundered, ogr2ogr types)
+    and shape GEOMETRY(LineStringZ, 2326). Records are read, reprojected and COPY'd in batches
+    of LOAD_BATCH_SIZE, so memory stays bounded. Runs in the caller's transaction; returns the
+    number of records loaded. Raises ShapefileLoadError for unreadable or unsupported input.
+    """
+    transformer = _source_transformer(shp_path)
+    try:
+        reader = shapefile.Reader(shp_path, encoding=_dbf_encoding(shp_path), encodingErrors="replace")
+    except (shapefile.ShapefileException, OSError) as e:
+        raise ShapefileLoadError(f"Cannot open shapefile {shp_path}: {e}") from e
+
+    with reader:
+        if reader.shapeType not in _LINE_SHAPE_TYPES + (shapefile.NULL,):
+            raise ShapefileLoadError(f"Expected a polyline shapefile, got shape type {reader.shapeType}")
+
+        fields = [tuple(f)[:4] for f in reader.fields[1:]]  # skip DeletionFlag
+        columns = [_launder(name) for name, _t, _s, _d in fields]
+        column_defs = ", ".join(
+            f'"{col}" {_pg_type(str(ftype), size, decimal)}'
+            for col, (_n, ftype, size, decimal) in zip(columns, fields)
+        )
+        session.execute(text(
+            f'CREATE UNLOGGED TABLE "{staging_table}" (ogc_fid serial PRIMARY KEY, '
+            f'{column_defs}{", " if column_defs else ""}shape geometry(LineStringZ, {STAGING_SRID}))'
+        ))
+        quoted_columns = ", ".join(f'"{col}"' for col in columns + ["shape"])
+        copy_sql = f'COPY "{staging_table}" ({quoted_columns}) FROM STDIN WITH (FORMAT text)'
+
+        loaded = 0
+        cursor = session.connection().connection.cursor()
+        try:
+            shapes: list = []
+            records: list = []
+            for shape_record in reader.iterShapeRecords():
+                shapes.append(shape_record.shape)
+                records.append(list(shape_record.record))
+                if len(shapes) >= LOAD_BATCH_SIZE:
+                    loaded += _copy_batch(cursor, copy_sql, shapes, records, transformer)
+                    shapes, records = [], []
+            if shapes:
+                loaded += _copy_batch(cursor, copy_sql, shapes, records, transformer)
+        finally:
+            cursor.close()
+
+    logger.info(f"Loaded {loaded} records from {shp_path} into {staging_table}")
+    return loaded
+
+
+def _copy_batch(cursor: "PgCursor", copy_sql: str, shapes: list, records: list, transformer: Transformer | None) -> int:
+    buf = io.StringIO()
+    for record, shape_hex in zip(records, _batch_to_hex_ewkb(shapes, transformer)):
+        buf.write("\t".join(format_copy_value(v) for v in record + [shape_hex]))
+        buf.write("\n")
+    buf.seek(0)
+    cursor.copy_expert(copy_sql, buf)
+    return len(records)
@@ -0,0 +1,155 @@
+# app/services/staging_batch.py
+
+import math
+from typing import Any, Literal, Sequence, Union, get_args, get_origin
+
+import annotated_types
+import numpy as np
+
+from app.schema.network import NetworkStagingRow
+
+# Staging columns that fall back to the model default when NULL (instead of staying None).
+_DEFAULT_WHEN_NULL = ("crtby", "lstamdby")
+
+
+class _FieldRule:
+    """Constraints of one NetworkStagingRow field, read from the Pydantic model."""
+
+    __slots__ = ("name", "base", "optional", "literal", "ge", "le", "required", "default")
+
+    def __init__(self, name: str, field_info):
+        annotation = field_info.annotation
+        self.optional = False
+        if get_origin(annotation) is Union:
+            args = [a for a in get_args(annotation) if a is not type(None)]
+            self.optional = len(args) < len(get_args(annotation))
+            annotation = args[0]
+        self.literal = None
+        if get_origin(annotation) is Literal:
+            self.literal = frozenset(get_args(annotation))
+            annotation = type(next(iter(self.literal)))
+        self.name = name
+        self.base = annotation
+        self.ge = next((m.ge for m in field_info.metadata if isinstance(m, annotated_types.Ge)), None)
+        self.le = next((m.le for m in field_info.metadata if isinstance(m, annotated_types.Le)), None)
+        self.required = field_info.is_required()
+        self.default = None if self.required else field_info.get_default(call_default_factory=True)
+
+
+_FIELD_RULES = [_FieldRule(name, info) for name, info in NetworkStagingRow.model_fields.items()]
+
+
+def _check_column(rule: _FieldRule, values: Sequence[Any] | None, n: int) -> tuple[np.ndarray, list[Any]]:
+    """
+    Column-wise equivalent of the Pydantic rules for one field.
+    Returns (ok, converted): ok[i] is False when the value is not on the fast path (Pydantic
+    decides for that row); converted holds the value Pydantic would produce where ok[i] is True.
+    Only unambiguous cases are accepted here, so fast-path rows validate exactly as Pydantic would.
+    """
+    if values is None:
+        # Column absent from staging: the default applies, or every row fails (field required).
+        return np.full(n, not rule.required), [rule.default] * n
+    if rule.name in _DEFAULT_WHEN_NULL:
+        values = [rule.default if v is None else v for v in values]
+
+    types = np.fromiter(map(type, values), dtype=object, count=n)
+    if rule.base is int:
+        ok_type = types == int
+        converted = list(values)
+        # Integral floats (DBF numeric columns) are coerced to int by Pydantic as well.
+        for i in np.flatnonzero(types == float):
+            v = values[i]
+            if math.isfinite(v) and v.is_integer():
+                converted[i] = int(v)
+                ok_type[i] = True
+    elif rule.base is float:
+        ok_type = (types == float) | (types == int)
+        converted = [float(v) if ok else v for v, ok in zip(values, ok_type.tolist())]
+    else:  # str, bool: exact type only
+        ok_type = types == rule.base
+        converted = list(values)
+
+    ok = ok_type
+    if rule.literal is not None:
+        ok &= np.fromiter(map(rule.literal.__contains__, converted), dtype=bool, count=n)
+    if (rule.ge is not None or rule.le is not None) and ok.any():
+        numbers = np.array([v if f else 0 for v, f in zip(converted, ok.tolist())], dtype=float)
+        if rule.ge is not None:
+            ok &= numbers >= rule.ge
+        if rule.le is not None:
+            ok &= numbers <= rule.le
+    if rule.optional:
+        ok |= types == type(None)
+    return ok, converted
+
+
+# Every field is set on fast-path rows; one shared set (assigning a field only re-adds a member).
+_ALL_FIELDS_SET = set(NetworkStagingRow.model_fields)
+
+
+def _construct_row(values: dict) -> NetworkStagingRow:
+    """
+    NetworkStagingRow from values that already satisfy every field rule (all fields present).
+    Same result as NetworkStagingRow.model_construct(**values), without its per-field default
+    handling, which would cost more than the validation it skips.
+    """
+    row = NetworkStagingRow.__new__(NetworkStagingRow)
+    object.__setattr__(row, "__dict__", values)
+    object.__setattr__(row, "__pydantic_fields_set__", _ALL_FIELDS_SET)
+    object.__setattr__(row, "__pydantic_extra__", None)
+    object.__setattr__(row, "__pydantic_private__", None)
+    return row
+
+
+class NetworkStagingBatch:
+    """
+    Column-oriented view of the staging rows of one import.
+
+    Checks every NetworkStagingRow constraint column by column and only runs Pydantic
+    (model_validate) on rows that are not clearly valid, so large venues skip the per-row
+    dict copies and validation. Rows are handed on as NetworkStagingRow objects in staging order.
+    """
+
+    def __init__(self, columns: Sequence[str], rows: Sequence[Sequence[Any]]):
+        self.n = len(rows)
+        self.source_columns = list(columns)
+        # Transpose once; the row tuples from the cursor can then be released.
+        data = list(zip(*rows)) if rows else [() for _ in self.source_columns]
+        self._source = dict(zip(self.source_columns, data))
+        self._values: dict[str, list[Any]] = {}
+        self._ok = np.ones(self.n, dtype=bool)
+        for rule in _FIELD_RULES:
+            ok, converted = _check_column(rule, self._source.get(rule.name), self.n)
+            self._values[rule.name] = converted
+            self._ok &= ok
+
+    @property
+    def fast_path_count(self) -> int:
+        return int(self._ok.sum())
+
+    def row_dict(self, i: int) -> dict:
+        """Staging row i as the dict Pydantic validates (NULL crtby / lstamdby left to the model default)."""
+        row = {col: values[i] for col, values in self._source.items()}
+        for name in _DEFAULT_WHEN_NULL:
+            if row.get(name) is None:
+                row.pop(name, None)
+        return row
+
+    def to_rows(self) -> tuple[list[NetworkStagingRow], tuple[int, dict, Exception] | None]:
+        """
+        Build NetworkStagingRow objects in staging order.
+        Returns (rows, None), or ([], (index, row_dict, error)) for the first row that fails validation.
+        """
+        names = [rule.name for rule in _FIELD_RULES]
+        rows: list[NetworkStagingRow] = []
+        fast = self._ok.tolist()
+        for i, values in enumerate(zip(*(self._values[name] for name in names))):
+            if fast[i]:
+                rows.append(_construct_row(dict(zip(names, values))))
+                continue
+            row = self.row_dict(i)
+            try:
+                rows.append(NetworkStagingRow.model_validate(row))
+            except Exception as e:
+                return [], (i, row, e)
+        return rows, None
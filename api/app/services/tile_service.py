@@ -0,0 +1,155 @@
+# app/services/tile_service.py
+
+import asyncio
+import os
+import time
+from typing import TYPE_CHECKING
+
+from sqlalchemy import text
+
+from app.core.config import TILE_CACHE_MAX_BYTES, TILE_MIN_ZOOM, TILE_VERSION_TTL_SECONDS
+from app.core.database import SessionLocal
+from app.services.export_cache import ExportCache, export_cache_key
+from app.services.network_services import DEFAULT_EXPORT_RESULT_DIR
+
+if TYPE_CHECKING:
+    from sqlalchemy.orm import Session
+
+# Vector tile grid (Web Mercator tiles, ST_TileEnvelope) and encoding.
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# Tile layers: table and the attributes encoded with each line.
+TILE_LAYERS = {
+    "indoor_network": {
+        "table": "indoor_network",
+        "columns": [
+            "pedrouteid", "inetworkid", "displayname", "level_id", "floorid", "highway", "feattype",
+            "direction", "wheelchair", "wc_access", "wc_barrier", "emergency", "restricted",
+            "aliasnamen", "aliasnamtc",
+        ],
+    },
+    "pedestrian_network": {
+        "table": "pedestrian_network",
+        "columns": [
+            "pedrouteid", "floorid", "feattype", "location", "direction", "wc_access", "wc_barrier",
+            "wx_proof", "aliasnamen", "aliasnamtc", "st_nameen", "st_nametc",
+        ],
+    },
+}
+
+# Encoded tiles, keyed by tile, filters and the version of the layer's table (see _table_version).
+tile_cache = ExportCache(os.path.join(DEFAULT_EXPORT_RESULT_DIR, ".tiles"), TILE_CACHE_MAX_BYTES)
+
+
+def _tile_where(
+    layer: str,
+    level_id: str | None,
+    floorid: int | None,
+    displayname: str | None,
+    opendata: str,
+) -> tuple[str, dict]:
+    """WHERE clause selecting a layer's rows in the tile (:z/:x/:y) and the optional filters."""
+    # &&& (n-D overlap) is the operator of the gist_geometry_ops_nd shape indexes.
+    conditions = ["n.shape &&& ST_Transform(ST_TileEnvelope(:z, :x, :y, margin => :margin), 2326)"]
+    params: dict = {"margin": TILE_BUFFER / TILE_EXTENT}
+    if level_id is not None:
+        conditions.append("n.level_id = :level_id")
+        params["level_id"] = level_id
+    if floorid is not None:
+        conditions.append("n.floorid = :floorid")
+        params["floorid"] = floorid
+    if displayname is not None:
+        conditions.append("n.displayname = :displayname")
+        params["displayname"] = displayname
+    if opendata == "open" and layer == "indoor_network":
+        conditions.append("n.restricted = 'N'")
+    return " AND ".join(conditions), params
+
+
+# table -> (time.monotonic() of the check, version), see _table_version.
+_table_versions: dict[str, tuple[float, tuple]] = {}
+
+
+def _table_version(table: str) -> tuple:
+    """
+    Row count and latest created_at / updated_at of a layer's table: changes when rows are
+    inserted, updated (updated_at trigger) or deleted. Looked up at most every
+    TILE_VERSION_TTL_SECONDS, so cached tiles are served without touching the database.
+    """
+    cached = _table_versions.get(table)
+    if cached is not None and time.monotonic() - cached[0] < TILE_VERSION_TTL_SECONDS:
+        return cached[1]
+    with SessionLocal() as session:
+        version = tuple(session.execute(
+            text(f"SELECT COUNT(*), MAX(updated_at), MAX(created_at) FROM {table}")
+        ).one())
+    _table_versions[table] = (time.monotonic(), version)
+    return version
+
+
+def _render_tile(session: "Session", layer: str, where: str, params: dict) -> bytes:
+    spec = TILE_LAYERS[layer]
+    columns = "".join(f", n.{column}" for column in spec["columns"])
+    data = session.execute(
+        text(f"""
+            SELECT ST_AsMVT(tile, :layer, {TILE_EXTENT}, 'geom')
+            FROM (
+                SELECT ST_AsMVTGeom(
+                    ST_Transform(ST_Force2D(n.shape), 3857), ST_TileEnvelope(:z, :x, :y), {TILE_EXTENT}, {TILE_BUFFER}, true
+                ) AS geom{columns}
+                FROM {spec['table']} n
+                WHERE {where}
+            ) AS tile
+            WHERE tile.geom IS NOT NULL
+        """),
+        {**params, "layer": layer},
+    ).scalar()
+    return bytes(data or b"")
+
+
+def _get_tile(
+    layer: str,
+    z: int,
+    x: int,
+    y: int,
+    level_id: str | None,
+    floorid: int | None,
+    displayname: str | None,
+    opendata: str,
+) -> tuple[bytes, str]:
+    version = _table_version(TILE_LAYERS[layer]["table"])
+    key = export_cache_key("tile", layer, z, x, y, level_id, floorid, displayname, opendata, version)
+    entry = tile_cache.lookup(key)
+    if entry is not None:
+        try:
+            with open(os.path.join(entry, "tile.mvt"), "rb") as f:
+                return f.read(), key
+        except OSError:
+            pass  # evicted meanwhile
+    where, params = _tile_where(layer, level_id, floorid, displayname, opendata)
+    params.update(z=z, x=x, y=y)
+    with SessionLocal() as session:
+        data = _render_tile(session, layer, where, params)
+    tile_cache.store_bytes(key, "tile.mvt", data)
+    return data, key
+
+
+async def get_tile(
+    layer: str,
+    z: int,
+    x: int,
+    y: int,
+    level_id: str | None = None,
+    floorid: int | None = None,
+    displayname: str | None = None,
+    opendata: str = "full",
+) -> tuple[bytes, str]:
+    """
+    Mapbox Vector Tile of a network layer (lines in EPSG:3857 tile space) and its cache key
+    (usable as ETag). Tiles are served from the disk cache while the layer's table is
+    unchanged; below TILE_MIN_ZOOM tiles are empty (a venue-level layer).
+    """
+    if z < TILE_MIN_ZOOM:
+        return b"", export_cache_key("tile", "empty")
+    return await asyncio.to_thread(_get_tile, layer, z, x, y, level_id, floorid, displayname, opendata)
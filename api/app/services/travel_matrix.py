@@ -0,0 +1,208 @@
+# app/services/travel_matrix.py
+
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from shapely.geometry import shape
+
+from app.core.logger import logger
+from app.services.export_cache import export_cache_key
+from app.services.imdf_service import get_openings_with_name_by_displayName
+from app.services.job_service import report_progress
+from app.services.network_services import export_cache
+from app.services.routing_service import PROFILES, VenueGraph, get_venue_graph
+
+# Profiles precomputed by default (door-to-door accessibility analyses).
+TRAVEL_MATRIX_PROFILES = ("walk", "wheelchair")
+# Openings further than this (metres) from a network node on their level are left unreachable.
+OPENING_MAX_SNAP_DISTANCE = 10.0
+# Shortest-path sources solved per dijkstra call: bounds the (sources x nodes) distance block.
+MATRIX_SOURCE_BATCH = 64
+# Matrices kept loaded (memory-mapped) in this process.
+TRAVEL_MATRIX_MEMORY_MAX = 16
+
+_TO_2326 = Transformer.from_crs("EPSG:4326", "EPSG:2326", always_xy=True)
+
+
+class TravelMatrix:
+    """
+    Door-to-door network costs (metres) between the named openings of a venue, for one profile.
+    costs[i, j] is the cost from openings[i] to openings[j] (float32, inf when unreachable);
+    lookups by opening id are O(1).
+    """
+
+    def __init__(self, key: str, openings: list[dict], costs: np.ndarray):
+        self.key = key
+        self.openings = openings
+        self.costs = costs
+        self.index = {opening["id"]: i for i, opening in enumerate(openings)}
+
+    def cost(self, from_id: str, to_id: str) -> float | None:
+        value = float(self.costs[self.index[from_id], self.index[to_id]])
+        return None if np.isinf(value) else value
+
+
+def _snap_openings(graph: VenueGraph, features: list[dict]) -> list[dict]:
+    """Opening id / name / level and its nearest network node on the same level (node -1: not snapped)."""
+    openings = []
+    centroids = shapely.centroid([shape(feature["geometry"]) for feature in features]) if features else []
+    for feature, centroid in zip(features, centroids):
+        props = feature.get("properties") or {}
+        level_id = props.get("level_id")
+        x, y = _TO_2326.transform(centroid.x, centroid.y)
+        nearest = graph.nearest_node(x, y, level_id)
+        node, distance = nearest if nearest is not None else (-1, None)
+        if distance is not None and distance > OPENING_MAX_SNAP_DISTANCE:
+            node = -1
+        openings.append({
+            "id": feature.get("id"),
+            "name": props.get("name"),
+            "level_id": level_id,
+            "node": node,
+            "snap_distance": None if distance is None else round(distance, 3),
+        })
+    return openings
+
+
+def _openings_fingerprint(features: list[dict]) -> str:
+    """Fingerprint of the opening set (ids, levels, geometry): part of a matrix's cache key."""
+    digest = hashlib.blake2b(digest_size=16)
+    for feature in features:
+        digest.update(json.dumps(
+            [feature.get("id"), (feature.get("properties") or {}).get("level_id"), feature.get("geometry")],
+            sort_keys=True,
+            default=str,
+        ).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def compute_travel_costs(graph: VenueGraph, nodes: np.ndarray, profile: int) -> np.ndarray:
+    """
+    (k x k) float32 matrix of least costs between graph nodes (-1: not on the network, all inf),
+    over the arcs allowed for profile: multi-source Dijkstra on the CSR arrays (scipy csgraph).
+    """
+    allowed = (graph.arc_mask & profile) != 0
+    src, dst, cost = graph.arc_src[allowed], graph.arc_dst[allowed], graph.arc_cost[allowed]
+    # Parallel arcs: keep the cheapest (csr_matrix would add them up).
+    order = np.lexsort((cost, dst, src))
+    src, dst, cost = src[order], dst[order], cost[order]
+    first = np.ones(len(src), dtype=bool)
+    first[1:] = (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])
+    adjacency = csr_matrix((cost[first], (src[first], dst[first])), shape=(graph.n_nodes, graph.n_nodes))
+
+    k = len(nodes)
+    costs = np.full((k, k), np.inf, dtype=np.float32)
+    snapped = np.flatnonzero(nodes >= 0)
+    if len(snapped) == 0:
+        return costs
+    sources, source_of = np.unique(nodes[snapped], return_inverse=True)
+    targets = nodes[snapped]
+    rows = np.empty((len(sources), len(snapped)), dtype=np.float32)
+    for start in range(0, len(sources), MATRIX_SOURCE_BATCH):
+        batch = sources[start:start + MATRIX_SOURCE_BATCH]
+        rows[start:start + len(batch)] = dijkstra(adjacency, directed=True, indices=batch)[:, targets]
+    costs[np.ix_(snapped, snapped)] = rows[source_of.reshape(-1)]
+    return costs
+
+
+# key -> TravelMatrix, least recently used first.
+_matrices: "OrderedDict[str, TravelMatrix]" = OrderedDict()
+
+
+def _load_stored(key: str) -> TravelMatrix | None:
+    entry = export_cache.lookup(key)
+    if entry is None:
+        return None
+    try:
+        with open(os.path.join(entry, "openings.json"), "r", encoding="utf-8") as f:
+            openings = json.load(f)
+        costs = np.load(os.path.join(entry, "matrix.npy"), mmap_mode="r")
+    except (OSError, ValueError) as e:
+        logger.warning(f"Travel matrix {key} unreadable: {e}")
+        return None
+    return TravelMatrix(key, openings, costs)
+
+
+def _store(matrix: TravelMatrix) -> None:
+    """Persist a matrix in the export cache (matrix.npy + openings.json)."""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        matrix_path = os.path.join(temp_dir, "matrix.npy")
+        openings_path = os.path.join(temp_dir, "openings.json")
+        np.save(matrix_path, matrix.costs)
+        with open(openings_path, "w", encoding="utf-8") as f:
+            json.dump(matrix.openings, f, ensure_ascii=False)
+        export_cache.store(matrix.key, [matrix_path, openings_path])
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+async def get_travel_matrix(displayname: str, profile: str = "walk") -> TravelMatrix:
+    """
+    Travel matrix of a venue for the current network data and named openings: from memory,
+    from the export cache, or computed (and stored) when either has changed.
+    """
+    graph = await get_venue_graph(displayname)
+    features = await get_openings_with_name_by_displayName(displayname) or []
+    key = export_cache_key("travel_matrix", displayname, profile, graph.version, _openings_fingerprint(features))
+
+    matrix = _matrices.get(key)
+    if matrix is None:
+        matrix = await asyncio.to_thread(_load_stored, key)
+    if matrix is None:
+        started = time.perf_counter()
+        openings = await asyncio.to_thread(_snap_openings, graph, features)
+        nodes = np.array([opening["node"] for opening in openings], dtype=np.int64)
+        costs = await asyncio.to_thread(compute_travel_costs, graph, nodes, PROFILES[profile])
+        matrix = TravelMatrix(key, openings, costs)
+        await asyncio.to_thread(_store, matrix)
+        logger.info(
+            f"TRAVEL MATRIX: {displayname} ({profile}) {len(openings)} openings "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+    _matrices[key] = matrix
+    _matrices.move_to_end(key)
+    while len(_matrices) > TRAVEL_MATRIX_MEMORY_MAX:
+        _matrices.popitem(last=False)
+    return matrix
+
+
+async def precompute_travel_matrices(displaynames: list[str], profiles: tuple[str, ...] = TRAVEL_MATRIX_PROFILES) -> dict:
+    """Build (or refresh) the travel matrices of several venues, as a background job."""
+    total = len(displaynames) * len(profiles)
+    done = 0
+    failed = []
+    report_progress(total=total, done=0, failed=0)
+    for displayname in displaynames:
+        for profile in profiles:
+            try:
+                matrix = await get_travel_matrix(displayname, profile)
+                if not matrix.openings:
+                    failed.append({"displayname": displayname, "profile": profile, "message": "No named openings"})
+            except Exception as e:
+                logger.error(f"TRAVEL MATRIX failed for {displayname} ({profile}): {e}")
+                failed.append({"displayname": displayname, "profile": profile, "message": str(e)})
+            done += 1
+            report_progress(done=done, failed=len(failed))
+    if len(failed) == total:
+        status = "error"
+    elif failed:
+        status = "warning"
+    else:
+        status = "success"
+    return {
+        "status": status,
+        "message": f"Built {total - len(failed)} of {total} travel matrices",
+        "failed": failed,
+    }
@@ -1,5 +1,6 @@
 # app/services/utils.py
 
+import asyncio
 import json
 import math
 from typing import TYPE_CHECKING, Any
@@ -7,8 +8,10 @@ from typing import TYPE_CHECKING, Any
 if TYPE_CHECKING:
     from app.schema.network import NetworkStagingRow
 
+import numpy as np
+import shapely
+from shapely import STRtree, prepare
 from shapely.geometry import LineString, Polygon, shape
-from shapely.ops import transform as shapely_transform
 from pyproj import Transformer
 
 # Staging = EPSG:2326 (Hong Kong 1980 Grid, meters); units from IMDF = EPSG:4326 (WGS84, lon/lat).
@@ -33,6 +36,38 @@ UNIT_FEATURE_TYPE_MAP: dict[str, int] = {
 DEFAULT_FEATURE_TYPE = 1  # walkway
 
 
+def format_copy_value(value: Any) -> str:
+    """Format one value for COPY ... (FORMAT text): \\N for NULL, escaped string otherwise."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+async def run_ogr2ogr(cmd: list[str], env: dict | None = None) -> tuple[int, str, str]:
+    """
+    Run a GDAL command line (ogr2ogr) as an asyncio subprocess, without blocking the event loop.
+    Returns (returncode, stdout, stderr).
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, env=env
+    )
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        await proc.wait()
+        raise
+    return proc.returncode, stdout.decode("utf-8", errors="replace"), stderr.decode("utf-8", errors="replace")
+
+
 # Projection: EPSG:2326 (Hong Kong 1980 Grid System) — units are meters.
 def _horizontal_distance_meters(fp: list[float], ep: list[float]) -> float:
     """
@@ -44,18 +79,19 @@ def _horizontal_distance_meters(fp: list[float], ep: list[float]) -> float:
     return math.sqrt(dx * dx + dy * dy)
 
 
-def calculate_gradient(highway: str, geojson_str: str) -> float:
+def calculate_gradient(highway: str, geojson_str: str, geom: "RowGeometry | None" = None) -> float:
     """
     Calculate gradient (absolute slope angle in radians) for a 3D linestring.
 
     - highway === "lift" means the linestring is vertical (e.g. lift/elevator);
       gradient is treated as pi/2 (vertical).
     - line: 3D linestring as list of [x, y, z] in EPSG:2326 (Hong Kong 1980); x,y in meters, z elevation.
+    - geom: optional pre-parsed RowGeometry of geojson_str; avoids parsing the GeoJSON again.
     - Returns absolute gradient in radians (0 = flat, pi/2 = vertical).
     """
-    geojson = json.loads(geojson_str)
-    geom = geojson.get("geometry") or geojson
-    line = geom.get("coordinates") or []
+    if geom is None:
+        geom = build_row_geometry(geojson_str)
+    line = geom.coords
     if not line or len(line) < 2:
         return 0.0
 
@@ -74,19 +110,85 @@ def calculate_gradient(highway: str, geojson_str: str) -> float:
 # --- calculate_feature_type (from reference.ts calculatFeatureType) ---
 
 
-def _line_from_geojson(geojson_str: str) -> LineString | None:
-    """Build Shapely LineString from GeoJSON string (e.g. from NetworkStagingRow.geojson). Assumes EPSG:2326."""
+def _transform_2326_to_4326(geom: LineString | Polygon) -> LineString | Polygon:
+    """Transform geometry from EPSG:2326 (Hong Kong) to EPSG:4326 (WGS84) for comparison with unit features."""
+    # All vertices in one vectorized Transformer.transform call (x, y[, z] columns).
+    return shapely.transform(
+        geom,
+        lambda coords: np.column_stack(_TRANSFORMER_2326_TO_4326.transform(*coords.T)),
+        include_z=bool(shapely.has_z(geom)),
+    )
+
+
+class RowGeometry:
+    """
+    Geometry of one staging row, parsed and reprojected once and shared by every enrichment step.
+
+    - coords: raw GeoJSON coordinates ([x, y, z] in EPSG:2326).
+    - line_2326: 2D LineString in EPSG:2326 (None if the GeoJSON could not be parsed).
+    - line_4326: 2D LineString in EPSG:4326, for comparison with IMDF features (None likewise).
+    """
+
+    __slots__ = ("coords", "line_2326", "line_4326")
+
+    def __init__(self, coords: list, line_2326: LineString | None, line_4326: LineString | None):
+        self.coords = coords
+        self.line_2326 = line_2326
+        self.line_4326 = line_4326
+
+
+def build_row_geometry(geojson_str: str) -> RowGeometry:
+    """Parse a staging row's GeoJSON (EPSG:2326) once into a RowGeometry."""
     try:
-        data = json.loads(geojson_str)
+        data = json.loads(geojson_str or "")
         geom = data.get("geometry") or data
-        return shape(geom)
-    except (json.JSONDecodeError, TypeError, KeyError):
-        return None
+        coords = geom.get("coordinates") or []
+        line = shape(geom)
+    except (json.JSONDecodeError, TypeError, KeyError, AttributeError, ValueError):
+        return RowGeometry([], None, None)
+    if line.is_empty:
+        return RowGeometry(coords, None, None)
+    # Reproject with Z so the horizontal datum shift uses the real elevation, then drop Z.
+    return RowGeometry(coords, _force_2d(line), _force_2d(_transform_2326_to_4326(line)))
 
 
-def _transform_2326_to_4326(geom: LineString | Polygon) -> LineString | Polygon:
-    """Transform geometry from EPSG:2326 (Hong Kong) to EPSG:4326 (WGS84) for comparison with unit features."""
-    return shapely_transform(_TRANSFORMER_2326_TO_4326.transform, geom)
+def build_row_geometries(geojson_strs: list[str]) -> list[RowGeometry]:
+    """
+    Batch version of build_row_geometry for all rows of an import.
+
+    All GeoJSON strings are parsed in one shapely.from_geojson call and every vertex is reprojected
+    2326 -> 4326 in a single vectorized Transformer.transform call; results are split back per row
+    by their coordinate index. Anything other than a non-empty LineString falls back to
+    build_row_geometry. Returns one RowGeometry per input, in the same order.
+    """
+    if not geojson_strs:
+        return []
+    geoms = shapely.from_geojson(
+        np.array([g or "null" for g in geojson_strs], dtype=object), on_invalid="ignore"
+    )
+    is_line = (shapely.get_type_id(geoms) == shapely.GeometryType.LINESTRING) & ~shapely.is_empty(geoms)
+    positions = np.flatnonzero(is_line)
+
+    results: list[RowGeometry | None] = [None] * len(geojson_strs)
+    if len(positions):
+        lines = geoms[positions]
+        coords, index = shapely.get_coordinates(lines, include_z=True, return_index=True)
+        has_z = shapely.has_z(lines)
+        z = np.where(np.isnan(coords[:, 2]), 0.0, coords[:, 2])
+        lon, lat, _ = _TRANSFORMER_2326_TO_4326.transform(coords[:, 0], coords[:, 1], z)
+
+        lines_2326 = shapely.linestrings(coords[:, :2], indices=index)
+        lines_4326 = shapely.linestrings(np.column_stack([lon, lat]), indices=index)
+        bounds = np.searchsorted(index, np.arange(len(positions) + 1))
+        for k, pos in enumerate(positions):
+            row_coords = coords[bounds[k]:bounds[k + 1]]
+            raw = row_coords.tolist() if has_z[k] else row_coords[:, :2].tolist()
+            results[pos] = RowGeometry(raw, lines_2326[k], lines_4326[k])
+
+    return [
+        geom if geom is not None else build_row_geometry(geojson_strs[i])
+        for i, geom in enumerate(results)
+    ]
 
 
 def _force_2d(geom: LineString | Polygon) -> LineString | Polygon:
@@ -118,6 +220,59 @@ def _polygon_from_unit_feature(unit: dict) -> Polygon | None:
         return None
 
 
+class UnitIndex:
+    """
+    Spatial index of IMDF unit polygons (EPSG:4326) for one venue, grouped by level_id.
+
+    Built once per import and passed to calculate_feature_type so unit polygons are
+    constructed and prepared a single time instead of once per network row.
+    """
+
+    def __init__(self, unit_features: list[dict]):
+        self._units: list[dict] = []
+        self._polys: list[Polygon] = []
+        level_positions: dict[Any, list[int]] = {}
+        for unit in unit_features or []:
+            poly = _polygon_from_unit_feature(unit)
+            if not poly:
+                continue
+            level_id = (unit.get("properties") or {}).get("level_id")
+            level_positions.setdefault(level_id, []).append(len(self._polys))
+            self._units.append(unit)
+            self._polys.append(poly)
+        prepare(self._polys)
+
+        # One tree over all units (rows without level_id) plus one per level; per-level
+        # trees map their hits back to positions in self._units to keep feature order.
+        self._all: STRtree | None = STRtree(self._polys) if self._polys else None
+        self._by_level: dict[Any, tuple[STRtree, list[int]]] = {
+            level_id: (STRtree([self._polys[i] for i in positions]), positions)
+            for level_id, positions in level_positions.items()
+        }
+
+    def intersecting(self, line: LineString, level_id: Any = None) -> list[tuple[dict, Polygon]]:
+        """
+        Return (unit, polygon) pairs whose polygon intersects line, in original feature order.
+        If level_id is given, only units on that level are considered.
+        """
+        if level_id is None:
+            if self._all is None:
+                return []
+            hits = self._all.query(line, predicate="intersects")
+        else:
+            entry = self._by_level.get(level_id)
+            if entry is None:
+                return []
+            tree, positions = entry
+            hits = [positions[i] for i in tree.query(line, predicate="intersects")]
+        return [(self._units[i], self._polys[i]) for i in sorted(int(i) for i in hits)]
+
+
+def build_unit_index(unit_features: list[dict]) -> UnitIndex:
+    """Build the per-venue UnitIndex used by calculate_feature_type."""
+    return UnitIndex(unit_features)
+
+
 def _are_all_values_same(values: list[float]) -> bool:
     if not values:
         return True
@@ -151,15 +306,14 @@ def _find_stair_lift_feature_type(
 
 def _find_max_coverage_polygon(
     line: LineString,
-    unit_features: list[dict],
+    unit_polygons: list[tuple[dict, Polygon]],
 ) -> dict | None:
     """Return the unit feature whose polygon covers the longest portion of line."""
     if not line or not line.length:
         return None
     best_unit: dict | None = None
     best_length: float = -1.0
-    for unit in unit_features:
-        poly = _polygon_from_unit_feature(unit)
+    for unit, poly in unit_polygons:
         if not poly or poly.is_empty:
             continue
         try:
@@ -181,6 +335,8 @@ def calculate_feature_type(
     nf: "NetworkStagingRow",
     unit_features: list[dict],
     unit3d_features: list[dict],
+    unit_index: UnitIndex | None = None,
+    geom: RowGeometry | None = None,
 ) -> int:
     """
     Determine FeatureType for a network staging row from unit / 3D unit features.
@@ -188,44 +344,38 @@ def calculate_feature_type(
     - nf: staging row (NetworkStagingRow) with geojson LineString.
     - unit_features: list of IUnitFeature dicts (e.g. from get_unit_by_displayName(displayName)["features"]).
     - unit3d_features: list of I3DUnitFeature dicts (e.g. from get_3d_units_by_displayName(displayName)["features"]).
+    - unit_index: prebuilt UnitIndex of unit_features (build_unit_index). Pass it when typing many rows
+      of the same venue; if omitted, one is built from unit_features for this call.
+    - geom: pre-parsed RowGeometry of nf.geojson (build_row_geometry); parsed here if omitted.
 
     Returns FeatureType code (1 = walkway, 8 = escalator, 10 = lift, 11 = ramp, 12 = stairs, 13 = stairlift, etc.).
 
     Does not modify nf or its geometry. The staging geometry (geojson/shape, EPSG:2326) must remain unchanged;
     only computed properties (e.g. FeatureType) are updated when writing to the real table.
     """
-    # Allow dict or Pydantic model (e.g. model_dump())
-    nf_dict = nf.model_dump() if hasattr(nf, "model_dump") else nf
-    geojson_str = nf_dict.get("geojson") or ""
-    level_id = nf_dict.get("level_id")
+    # Allow dict or Pydantic model; read the two fields directly instead of dumping the whole row.
+    if isinstance(nf, dict):
+        level_id = nf.get("level_id")
+        geojson_str = nf.get("geojson") or ""
+    else:
+        level_id = nf.level_id
+        geojson_str = nf.geojson or ""
 
-    line = _line_from_geojson(geojson_str)
+    if geom is None:
+        geom = build_row_geometry(geojson_str)
+    # Staging line is EPSG:2326; unit features are EPSG:4326 — use the 4326 line for spatial ops.
+    line = geom.line_4326
     if not line or line.is_empty:
         return DEFAULT_FEATURE_TYPE
 
-    if line.has_z:
-        line = _force_2d(line)
-    # Staging line is EPSG:2326; unit features are EPSG:4326 — transform line to 4326 for spatial ops.
-    line = _transform_2326_to_4326(line)
+    if unit_index is None:
+        unit_index = build_unit_index(unit_features)
 
     # Only consider units on the same level as nf (do not intersect with units on other levels).
     # Unit and unit3d are linked by properties.UnitPolyID (same key in both).
-    if level_id is not None:
-        units_on_level = [
-            u for u in (unit_features or [])
-            if (u.get("properties") or {}).get("level_id") == level_id
-        ]
-    else:
-        units_on_level = unit_features or []
-
-    # Intersecting or containing units (unit_features are in EPSG:4326)
-    intersecting_units: list[dict] = []
-    for unit in units_on_level:
-        poly = _polygon_from_unit_feature(unit)
-        if not poly:
-            continue
-        if line.intersects(poly) or line.within(poly):
-            intersecting_units.append(unit)
+    # Intersecting or containing units (unit_features are in EPSG:4326); "within" implies "intersects".
+    intersecting = unit_index.intersecting(line, level_id)
+    intersecting_units: list[dict] = [unit for unit, _poly in intersecting]
 
     if not intersecting_units:
         return UNIT_FEATURE_TYPE_MAP.get("walkway", DEFAULT_FEATURE_TYPE)
@@ -239,14 +389,7 @@ def calculate_feature_type(
         return UNIT_FEATURE_TYPE_MAP.get(cat.lower(), DEFAULT_FEATURE_TYPE)
 
     # Multiple intersections
-    coords = []
-    try:
-        data = json.loads(geojson_str)
-        geom = data.get("geometry") or data
-        coords = geom.get("coordinates") or []
-    except Exception:
-        pass
-    z_values = [c[2] for c in coords if isinstance(c, (list, tuple)) and len(c) >= 3]
+    z_values = [c[2] for c in geom.coords if isinstance(c, (list, tuple)) and len(c) >= 3]
     if not _are_all_values_same(z_values):
         # Z differs: prefer stairs/escalator/elevator, then ramp, else walkway
         for unit in intersecting_units:
@@ -259,7 +402,7 @@ def calculate_feature_type(
         return DEFAULT_FEATURE_TYPE
 
     # Same Z: longest coverage unit
-    longest_unit = _find_max_coverage_polygon(line, intersecting_units)
+    longest_unit = _find_max_coverage_polygon(line, intersecting)
     if not longest_unit:
         return DEFAULT_FEATURE_TYPE
     stair_lift = _find_stair_lift_feature_type(longest_unit, unit3d_features or [])
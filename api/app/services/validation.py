@@ -1,14 +1,16 @@
 from sqlalchemy import text
 
-def validate_staging(session):
+def validate_staging(session, staging_table: str = "network_staging"):
     result = session.execute(
-        text("SELECT validate_network_staging();")
+        text("SELECT validate_network_staging(:staging_table);"),
+        {"staging_table": staging_table},
     )
     return result.scalar()
 
 
-def get_validation_errors(session):
+def get_validation_errors(session, staging_table: str = "network_staging"):
     result = session.execute(
-        text("SELECT * FROM network_staging_errors;")
+        text("SELECT inetworkid, error_type, error_message, created_at FROM network_staging_errors WHERE staging_table = :staging_table;"),
+        {"staging_table": staging_table},
     )
     return [dict(row) for row in result.mappings()]
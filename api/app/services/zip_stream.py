@@ -0,0 +1,71 @@
+# app/services/zip_stream.py
+
+import os
+import zipfile
+from typing import Iterator
+
+# Bytes read from a source file per deflate step; bounds the size of each emitted chunk.
+ZIP_STREAM_CHUNK_SIZE = 256 * 1024
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object: collects what ZipFile writes until it is drained."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """
+    Deflated ZIP archive produced incrementally, for streaming to a client.
+
+    Files are added one at a time and their compressed bytes are yielded as they are produced
+    (zipfile writes data descriptors on an unseekable stream), so memory stays at about one
+    chunk whatever the archive size. Call finish() once for the central directory.
+    Blocking (file reads + compression): run the generators in a worker thread.
+    """
+
+    def __init__(self, chunk_size: int = ZIP_STREAM_CHUNK_SIZE):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+        self._chunk_size = chunk_size
+
+    def add_file(self, path: str, arcname: str) -> Iterator[bytes]:
+        """Add one file to the archive, yielding the archive bytes produced along the way."""
+        zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        with open(path, "rb") as src, self._zip.open(zinfo, mode="w") as dest:
+            while True:
+                block = src.read(self._chunk_size)
+                if not block:
+                    break
+                dest.write(block)
+                data = self._sink.drain()
+                if data:
+                    yield data
+        data = self._sink.drain()
+        if data:
+            yield data
+
+    def add_dir(self, dir_path: str, arcname: str) -> Iterator[bytes]:
+        """Add every file under dir_path (sorted, flattened) as arcname/<file name>."""
+        for root, _dirs, files in os.walk(dir_path):
+            for file in sorted(files):
+                yield from self.add_file(os.path.join(root, file), os.path.join(arcname, file))
+
+    def finish(self) -> bytes:
+        """Close the archive and return its remaining bytes (central directory)."""
+        self._zip.close()
+        return self._sink.drain()
@@ -0,0 +1,125 @@
+"""Bulk upsert of enriched rows into indoor_network (COPY + INSERT ... ON CONFLICT)."""
+
+import pytest
+import shapely
+from shapely.geometry import LineString
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.schema.network import NetworkStagingRow
+from app.services.pedestrian_service import PedrouteidConflictError, insert_network_rows_into_indoor_network
+from app.services.utils import format_copy_value
+
+
+def test_format_copy_value():
+    assert format_copy_value(None) == "\\N"
+    assert format_copy_value(True) == "t" and format_copy_value(False) == "f"
+    assert format_copy_value(1009790001) == "1009790001"
+    assert format_copy_value("a\tb\nc\\d\re") == "a\\tb\\nc\\\\d\\re"
+
+
+def _row(i: int, **changes) -> NetworkStagingRow:
+    line = shapely.set_srid(LineString([(835000 + i, 815000, 3.3), (835010 + i, 815000, 3.3)]), 2326)
+    values = {
+        "displayname": "TEST_upsert venue",
+        "inetworkid": f"test-upsert-{i}",
+        "highway": "footway",
+        "oneway": "no",
+        "emergency": "yes",
+        "wheelchair": "yes",
+        "flpolyid": "FP-test",
+        "crtdt": "28/11/2025",
+        "lstamddt": "28/11/2025 09:21:41",
+        "restricted": "N",
+        "shape": shapely.to_wkb(line, hex=True, include_srid=True),
+        "geojson": "{}",
+        "level_id": "L-test",
+        "feattype": 1,
+        "floorid": 1009790001,
+        "location": 2,
+        "gradient": 0.0,
+        "wc_access": 1,
+        "wc_barrier": 2,
+        "wx_proof": 1,
+        "direction": 0,
+        "bldgid_1": 5,
+        "aliasnamen": None,
+        "aliasnamtc": "門",
+    }
+    return NetworkStagingRow.model_validate({**values, **changes})
+
+
+def test_upsert_counts(db_connection):
+    session = Session(bind=db_connection)
+
+    counts = insert_network_rows_into_indoor_network(session, "TEST_upsert venue", [_row(i) for i in range(3)])
+    assert counts == {"inserted": 3, "updated": 0, "unchanged": 0}
+    ids = dict(db_connection.execute(text(
+        "SELECT inetworkid, pedrouteid FROM indoor_network WHERE inetworkid LIKE 'test-upsert-%'"
+    )).all())
+    assert len(ids) == 3
+
+    # Same rows again: nothing is rewritten.
+    counts = insert_network_rows_into_indoor_network(session, "TEST_upsert venue", [_row(i) for i in range(3)])
+    assert counts == {"inserted": 0, "updated": 0, "unchanged": 3}
+
+    rows = [_row(0), _row(1, aliasnamen="Exit", feattype=8), _row(2), _row(3), _row(4, inetworkid="")]
+    counts = insert_network_rows_into_indoor_network(session, "TEST_upsert venue", rows)
+    assert counts == {"inserted": 1, "updated": 1, "unchanged": 2}  # no inetworkid: skipped
+
+    stored = {
+        inetworkid: (pedrouteid, aliasnamen, feattype)
+        for inetworkid, pedrouteid, aliasnamen, feattype in db_connection.execute(text(
+            "SELECT inetworkid, pedrouteid, aliasnamen, feattype FROM indoor_network WHERE inetworkid LIKE 'test-upsert-%'"
+        ))
+    }
+    assert stored["test-upsert-1"] == (ids["test-upsert-1"], "Exit", 8)  # updated in place, same pedrouteid
+    assert stored["test-upsert-0"] == (ids["test-upsert-0"], "", 1)  # NULL alias written as ''
+    assert "test-upsert-3" in stored and len(stored) == 4
+
+
+def _next_free_pedrouteid(db_connection) -> int:
+    return db_connection.execute(text("""
+        SELECT GREATEST(
+            (SELECT COALESCE(MAX(pedrouteid), 0) FROM indoor_network),
+            COALESCE(pg_sequence_last_value(pg_get_serial_sequence('indoor_network', 'pedrouteid')::regclass), 0)
+        ) + 1
+    """)).scalar()
+
+
+def test_upsert_explicit_then_generated_ids(db_connection):
+    session = Session(bind=db_connection)
+    first_id = _next_free_pedrouteid(db_connection)
+
+    # Explicit ids ahead of the sequence, then rows that take theirs from nextval().
+    explicit = [_row(i, pedrouteid=first_id + i) for i in range(2)]
+    assert insert_network_rows_into_indoor_network(session, "TEST_upsert venue", explicit)["inserted"] == 2
+    generated = [_row(i) for i in range(2, 5)]
+    assert insert_network_rows_into_indoor_network(session, "TEST_upsert venue", generated)["inserted"] == 3
+
+    ids = dict(db_connection.execute(text(
+        "SELECT inetworkid, pedrouteid FROM indoor_network WHERE inetworkid LIKE 'test-upsert-%'"
+    )).all())
+    assert ids["test-upsert-0"] == first_id and ids["test-upsert-1"] == first_id + 1
+    assert len(set(ids.values())) == 5 and min(ids[f"test-upsert-{i}"] for i in range(2, 5)) > first_id + 1
+
+
+def test_upsert_rejects_pedrouteid_of_another_inetworkid(db_connection):
+    session = Session(bind=db_connection)
+    owner_id = _next_free_pedrouteid(db_connection)
+    insert_network_rows_into_indoor_network(session, "TEST_upsert venue", [_row(0, pedrouteid=owner_id)])
+
+    with pytest.raises(PedrouteidConflictError) as raised:
+        insert_network_rows_into_indoor_network(session, "TEST_upsert venue", [
+            _row(1, pedrouteid=owner_id),
+            _row(2, pedrouteid=owner_id + 1),
+            _row(3, pedrouteid=owner_id + 1),
+        ])
+    assert [(e["inetworkid"], e["error_type"]) for e in raised.value.errors] == [
+        ("test-upsert-1", "pedrouteid_conflict"), ("test-upsert-3", "pedrouteid_conflict"),
+    ]
+    # Nothing was written, and the transaction is still usable.
+    assert db_connection.execute(text(
+        "SELECT COUNT(*) FROM indoor_network WHERE inetworkid LIKE 'test-upsert-%'"
+    )).scalar() == 1
+    assert insert_network_rows_into_indoor_network(session, "TEST_upsert venue", [_row(1)])["inserted"] == 1
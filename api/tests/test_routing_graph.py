@@ -0,0 +1,146 @@
+"""VenueGraph least-cost paths against a plain Dijkstra over the same segments."""
+
+import heapq
+import math
+import random
+
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import LineString
+
+from app.services.routing_service import PROFILE_EMERGENCY, PROFILE_WALK, PROFILE_WHEELCHAIR, VenueGraph
+
+
+def _venue_rows(seed: int, size: int = 6) -> list[tuple]:
+    """
+    indoor_network-like rows (build_venue_graph's columns) of a random two-level grid:
+    segments between neighbouring grid points, some one-way, some with barriers or lifts
+    closed to emergency routing, shape_len sometimes longer than the straight line.
+    """
+    rng = random.Random(seed)
+    rows = []
+
+    def add(a, b, level_id):
+        if rng.random() < 0.1:
+            return
+        if rng.random() < 0.5:
+            a, b = b, a
+        pedrouteid = len(rows) + 1
+        line = LineString([a, ((a[0] + b[0]) / 2 + rng.uniform(-0.3, 0.3), (a[1] + b[1]) / 2, (a[2] + b[2]) / 2), b])
+        rows.append((
+            pedrouteid,
+            f"N{pedrouteid}",
+            shapely.to_wkb(line),
+            rng.choice([0] * 8 + [1, -1]),
+            rng.choice([1] + [2] * 7),
+            rng.choice(["yes"] * 7 + ["no"]),
+            rng.choice([1, 1, 8]),
+            line.length * rng.choice([1.0, 1.0, 1.5]) if rng.random() < 0.8 else None,
+            level_id,
+        ))
+
+    for z, level_id in ((0.0, "L0"), (4.0, "L1")):
+        for i in range(size):
+            for j in range(size):
+                point = (835000.0 + 10 * i, 815000.0 + 10 * j, z)
+                if i + 1 < size:
+                    add(point, (point[0] + 10, point[1], z), level_id)
+                if j + 1 < size:
+                    add(point, (point[0], point[1] + 10, z), level_id)
+    for i, j in ((0, 0), (size - 1, size - 1), (2, 3)):
+        add((835000.0 + 10 * i, 815000.0 + 10 * j, 0.0), (835000.0 + 10 * i, 815000.0 + 10 * j, 4.0), "L0")
+    return rows
+
+
+def _reference_costs(rows: list[tuple], source: tuple, profile: int) -> dict[tuple, float]:
+    """Dijkstra from source over the rows' segments, nodes keyed by endpoint coordinates."""
+    adjacency: dict[tuple, list[tuple[tuple, float]]] = {}
+    for _, _, wkb, direction, wc_barrier, emergency, _, shape_len, _ in rows:
+        coords = [tuple(round(c, 6) for c in xyz) for xyz in shapely.from_wkb(wkb).coords]
+        a, b = coords[0], coords[-1]
+        allowed = profile & PROFILE_WALK
+        allowed |= profile & PROFILE_WHEELCHAIR if wc_barrier != 1 else 0
+        allowed |= profile & PROFILE_EMERGENCY if emergency != "no" else 0
+        if not allowed:
+            continue
+        cost = max(shape_len or 0.0, math.dist(a, b))
+        if direction >= 0:
+            adjacency.setdefault(a, []).append((b, cost))
+        if direction <= 0:
+            adjacency.setdefault(b, []).append((a, cost))
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        cost, u = heapq.heappop(heap)
+        if cost > dist[u]:
+            continue
+        for v, arc_cost in adjacency.get(u, []):
+            if cost + arc_cost < dist.get(v, math.inf):
+                dist[v] = cost + arc_cost
+                heapq.heappush(heap, (dist[v], v))
+    return dist
+
+
+def _node_key(graph: VenueGraph, node: int) -> tuple:
+    return tuple(round(c, 6) for c in graph.node_xyz[node].tolist())
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("profile", [PROFILE_WALK, PROFILE_WHEELCHAIR, PROFILE_EMERGENCY])
+def test_shortest_path_matches_reference(seed, profile):
+    rows = _venue_rows(seed)
+    graph = VenueGraph("TEST venue", "v1", rows)
+    rng = random.Random(seed)
+    for _ in range(10):
+        source, target = rng.randrange(graph.n_nodes), rng.randrange(graph.n_nodes)
+        expected = _reference_costs(rows, _node_key(graph, source), profile).get(_node_key(graph, target))
+        for astar in (True, False):
+            found = graph.shortest_path(source, target, profile, astar=astar)
+            if expected is None:
+                assert found is None
+                continue
+            cost, arcs = found
+            assert cost == pytest.approx(expected)
+            # The arcs form a connected walk source -> target allowed for the profile.
+            node = source
+            for arc in arcs:
+                assert graph.arc_src[arc] == node and graph.arc_mask[arc] & profile
+                node = graph.arc_dst[arc]
+            assert node == target
+            assert sum(graph.arc_cost[arc] for arc in arcs) == pytest.approx(cost)
+
+
+def test_graph_structure():
+    rows = _venue_rows(0)
+    graph = VenueGraph("TEST venue", "v1", rows)
+    assert graph.n_edges == len(rows)
+    assert graph.indptr[-1] == len(graph.arc_src)
+    assert all(graph.indptr[u] <= graph.indptr[u + 1] for u in range(graph.n_nodes))
+    node, distance = graph.nearest_node(835000.4, 815000.2, "L1")
+    assert _node_key(graph, node) == (835000.0, 815000.0, 4.0) and distance == pytest.approx(math.hypot(0.4, 0.2))
+    assert VenueGraph("TEST empty", "v1", []).n_nodes == 0
+
+
+@pytest.mark.parametrize("profile", [PROFILE_WALK, PROFILE_WHEELCHAIR])
+def test_travel_costs_match_shortest_path(profile):
+    from app.services.travel_matrix import compute_travel_costs
+
+    rows = _venue_rows(7)
+    # Parallel segments: the matrix must keep the cheaper one, not their sum.
+    rows.append((999, "N999", rows[0][2], 0, 2, "yes", 1, 1e-3, rows[0][8]))
+    graph = VenueGraph("TEST venue", "v1", rows)
+    rng = random.Random(7)
+    nodes = np.array([rng.randrange(graph.n_nodes) for _ in range(12)] + [-1, 3, 3])
+    costs = compute_travel_costs(graph, nodes, profile)
+    assert costs.shape == (len(nodes), len(nodes)) and costs.dtype == np.float32
+    for i, source in enumerate(nodes):
+        for j, target in enumerate(nodes):
+            if source < 0 or target < 0:
+                assert costs[i, j] == np.inf
+                continue
+            found = graph.shortest_path(int(source), int(target), profile, astar=False)
+            if found is None:
+                assert costs[i, j] == np.inf
+            else:
+                assert costs[i, j] == pytest.approx(found[0], rel=1e-6)
@@ -0,0 +1,55 @@
+"""build_row_geometries (batched reprojection) must match the per-row build_row_geometry."""
+
+import json
+
+import numpy as np
+import shapely
+
+from app.services.utils import build_row_geometries, build_row_geometry
+
+
+def _line(coords: list) -> str:
+    return json.dumps({"type": "LineString", "coordinates": coords})
+
+
+GEOJSONS = [
+    _line([[835000.0, 815000.0, 3.3], [835010.5, 815002.25, 3.3], [835020.0, 815000.0, 8.3]]),
+    _line([[836000.0, 816000.0], [836005.0, 816005.0]]),  # 2D
+    _line([[835100.0, 815100.0, 0.0], [835100.0, 815100.0, 5.0]]),  # vertical (lift)
+    json.dumps({"type": "Feature", "properties": {}, "geometry": json.loads(_line([[835000.0, 815000.0, 1.0], [835001.0, 815001.0, 1.0]]))}),
+    json.dumps({"type": "Point", "coordinates": [835000.0, 815000.0]}),  # not a line: fallback
+    _line([]),  # empty
+    "not json",
+    None,
+]
+
+
+def _assert_same(batched, single) -> None:
+    assert len(batched.coords) == len(single.coords)
+    if single.coords:
+        np.testing.assert_allclose(np.asarray(batched.coords), np.asarray(single.coords))
+    for attr in ("line_2326", "line_4326"):
+        a, b = getattr(batched, attr), getattr(single, attr)
+        if b is None:
+            assert a is None
+        else:
+            assert shapely.get_type_id(a) == shapely.get_type_id(b)
+            np.testing.assert_allclose(shapely.get_coordinates(a), shapely.get_coordinates(b), rtol=0, atol=1e-9)
+
+
+def test_batched_geometries_match_per_row():
+    batched = build_row_geometries(GEOJSONS)
+    assert len(batched) == len(GEOJSONS)
+    for geojson, geom in zip(GEOJSONS, batched):
+        _assert_same(geom, build_row_geometry(geojson))
+
+
+def test_reprojected_into_wgs84():
+    geom = build_row_geometries([GEOJSONS[0]])[0]
+    lon, lat = shapely.get_coordinates(geom.line_4326)[0]
+    assert 113.8 < lon < 114.5 and 22.1 < lat < 22.6
+    assert not shapely.has_z(geom.line_2326) and not shapely.has_z(geom.line_4326)
+
+
+def test_empty_input():
+    assert build_row_geometries([]) == []
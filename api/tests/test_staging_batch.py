@@ -0,0 +1,101 @@
+"""NetworkStagingBatch (column-wise checks) must give exactly the per-row model_validate results."""
+
+import math
+import random
+
+from app.schema.network import NetworkStagingRow
+from app.services.staging_batch import _FIELD_RULES, NetworkStagingBatch
+
+# Values outside the fast path: wrong types, out-of-range numbers, coercible strings, NaN.
+ODD_VALUES = [None, "", "3", "yes", "maybe", 0, -1, 2.5, 1.0, 1e10, True, float("nan"), 10_000_000_000]
+
+
+def _valid_value(rule, rng: random.Random):
+    if rule.literal is not None:
+        return rng.choice(sorted(rule.literal, key=repr))
+    if rule.base is int:
+        if rule.ge is not None:
+            value = rng.randint(rule.ge, rule.le)
+            return float(value) if rng.random() < 0.2 else value  # DBF numerics arrive as floats
+        return rng.randint(0, 50)
+    if rule.base is float:
+        return rng.choice([0.0, 1, 0.25, math.pi])
+    if rule.base is bool:
+        return rng.random() < 0.5
+    return rng.choice(["a", "HK_1_Hong Kong City Hall", "28/11/2025 09:21:41"])
+
+
+def _dataset(rng: random.Random, n_rows: int, odd_rate: float) -> tuple[list[str], list[tuple]]:
+    rules = [rule for rule in _FIELD_RULES if rng.random() < 0.95 or rule.required]  # some columns absent
+    columns = [rule.name for rule in rules] + ["staging_fid"]  # plus an unmodelled column
+    rows = []
+    for i in range(n_rows):
+        row = []
+        for rule in rules:
+            if rng.random() < odd_rate:
+                row.append(rng.choice(ODD_VALUES))
+            elif rule.optional and rng.random() < 0.1:
+                row.append(None)
+            else:
+                row.append(_valid_value(rule, rng))
+        rows.append(tuple(row) + (i,))
+    return columns, rows
+
+
+def _per_row(columns: list[str], rows: list[tuple]):
+    """The former _read_staging_rows: dict per row, NULL crtby / lstamdby dropped, model_validate."""
+    result = []
+    for i, values in enumerate(rows):
+        row = dict(zip(columns, values))
+        for name in ("crtby", "lstamdby"):
+            if row.get(name) is None:
+                row.pop(name, None)
+        try:
+            result.append(NetworkStagingRow.model_validate(row))
+        except Exception as e:
+            return [], (i, row, e)
+    return result, None
+
+
+def _typed_dump(row: NetworkStagingRow) -> list:
+    # == alone would not tell 1 from 1.0 or True.
+    return [(name, type(value), repr(value)) for name, value in row.model_dump().items()]
+
+
+def test_batch_matches_per_row_validation():
+    rng = random.Random(13)
+    failures = fast = 0
+    for _ in range(300):
+        columns, rows = _dataset(rng, rng.randint(0, 25), odd_rate=rng.choice([0.0, 0.0, 0.005, 0.02]))
+        batch = NetworkStagingBatch(columns, rows)
+        rows_batch, failure_batch = batch.to_rows()
+        rows_ref, failure_ref = _per_row(columns, rows)
+
+        if failure_ref is None:
+            assert failure_batch is None
+            assert [_typed_dump(r) for r in rows_batch] == [_typed_dump(r) for r in rows_ref]
+            fast += batch.fast_path_count
+        else:
+            failures += 1
+            i, row, error = failure_batch
+            assert (i, row) == failure_ref[:2]
+            assert str(error) == str(failure_ref[2])
+    # Both paths were exercised.
+    assert failures > 20 and fast > 500
+
+
+def test_fast_path_rows_behave_like_validated_rows():
+    rng = random.Random(5)
+    columns, rows = _dataset(rng, 20, odd_rate=0.0)
+    # NULL crtby / lstamdby take the model default on both paths.
+    keep = [i for i, name in enumerate(columns) if name not in ("crtby", "lstamdby")]
+    columns = [columns[i] for i in keep] + ["crtby", "lstamdby"]
+    rows = [tuple(r[i] for i in keep) + (None, None) for r in rows]
+    batch_rows, failure = NetworkStagingBatch(columns, rows).to_rows()
+    ref_rows, _ = _per_row(columns, rows)
+    assert failure is None
+    for fast_row, ref_row in zip(batch_rows, ref_rows):
+        assert fast_row.crtby == "03" and fast_row.lstamdby == "03"
+        assert fast_row == ref_row
+        fast_row.feattype = 8  # attribute assignment works as on validated rows
+        assert fast_row.model_dump()["feattype"] == 8
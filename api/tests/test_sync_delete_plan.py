@@ -0,0 +1,43 @@
+"""The sync deletes must plan as anti-joins, not as a NOT IN SubPlan evaluated per target row."""
+
+from sqlalchemy import text
+
+from app.services.network_services import sync_delete_sql
+from app.services.pedestrian_service import delete_missing_sql
+
+STAGING_ROWS = 20000
+
+
+def _plan(conn, sql: str, params: dict | None = None) -> str:
+    rows = conn.execute(text(f"EXPLAIN {sql}"), params or {}).scalars().all()
+    return "\n".join(rows)
+
+
+def _assert_anti_join(plan: str) -> None:
+    assert "Anti Join" in plan, plan
+    assert "SubPlan" not in plan, plan
+
+
+def test_indoor_network_sync_delete_is_anti_join(db_connection):
+    staging_table = "network_staging_plan_test"
+    db_connection.execute(text(f'CREATE TEMP TABLE "{staging_table}" (inetworkid text)'))
+    db_connection.execute(
+        text(f'INSERT INTO "{staging_table}" SELECT \'n\' || g FROM generate_series(1, {STAGING_ROWS}) g')
+    )
+    # As _load_staging_table does after the load.
+    db_connection.execute(text(f'CREATE INDEX ON "{staging_table}" (inetworkid)'))
+    db_connection.execute(text(f'ANALYZE "{staging_table}"'))
+
+    _assert_anti_join(_plan(db_connection, sync_delete_sql(staging_table), {"vid": "venue"}))
+
+
+def test_pedestrian_network_delete_is_anti_join(db_connection):
+    staging_table = "pedestrian_staging_plan_test"
+    db_connection.execute(text(f"CREATE TEMP TABLE {staging_table} (pedestrianrouteid integer)"))
+    db_connection.execute(
+        text(f"INSERT INTO {staging_table} SELECT g FROM generate_series(1, {STAGING_ROWS}) g")
+    )
+    db_connection.execute(text(f"CREATE INDEX ON {staging_table} (pedestrianrouteid)"))
+    db_connection.execute(text(f"ANALYZE {staging_table}"))
+
+    _assert_anti_join(_plan(db_connection, delete_missing_sql(staging_table, "PedestrianRouteID")))
@@ -0,0 +1,79 @@
+"""Staging IMDF venue features and merging them into venue (set-based upsert)."""
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.imdf_service import _create_venue_import_table, _merge_venue_import, _stage_venue_rows, _venue_rows
+
+
+def _polygon(x: float) -> dict:
+    return {"type": "Polygon", "coordinates": [[[x, 22.3], [x + 0.001, 22.3], [x + 0.001, 22.301], [x, 22.3]]]}
+
+
+def _doc(**venue_properties) -> dict:
+    return {
+        "region": "KLNE",
+        "displayName": "TEST_venue_import",
+        "buildingType": ["EDB", "LCSD"],
+        "features": [
+            {
+                "id": "TEST-venue-1",
+                "feature_type": "venue",
+                "geometry": _polygon(114.17),
+                "properties": {
+                    "category": "school",
+                    "restriction": None,
+                    "name": {"en": "Test School", "zh": "測試學校"},
+                    "alt_name": {"en": "TS"},
+                    "hours": "Mo-Fr 08:00-17:00",
+                    "website": "https://example.org",
+                    "phone": "+852 0000 0000",
+                    "address_id": "TEST-address-1",
+                    "OrganizationID": "TEST-org",
+                    "display_point": {"type": "Point", "coordinates": [114.1705, 22.3005]},
+                    **venue_properties,
+                },
+            },
+            {"id": "TEST-venue-unit", "feature_type": "unit", "geometry": _polygon(114.18), "properties": {}},
+        ],
+    }
+
+
+def _merge(session: Session, *docs: dict) -> dict[str, int]:
+    _create_venue_import_table(session)
+    rows = [row for doc in docs for row in _venue_rows(doc)]
+    for seq, row in enumerate(rows):
+        row["seq"] = seq
+    _stage_venue_rows(session, rows)
+    counts = _merge_venue_import(session)
+    session.execute(text("DROP TABLE venue_import"))
+    return counts
+
+
+def test_merge_venue_import(db_connection):
+    session = Session(bind=db_connection)
+    second = _doc()
+    second["buildingType"] = ""
+    second["features"][0] = {**second["features"][0], "id": "TEST-venue-2", "properties": {"name": "Plain", "address_id": "TEST-address-2"}}
+
+    assert _merge(session, _doc(), second) == {"inserted": 2, "updated": 0, "unchanged": 0}
+    stored = {
+        row.id: row
+        for row in db_connection.execute(text("""
+            SELECT id, category, restriction, name_en, name_zh, alt_name, hours, address_id, organization_id,
+                building_type, region, displayname, ST_SRID(shape) AS srid, display_point IS NOT NULL AS has_point
+            FROM venue WHERE id LIKE 'TEST-venue-%'
+        """))
+    }
+    assert sorted(stored) == ["TEST-venue-1", "TEST-venue-2"]
+    first = stored["TEST-venue-1"]
+    assert (first.name_en, first.name_zh, first.alt_name) == ("Test School", "測試學校", '{"en": "TS"}')
+    assert first.building_type == ["EDB", "LCSD"] and first.restriction is None
+    assert (first.region, first.displayname, first.organization_id) == ("KLNE", "TEST_venue_import", "TEST-org")
+    assert first.srid == 2326 and first.has_point
+    assert stored["TEST-venue-2"].building_type == [] and not stored["TEST-venue-2"].has_point
+
+    # Unchanged venues are not rewritten; a changed one is, and a repeated id keeps its last occurrence.
+    assert _merge(session, _doc(), second) == {"inserted": 0, "updated": 0, "unchanged": 2}
+    assert _merge(session, _doc(hours="24/7"), _doc(hours="closed")) == {"inserted": 0, "updated": 1, "unchanged": 0}
+    assert db_connection.execute(text("SELECT hours FROM venue WHERE id = 'TEST-venue-1'")).scalar() == "closed"
@@ -0,0 +1,37 @@
+"""ZipStream output is a valid archive with the files' exact contents."""
+
+import io
+import os
+import zipfile
+
+from app.services.zip_stream import ZipStream
+
+
+def test_zip_stream_roundtrip(tmp_path):
+    files = {
+        "a/network.geojson": os.urandom(300_000) + b'{"type": "FeatureCollection"}' * 20_000,
+        "a/sub/notes.txt": "門 exit\n".encode() * 1000,
+        "a/empty.json": b"",
+    }
+    for name, data in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+    (tmp_path / "single.bin").write_bytes(b"x" * 70_000)
+
+    stream = ZipStream(chunk_size=64 * 1024)
+    chunks = list(stream.add_dir(str(tmp_path / "a"), "export"))
+    chunks += list(stream.add_file(str(tmp_path / "single.bin"), "single.bin"))
+    chunks.append(stream.finish())
+
+    assert all(len(chunk) <= 2 * 64 * 1024 for chunk in chunks)  # bounded by the chunk size
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == [
+            "export/empty.json", "export/network.geojson", "export/notes.txt", "single.bin",
+        ]
+        assert archive.read("export/network.geojson") == files["a/network.geojson"]
+        assert archive.read("export/notes.txt") == files["a/sub/notes.txt"]
+        assert archive.read("export/empty.json") == b""
+        assert archive.read("single.bin") == b"x" * 70_000
+        assert all(info.compress_type == zipfile.ZIP_DEFLATED for info in archive.infolist())